@@ -4,6 +4,7 @@ import hashlib
 from requests import request
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 
 from app.dependencies import Settings
 from app import crud, utils
@@ -12,6 +13,12 @@ from app.dependencies import get_db, get_settings
 
 router = APIRouter(prefix="/api", tags=["api"])
 
+# Returned with a 409 when an assessment tracker entry was updated by
+# another request between reading and updating it
+conflict_detail = (
+    "Assessment tracker entry was updated concurrently. Please retry."
+)
+
 
 @router.post("/init")
 def init(
@@ -59,6 +66,8 @@ def init(
         raise HTTPException(status_code=500, detail=str(e))
 
     # Use the bot to set up the assessment on GitHub
+    # The bot provisions the repo in the background and reports back
+    # to `/api/init/complete` when it is done
     try:
         print("setting up assessment")
         assessment = crud.get_assessment_by_id(
@@ -74,6 +83,8 @@ def init(
             "template_repo": assessment.template_repo,
             "latest_release": assessment.latest_release,
             "review_required": assessment.review_required == 1,
+            "user_id": user.id,
+            "assessment_id": assessment.id,
         }
         print("Sending request to bot init")
         response = request(
@@ -87,31 +98,112 @@ def init(
         print(e)
         raise HTTPException(status_code=500, detail=str(e))
 
-    # Update the assessment tracker with the GitHub URL
+    # Record the provisioning job in the assessment tracker log
     try:
-        print("Updating assessment tracker")
-        crud.update_assessment_tracker_entry(
+        assessment_tracker_entry = crud.get_assessment_tracker_entry(
+            db=db, user_id=user.id, assessment_id=assessment.id
+        )
+        crud.update_assessment_log(
             db=db,
-            user_id=user.id,
-            assessment_id=assessment.id,
-            github_url=response.json()["github_url"],
-            status="Initiated",
-            commit=response.json()["latest_commit"],
+            entry_id=assessment_tracker_entry.id,
+            latest_commit=assessment_tracker_entry.latest_commit,
+            update_logs={"init_job": response.json()["job_id"]},
         )
-        print("Assessment tracker updated")
     except Exception as e:  # pragma: no cover
         print(e)
         raise HTTPException(status_code=500, detail=str(e))
 
-    crud.get_assessment_tracker_entry(
-        db=db, user_id=user.id, assessment_id=assessment.id
-    )
-
     # bool signifies if the assessment tracker entry was initialized as well as that the
     # member is valid
     return True
 
 
+@router.post("/init/complete")
+def init_complete(
+    *,
+    db: Session = Depends(get_db),
+    init_complete_request: schemas.InitCompleteRequest,
+):
+    """
+    Completion callback for the bot's repo provisioning job. Moves the
+    assessment tracker entry from "Pre-assessment" to "Initiated".
+
+    :param db: Generator for Session of database
+    :param init_complete_request: Pydantic request model schema used by
+    `/api/init/complete` endpoint
+
+    :returns: Json indicating if the assessment was initiated
+
+    The callback is retried by the bot, so completing again with the same
+    repo and commit is accepted without changes.
+
+    :raises: HTTPException 422 if:
+        - The request is not valid (a complete job without its repo and
+          commit)
+        - Assessment tracker entry does not exist
+        - Assessment tracker entry is not in the "Pre-assessment" state
+
+    :raises: HTTPException 409 if the entry was updated concurrently
+    """
+    try:
+        assessment_tracker_entry = crud.get_assessment_tracker_entry(
+            db=db,
+            user_id=init_complete_request.user_id,
+            assessment_id=init_complete_request.assessment_id,
+        )
+        if (
+            init_complete_request.status == "complete"
+            and assessment_tracker_entry.status == crud.INITIATED
+            and assessment_tracker_entry.latest_commit
+            == init_complete_request.latest_commit
+            and init_complete_request.github_url.split("/")[3:5]
+            == [
+                assessment_tracker_entry.repo_owner,
+                assessment_tracker_entry.repo_name,
+            ]
+        ):
+            # Retried callback, already applied
+            return {"Assessment Initiated": True}
+        if not crud.can_transition(
+            assessment_tracker_entry.status, crud.INITIATED
+        ):
+            raise ValueError("Assessment already initiated.")
+        if init_complete_request.status != "complete":
+            # Keep the entry in "Pre-assessment" and record the failure
+            crud.update_assessment_log(
+                db=db,
+                entry_id=assessment_tracker_entry.id,
+                latest_commit=assessment_tracker_entry.latest_commit,
+                update_logs={
+                    "init_job": init_complete_request.job_id,
+                    "init_failed": init_complete_request.detail,
+                },
+            )
+            return {"Assessment Initiated": False}
+        print("Updating assessment tracker")
+        crud.update_assessment_tracker_entry(
+            db=db,
+            user_id=init_complete_request.user_id,
+            assessment_id=init_complete_request.assessment_id,
+            github_url=init_complete_request.github_url,
+            status="Initiated",
+            commit=init_complete_request.latest_commit,
+        )
+        print("Assessment tracker updated")
+    except StaleDataError as e:
+        print(str(e))
+        db.rollback()
+        raise HTTPException(status_code=409, detail=conflict_detail)
+    except ValueError as e:
+        print(str(e))
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:  # pragma: no cover
+        print(str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"Assessment Initiated": True}
+
+
 @router.get("/view")
 def view(*, db: Session = Depends(get_db), view_request: schemas.ViewRequest):
     """
@@ -139,6 +231,7 @@ def view(*, db: Session = Depends(get_db), view_request: schemas.ViewRequest):
             db=db,
             user_id=user.id,
             assessment_id=assessment.id,
+            with_log=True,
         )
     except ValueError as e:
         print(str(e))
@@ -147,7 +240,11 @@ def view(*, db: Session = Depends(get_db), view_request: schemas.ViewRequest):
         print(str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
-    return assessment_tracker_entry.__dict__
+    # The log is served from the events of the entry
+    entry = dict(assessment_tracker_entry.__dict__)
+    entry.pop("events", None)
+    entry["log"] = assessment_tracker_entry.log
+    return entry
 
 
 @router.patch("/update")
@@ -161,12 +258,19 @@ def update(
     :param db: Generator for Session of database
     :param update_request: Pydantic request model schema used by `/api/update` endpoint
 
+    A status change must be an allowed transition, unless `force` is set:
+    this admin override sets any known status (e.g. to reset an entry to
+    "Initiated") and is recorded in the log.
+
     :returns: Json object indicating if the assessment tracker entry was updated
 
     :raises: HTTPException 422 if:
         - User does not exist
         - Assessment does not exist
         - Assessment tracker entry does not exist
+        - The status transition is not allowed
+
+    :raises: HTTPException 409 if the entry was updated concurrently
     """
     try:
 
@@ -186,8 +290,13 @@ def update(
             entry_id=assessment_tracker_entry.id,
             latest_commit=update_request.latest_commit,
             status=update_request.status,
+            force=update_request.force,
             update_logs=copy.deepcopy(update_request.log),
         )
+    except StaleDataError as e:
+        print(str(e))
+        db.rollback()
+        raise HTTPException(status_code=409, detail=conflict_detail)
     except ValueError as e:
         print(str(e))
         raise HTTPException(status_code=422, detail=str(e))
@@ -253,28 +362,44 @@ def check(
     :returns: Json object indicating if the assessment tracker entry
     was checked
 
+    An entry under review whose checks fail (on a new commit) is sent back
+    to "Initiated", so a review is requested again once they pass.
+
     :raises: HTTPException 422 if:
         - User does not exist
         - Assessment does not exist
         - Assessment tracker entry does not exist
+
+    :raises: HTTPException 409 if the entry was updated concurrently
     """
     try:
         assessment_tracker_entry = crud.get_assessment_tracker_entry_by_commit(
             db=db, commit=check_request.latest_commit
         )
-        if assessment_tracker_entry.status == "Approved":
+        if assessment_tracker_entry.status == crud.APPROVED:
             raise ValueError("Assessment already approved")
         update_logs = {
             "timestamp": str(datetime.utcnow()),
             "checks_passed": check_request.passed,
             "commit": check_request.latest_commit,
         }
+        status = None
+        if (
+            not check_request.passed
+            and assessment_tracker_entry.status == crud.UNDER_REVIEW
+        ):
+            status = crud.INITIATED
         crud.update_assessment_log(
             db=db,
             entry_id=assessment_tracker_entry.id,
             latest_commit=check_request.latest_commit,
+            status=status,
             update_logs=copy.deepcopy(update_logs),
         )
+    except StaleDataError as e:
+        print(str(e))
+        db.rollback()
+        raise HTTPException(status_code=409, detail=conflict_detail)
     except ValueError as e:
         print(str(e))
         raise HTTPException(status_code=422, detail=str(e))
@@ -310,12 +435,16 @@ def review(
         - Assessment tracker entry is already assigned to a reviewer
         - This assessment is not passing automated checks
         - The commit is not found in the assessment tracker entry table
+
+    :raises: HTTPException 409 if the entry was updated concurrently
     """
     try:
         assessment_tracker_entry = crud.get_assessment_tracker_entry_by_commit(
             db=db, commit=review_request.latest_commit
         )
-        if assessment_tracker_entry.status != "Initiated":
+        if not crud.can_transition(
+            assessment_tracker_entry.status, crud.UNDER_REVIEW
+        ):
             raise ValueError(
                 "Assessment tracker entry already under review or approved"
             )
@@ -339,6 +468,10 @@ def review(
             assessment_tracker_entry=assessment_tracker_entry,
             reviewer_info=reviewer_info,
         )
+    except StaleDataError as e:
+        print(str(e))
+        db.rollback()
+        raise HTTPException(status_code=409, detail=conflict_detail)
     except ValueError as e:
         print(str(e))
         raise HTTPException(status_code=422, detail=str(e))
@@ -354,11 +487,10 @@ def approve(
     *,
     db: Session = Depends(get_db),
     approve_request: schemas.ApproveRequest,
-    settings: Settings = Depends(get_settings),
 ):
     """
     Approve the assessment tracker entry for the
-    given user and assessment.
+    given user and assessment. The badge is issued in the background.
 
     :param db: Generator for Session of database
     :param approve_request: Pydantic request model schema used
@@ -375,13 +507,17 @@ def approve(
         - Assessment tracker entry is not assigned to a reviewer
         - Assessment tracker entry is not passing automated checks
         - The commit is not found in the assessment tracker entry table
-        - The reviewer is not found in the reviewer table
         - The reviewer is the same as the user
-        - The reviewer is not listed as a reviewer for this assessment
+        - The reviewer is not the reviewer assigned to the entry
+
+    :raises: HTTPException 409 if the entry was updated concurrently
     """
     try:
-        assessment_tracker_entry = crud.get_assessment_tracker_entry_by_commit(
-            db=db, commit=approve_request.latest_commit
+        # Get the entry with the trainee, assessment and assigned reviewer
+        assessment_tracker_entry = (
+            crud.get_assessment_tracker_entry_for_approval(
+                db=db, commit=approve_request.latest_commit
+            )
         )
     except ValueError as e:
         print(str(e))
@@ -390,79 +526,101 @@ def approve(
         print(str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
-    orig_status = copy.deepcopy(assessment_tracker_entry.status)
     try:
-        # Get the trainee info
-        user = crud.get_user_by_id(
-            db=db, user_id=assessment_tracker_entry.user_id
-        )
-        # Get the assessment info
-        assessment = crud.get_assessment_by_id(
-            db=db, assessment_id=assessment_tracker_entry.assessment_id
-        )
-        if assessment.review_required == 1:
-            # Get the reviewer info; error if not exists
-            reviewer = crud.get_reviewer_by_username(
-                db=db, username=approve_request.reviewer_username
-            )
-        else:
-            reviewer = None
-        # Approve assessment, update logs, issue badge
+        # Approve assessment, update logs and queue the badge
         # Error if reviewer is not the one assigned;
         # Error if checks are not passed
         # Error if assessment is already approved;
         # Error if reviewer is same as trainee
+        # Conflict if the entry was updated concurrently, so only one
+        # approval goes through and queues the badge
         crud.approve_assessment(
             db=db,
-            trainee=user,
-            reviewer=reviewer,
+            assessment_tracker_entry=assessment_tracker_entry,
             reviewer_username=approve_request.reviewer_username,
-            assessment=assessment,
         )
-        # Issue badge
-        bt = utils.get_bearer_token(settings)
-        resp = utils.issue_badge(
-            user_email=user.email,
-            user_first=user.first_name,
-            user_last=user.last_name,
-            assessment_name=assessment.name,
-            bearer_token=bt,
-            config=settings,
+    except StaleDataError as e:
+        print(str(e))
+        db.rollback()
+        raise HTTPException(status_code=409, detail=conflict_detail)
+    except ValueError as e:
+        print(str(e))
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:  # pragma: no cover
+        print(str(e))
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"Assessment Approved": True}
+
+
+@router.patch("/changes")
+def changes(
+    *,
+    db: Session = Depends(get_db),
+    changes_request: schemas.ChangesRequest,
+):
+    """
+    Request changes on the assessment tracker entry under review. The
+    entry is sent back to "Initiated" until the trainee requests a review
+    again.
+
+    :param db: Generator for Session of database
+    :param changes_request: Pydantic request model schema used
+    by `/api/changes` endpoint
+
+    :returns: Json object indicating if changes were requested
+
+    :raises: HTTPException 422 if:
+        - The commit is not found in the assessment tracker entry table
+        - Assessment tracker entry is not under review
+        - The reviewer is not the reviewer assigned to the entry
+
+    :raises: HTTPException 409 if the entry was updated concurrently
+    """
+    try:
+        # Get the entry with its assigned reviewer
+        assessment_tracker_entry = (
+            crud.get_assessment_tracker_entry_for_approval(
+                db=db, commit=changes_request.latest_commit
+            )
         )
-        resp.raise_for_status()
-        # Add assertion to database
-        crud.add_assertion(
+        crud.request_changes(
             db=db,
-            entry_id=assessment_tracker_entry.id,
-            assertion=resp.json()["result"][0],
+            assessment_tracker_entry=assessment_tracker_entry,
+            reviewer_username=changes_request.reviewer_username,
         )
-    except KeyError as e:  # pragma: no cover
+    except StaleDataError as e:
         print(str(e))
-        msg = "Badgr: Unable to locate assessment: " + str(e)
-
-        # If any error, revert status to original
-        assessment_tracker_entry.status = orig_status
-        db.commit()
-
-        raise HTTPException(status_code=500, detail=msg)
+        db.rollback()
+        raise HTTPException(status_code=409, detail=conflict_detail)
     except ValueError as e:
         print(str(e))
-
-        # If any error, revert status to original
-        assessment_tracker_entry.status = orig_status
-        db.commit()
-
         raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:  # pragma: no cover
         print(str(e))
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"Changes Requested": True}
+
+
+@router.get("/stats/status")
+def status_stats(*, db: Session = Depends(get_db)):
+    """
+    Returns the number of assessment tracker entries in each status.
 
-        # If any error, revert status to original
-        assessment_tracker_entry.status = orig_status
-        db.commit()
+    :param db: Generator for Session of database
 
+    :returns: Json object of status to number of entries
+    """
+    try:
+        counts = crud.count_assessment_tracker_by_status(db=db)
+    except Exception as e:  # pragma: no cover
+        print(str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
-    return {"Assessment Approved": True}
+    return counts
 
 
 @router.post("/user/delete")
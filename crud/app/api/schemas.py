@@ -1,5 +1,5 @@
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, root_validator
 
 
 # Request schemas
@@ -14,6 +14,33 @@ class InitRequest(BaseModel):
     assessment_id: int
 
 
+class InitCompleteRequest(BaseModel):
+    """
+    Pydantic request model schema used by `/api/init/complete` endpoint
+    """
+
+    job_id: str
+    user_id: int
+    assessment_id: int
+    status: str
+    github_url: Optional[str] = None
+    latest_commit: Optional[str] = None
+    detail: Optional[str] = None
+
+    @root_validator(skip_on_failure=True)
+    def check_result(cls, values):
+        # A complete job must report the repo it provisioned
+        if values["status"] not in ["complete", "failed"]:
+            raise ValueError("status must be 'complete' or 'failed'")
+        if values["status"] == "complete" and (
+            not values.get("github_url") or not values.get("latest_commit")
+        ):
+            raise ValueError(
+                "github_url and latest_commit are required when complete"
+            )
+        return values
+
+
 class CheckRequest(BaseModel):
     """
     Pydantic request model schema used by `/api/check` endpoint
@@ -32,6 +59,15 @@ class ApproveRequest(BaseModel):
     reviewer_username: str
 
 
+class ChangesRequest(BaseModel):
+    """
+    Pydantic request model schema used by `/api/changes` endpoint
+    """
+
+    latest_commit: str
+    reviewer_username: str
+
+
 class ViewRequest(BaseModel):
     """
     Pydantic request model schema used by `/api/view` endpoint
@@ -68,6 +104,8 @@ class UpdateRequest(BaseModel):
     latest_commit: str
     log: dict
     status: Optional[str] = None
+    # Admin override: set the status even if the transition is not allowed
+    force: bool = False
 
 
 class ReviewRequest(BaseModel):
@@ -1 +1,2 @@
 from .crud import *
+from .transitions import *
@@ -1,17 +1,20 @@
-from datetime import datetime
-from sqlalchemy import true
-from sqlalchemy.orm import Session
-import random
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import Session, aliased, joinedload, load_only, selectinload
 import requests
 import copy
 from app import utils
 import app.db.models as models
+from app.crud.transitions import (
+    APPROVED,
+    INITIATED,
+    PRE_ASSESSMENT,
+    TRANSITIONS,
+    UNDER_REVIEW,
+    can_transition,
+)
 from app.dependencies import Settings
 
-# Reproducibility for randomly selecting reviewers
-random.seed(42)
-
-
 def get_user_by_username(db: Session, username: str):
     """
     Return the user entry based on username.
@@ -145,21 +148,26 @@ def get_assessment_by_id(db: Session, assessment_id: int):
     return assessment
 
 
-def get_assessment_tracker_entry(db: Session, user_id: int, assessment_id: int):
+def get_assessment_tracker_entry(
+    db: Session, user_id: int, assessment_id: int, with_log: bool = False
+):
     """
     Return the assessment tracker entry.
 
     :param db: Generator for Session of database
     :param user_id: user id
     :param assessment_id: assessment id
+    :param with_log: load the log (the events of the entry) up front
 
     :returns: Assessment traker entry as an sqlalchemy query object.
 
     :raises: ValueError if assessment tracker entry does not exist.
     """
+    query = db.query(models.AssessmentTracker)
+    if with_log:
+        query = query.options(selectinload(models.AssessmentTracker.events))
     assessment_tracker = (
-        db.query(models.AssessmentTracker)
-        .filter(models.AssessmentTracker.user_id == user_id)
+        query.filter(models.AssessmentTracker.user_id == user_id)
         .filter(models.AssessmentTracker.assessment_id == assessment_id)
         .first()
     )
@@ -195,6 +203,47 @@ def get_assessment_tracker_entry_by_commit(db: Session, commit: str):
     """
     Return the assessment tracker entry by latest commit.
 
+    Only the columns needed by the endpoints resolving entries by commit
+    (`/api/check`, `/api/review`, `/api/approve`) are loaded, the others
+    (e.g. the log) are loaded when accessed.
+
+    :param db: Generator for Session of database
+    :param commit: commit
+
+    :returns: Assessment tracker entry as an sqlalchemy query object.
+
+    :raises: ValueError if assessment tracker entry does not exist.
+    """
+    assessment_tracker = (
+        db.query(models.AssessmentTracker)
+        .options(
+            load_only(
+                models.AssessmentTracker.id,
+                models.AssessmentTracker.status,
+                models.AssessmentTracker.reviewer_id,
+                models.AssessmentTracker.user_id,
+                models.AssessmentTracker.assessment_id,
+                models.AssessmentTracker.latest_commit,
+                models.AssessmentTracker.last_check_commit,
+                models.AssessmentTracker.last_check_passed,
+                models.AssessmentTracker.version_id,
+            )
+        )
+        .filter(models.AssessmentTracker.latest_commit == commit)
+        .first()
+    )
+    if assessment_tracker is None:
+        raise ValueError("Assessment tracker entry unavailable.")
+
+    return assessment_tracker
+
+
+def get_assessment_tracker_entry_for_approval(db: Session, commit: str):
+    """
+    Return the assessment tracker entry by latest commit, with its trainee,
+    assessment and assigned reviewer (and the reviewer's user) loaded in
+    the same query.
+
     :param db: Generator for Session of database
     :param commit: commit
 
@@ -204,6 +253,13 @@ def get_assessment_tracker_entry_by_commit(db: Session, commit: str):
     """
     assessment_tracker = (
         db.query(models.AssessmentTracker)
+        .options(
+            joinedload(models.AssessmentTracker.user),
+            joinedload(models.AssessmentTracker.assessment),
+            joinedload(models.AssessmentTracker.reviewer).joinedload(
+                models.Reviewers.user
+            ),
+        )
         .filter(models.AssessmentTracker.latest_commit == commit)
         .first()
     )
@@ -254,15 +310,17 @@ def create_assessment_tracker_entry(
             user_id=user.id,
             assessment_id=assessment.id,
             last_updated=datetime.utcnow(),
-            status="Pre-assessment",
+            status=PRE_ASSESSMENT,
             latest_commit=commit,
-            log=[
-                {
-                    "status": "Pre-assessment",
-                    "timestamp": str(datetime.utcnow()),
-                    "commit": None,
-                }
-            ],
+        )
+        add_assessment_event(
+            db=db,
+            assessment_tracker_entry=db_obj,
+            data={
+                "status": PRE_ASSESSMENT,
+                "timestamp": str(datetime.utcnow()),
+                "commit": None,
+            },
         )
         db.add(db_obj)
         db.commit()
@@ -290,6 +348,9 @@ def update_assessment_tracker_entry(
     :param repo_branch: repo branch
 
     :returns: True
+
+    :raises: ValueError if the status transition is not allowed
+    :raises: StaleDataError if the entry was updated concurrently
     """
     # Get the assessment tracker entry
     assessment_tracker = get_assessment_tracker_entry(
@@ -298,19 +359,13 @@ def update_assessment_tracker_entry(
 
     try:
         # Update the entry
-        assessment_tracker.status = status
         assessment_tracker.latest_commit = commit
         assessment_tracker.repo_owner = github_url.split("/")[3]
         assessment_tracker.repo_name = github_url.split("/")[4]
         assessment_tracker.pr_number = 1
-        assessment_tracker.last_updated = datetime.utcnow()
-        # Add the new log entry
-        assessment_tracker.log.append(
-            {
-                "status": status,
-                "timestamp": str(datetime.utcnow()),
-                "commit": commit,
-            }
+        # Move to the new status and add the log entry
+        transition_status(
+            db=db, assessment_tracker_entry=assessment_tracker, status=status
         )
         db.commit()
         return True
@@ -327,58 +382,83 @@ def select_reviewer(
     """
     Select a reviewer for the assessment tracker entry.
 
+    Picks the least loaded (fewest open reviews) reviewer who can review
+    the assessment (`assessment_reviewing_id` is the assessment, or empty
+    for any assessment) and is not the trainee. Each of the two pools is
+    read in order from the `ix_reviewers_pool` index, stopping at its
+    least loaded reviewer, and the better of the two is picked (a single
+    query with UNION ALL; an OR of the pools could not use the index
+    order).
+
     :param db: Generator for Session of database
     :param assessment_tracker_entry: assessment tracker entry
 
     :returns: Reviewer info as an entry from the Reviewer's table in
     sqlalchemy query object format.
 
-    :raises: Uncaught error if no reviewer is available
-    (should not happen).
+    :raises: ValueError if no reviewer is available
     """
     if settings.APP_ENV_NAME == "testing":
         return get_reviewer_by_username(db=db, username="brnbot2")
 
-    invalid_rev = (
-        db.query(models.Reviewers)
-        .filter(models.Reviewers.user_id == assessment_tracker_entry.user_id)
-        .with_entities(models.Reviewers.id)
-        .all()
-    )
-    invalid_rev = [i[0] for i in invalid_rev]
-
-    # Get all reviewers
-    valid_reviewers = (
-        db.query(models.Reviewers)
-        .filter(
-            models.Reviewers.id.notin_(invalid_rev),
-            # Uncomment to filter by assessments the reviewer can do
-            # assessment.id in models.Reviewers.assessment_reviewing_info,
-        )
-        .with_entities(models.Reviewers.id)
-        .all()
+    pools = [
+        models.Reviewers.assessment_reviewing_id
+        == assessment_tracker_entry.assessment_id,
+        models.Reviewers.assessment_reviewing_id.is_(None),
+    ]
+    candidates = union_all(
+        *[
+            select(
+                select(models.Reviewers)
+                .where(
+                    pool,
+                    models.Reviewers.user_id
+                    != assessment_tracker_entry.user_id,
+                )
+                .order_by(models.Reviewers.open_reviews, models.Reviewers.id)
+                .limit(1)
+                .subquery()
+            )
+            for pool in pools
+        ]
+    ).subquery()
+    candidate = aliased(models.Reviewers, candidates)
+    reviewer = (
+        db.query(candidate)
+        .order_by(candidate.open_reviews, candidate.id)
+        .first()
     )
-
-    try:
-        # Get a random reviewer from the list of valid reviewers
-        # Will be replaced with Slack integration
-        random_id = valid_reviewers[
-            random.randint(0, len(valid_reviewers) - 1)
-        ][0]
-    except Exception:  # pragma: no cover
+    if reviewer is None:  # pragma: no cover
         raise ValueError(
             "No reviewer available. Please contact the administrator."
         )
 
-    try:
-        random_reviewer = get_reviewer_by_id(db=db, reviewer_id=random_id)
-        return random_reviewer
-    except Exception as e:  # pragma: no cover
-        raise Exception(
-            "Error selecting reviewer. Contact the administrators. Error"
-            " string: "
-            + str(e)
-        )
+    return reviewer
+
+
+def update_open_reviews(db: Session, reviewer_id: int, change: int):
+    """
+    Update the number of open reviews of a reviewer.
+
+    The update is done in the database (not read-modify-write), and is
+    committed with the session.
+
+    :param db: Generator for Session of database
+    :param reviewer_id: reviewer id
+    :param change: number of reviews opened (or closed, if negative)
+    """
+    if reviewer_id is None:
+        return
+    db.query(models.Reviewers).filter(
+        models.Reviewers.id == reviewer_id
+    ).update(
+        {
+            models.Reviewers.open_reviews: func.greatest(
+                models.Reviewers.open_reviews + change, 0
+            )
+        },
+        synchronize_session=False,
+    )
 
 
 def assign_reviewer(
@@ -396,44 +476,38 @@ def assign_reviewer(
 
     :returns: True
 
-    :raises: None (hopefully)
+    :raises: ValueError if the entry is not waiting for a review
+    :raises: StaleDataError if the entry was updated concurrently
     """
-    # Update the assessment tracker entry
+    # Update the assessment tracker entry, committed with the log entry
     assessment_tracker_entry.reviewer_id = reviewer_info["reviewer_id"]
-    assessment_tracker_entry.status = "Under review"
-    assessment_tracker_entry.last_updated = datetime.utcnow()
-    db.add(assessment_tracker_entry)
-    db.commit()
-
-    # Update the assessment tracker entry log
-    update_assessment_log(
+    transition_status(
         db=db,
-        entry_id=assessment_tracker_entry.id,
-        latest_commit=assessment_tracker_entry.latest_commit,
-        update_logs=copy.deepcopy(reviewer_info),
-    )  # Update logs
+        assessment_tracker_entry=assessment_tracker_entry,
+        status=UNDER_REVIEW,
+        data=copy.deepcopy(reviewer_info),
+    )
+    db.commit()
 
     return True
 
 
 def approve_assessment(
     db: Session,
-    trainee: models.Users,
-    reviewer: models.Reviewers,
+    assessment_tracker_entry: models.AssessmentTracker,
     reviewer_username: str,
-    assessment: models.Assessments,
 ):
     """
     Approve an assessment.
 
+    The badge is issued in the background (see `app.worker`), from the
+    badge issuance job committed with the approval.
+
     :param db: Generator for Session of database
-    :param trainee: trainee's db entry from the Users table in
-    sqlalchemy query object format.
-    :param reviewer: reviewer's db entry from the Reviewers table in
-    sqlalchemy query object format.
-    :param reviewer_username: reviewer's github username
-    :param assessment: assessment's db entry from the Assessments table in
-    sqlalchemy query object format.
+    :param assessment_tracker_entry: assessment tracker entry, with its
+    trainee, assessment and assigned reviewer loaded (see
+    `get_assessment_tracker_entry_for_approval`).
+    :param reviewer_username: github username of the approver
 
     :returns: True
 
@@ -443,16 +517,14 @@ def approve_assessment(
         - Assessment is not under review
         - No reviewer is assigned
         - Last commit check failed
-        - Assessment tracker entry does not exist
         - Reviewer is not the same as the reviewer assigned in
         the assessment tracker entry
+    :raises: StaleDataError if the entry was updated concurrently
     """
+    trainee = assessment_tracker_entry.user
+    assessment = assessment_tracker_entry.assessment
 
     # Verify checks passing on latest commit
-    assessment_tracker_entry = get_assessment_tracker_entry(
-        db=db, user_id=trainee.id, assessment_id=assessment.id
-    )
-
     if not utils.verify_check(
         assessment_tracker_entry=assessment_tracker_entry
     ):
@@ -461,47 +533,85 @@ def approve_assessment(
     # Verify that the reviewer is the same as the reviewer assigned in the
     # assessment tracker entry
     if assessment.review_required == 1:
-        # Get user ids and confirm they are different
-        if reviewer.user_id == trainee.id:
+        # Confirm the approver is not the trainee
+        if reviewer_username == trainee.username:
             raise ValueError("Reviewer cannot be the same as the trainee.")
-        if assessment_tracker_entry.reviewer_id is None:
+        if assessment_tracker_entry.reviewer is None:
             raise ValueError("No reviewer is assigned to the assessment.")
-        if assessment_tracker_entry.status != "Under review":
+        if assessment_tracker_entry.status != UNDER_REVIEW:
             raise ValueError("Assessment is not under review.")
 
-        # Get the reviewer, based on the assessment_tracker entry
-        reviewer_real = get_reviewer_by_id(
-            db=db, reviewer_id=assessment_tracker_entry.reviewer_id
-        )
-        reviewer_real_user = get_user_by_id(
-            db=db, user_id=reviewer_real.user_id
-        )
         # Verify the approval request is from the reviewer
-        if reviewer_real_user.username != reviewer_username:
+        reviewer_user = assessment_tracker_entry.reviewer.user
+        if reviewer_user.username != reviewer_username:
             raise ValueError(
                 "Reviewer is not the same as the reviewer assigned to the"
                 " assessment."
             )
-        reviewer = reviewer.id
+        reviewer = assessment_tracker_entry.reviewer_id
     else:
         reviewer = "brnbot"
 
-    # Get assessment id and latest commit
-    latest_commit = assessment_tracker_entry.latest_commit
-
     # Approve the assessment and update the log / status
-    assessment_tracker_entry.status = "Approved"
-    assessment_tracker_entry.last_updated = datetime.utcnow()
-    log = {
-        "timestamp": str(datetime.utcnow()),
-        "status": "Approved",
-        "commit": latest_commit,
-        "Reviewer": reviewer,
-    }
-    logs = list(assessment_tracker_entry.log)
-    logs.append(log)
-    assessment_tracker_entry.log = logs
-    db.add(assessment_tracker_entry)
+    transition_status(
+        db=db,
+        assessment_tracker_entry=assessment_tracker_entry,
+        status=APPROVED,
+        data={"Reviewer": reviewer},
+    )
+    # Queue the badge, committed with the approval
+    enqueue_badge_issuance(
+        db=db, assessment_tracker_entry=assessment_tracker_entry
+    )
+    db.commit()
+
+    return True
+
+
+def request_changes(
+    db: Session,
+    assessment_tracker_entry: models.AssessmentTracker,
+    reviewer_username: str,
+):
+    """
+    Send an assessment under review back to the trainee, for changes
+    requested by the reviewer.
+
+    The entry moves back to "Initiated": the trainee pushes new commits,
+    runs the checks and requests a review again.
+
+    :param db: Generator for Session of database
+    :param assessment_tracker_entry: assessment tracker entry, with its
+    assigned reviewer loaded (see
+    `get_assessment_tracker_entry_for_approval`).
+    :param reviewer_username: github username of the reviewer
+
+    :returns: True
+
+    :raises: ValueError if:
+        - Assessment is not under review
+        - Reviewer is not the same as the reviewer assigned in
+        the assessment tracker entry
+    :raises: StaleDataError if the entry was updated concurrently
+    """
+    if assessment_tracker_entry.status != UNDER_REVIEW:
+        raise ValueError("Assessment is not under review.")
+    reviewer_user = assessment_tracker_entry.reviewer.user
+    if reviewer_user.username != reviewer_username:
+        raise ValueError(
+            "Reviewer is not the same as the reviewer assigned to the"
+            " assessment."
+        )
+
+    transition_status(
+        db=db,
+        assessment_tracker_entry=assessment_tracker_entry,
+        status=INITIATED,
+        data={
+            "Reviewer": assessment_tracker_entry.reviewer_id,
+            "changes_requested": True,
+        },
+    )
     db.commit()
 
     return True
@@ -519,12 +629,8 @@ def add_assertion(
     :param entry_id: Assessment tracker entry id
     :param assertion: Assertion to add
     """
-    badge = (
-        db.query(models.Badges)
-        .filter(models.Badges.entityId == assertion["badgeclass"])
-        .first()
-    )
-    # Get the badge name for the assertion
+    # Get the badge name for the assertion (from the process-level map)
+    badge = utils.badge_map.get(assertion["badgeclass"])
     if badge is None:
         raise ValueError("Badge does not exist in database")
     try:
@@ -555,24 +661,291 @@ def add_assertion(
         raise e
 
 
+def add_assessment_event(
+    db: Session,
+    assessment_tracker_entry: models.AssessmentTracker,
+    data: dict,
+    status: str = None,
+):
+    """
+    Append an event to the assessment tracker entry log.
+
+    The event is a single insert in the assessment_events table, the
+    previous events are not loaded. It is committed with the session.
+
+    :param db: Generator for Session of database
+    :param assessment_tracker_entry: assessment tracker entry
+    :param data: log entry as a dict
+    :param status: status of the entry after the event (defaults to the
+        status in the log entry, if any)
+
+    :returns: The new event as an sqlalchemy object.
+    """
+    event = models.AssessmentEvents(
+        tracker=assessment_tracker_entry,
+        commit=data.get("commit"),
+        status=status or data.get("status"),
+        created_at=datetime.utcnow(),
+        data=data,
+    )
+    db.add(event)
+    return event
+
+
+def transition_status(
+    db: Session,
+    assessment_tracker_entry: models.AssessmentTracker,
+    status: str,
+    data: dict = None,
+    force: bool = False,
+):
+    """
+    Move the assessment tracker entry to another status.
+
+    The transition is validated against `transitions.TRANSITIONS` and
+    recorded as an event, and the open review count of the entry's
+    reviewer is updated when it enters or leaves "Under review".
+
+    It is committed with the session, and only applies if the entry was
+    not updated since it was read (the UPDATE is checked against the
+    version of the entry), so the validated status is still the current
+    one.
+
+    :param db: Generator for Session of database
+    :param assessment_tracker_entry: assessment tracker entry
+    :param status: target status
+    :param data: extra fields for the log entry
+    :param force: admin override, allow any transition to a known status
+        (recorded as `forced` in the log entry)
+
+    :returns: The event as an sqlalchemy object.
+
+    :raises: ValueError if the transition is not allowed
+    """
+    current = assessment_tracker_entry.status
+    if force:
+        if status not in TRANSITIONS:
+            raise ValueError(f"Invalid status: {status}.")
+    elif not can_transition(current, status):
+        raise ValueError(f"Invalid status transition: {current} -> {status}.")
+
+    # Keep the open review counts of the reviewers up to date
+    if current == UNDER_REVIEW:
+        update_open_reviews(
+            db=db, reviewer_id=assessment_tracker_entry.reviewer_id, change=-1
+        )
+    if status == UNDER_REVIEW:
+        update_open_reviews(
+            db=db, reviewer_id=assessment_tracker_entry.reviewer_id, change=1
+        )
+
+    assessment_tracker_entry.status = status
+    assessment_tracker_entry.last_updated = datetime.utcnow()
+    log = {
+        "timestamp": str(assessment_tracker_entry.last_updated),
+        "status": status,
+        "commit": assessment_tracker_entry.latest_commit,
+        "from_status": current,
+    }
+    if force:
+        log["forced"] = True
+    log.update(data or {})
+    db.add(assessment_tracker_entry)
+    return add_assessment_event(
+        db=db,
+        assessment_tracker_entry=assessment_tracker_entry,
+        data=log,
+        status=status,
+    )
+
+
+def count_assessment_tracker_by_status(db: Session) -> dict:
+    """
+    Count the assessment tracker entries in each status.
+
+    A single GROUP BY over the status index, without reading the entries.
+
+    :param db: Generator for Session of database
+
+    :returns: Dict of status to number of entries
+    """
+    counts = (
+        db.query(
+            models.AssessmentTracker.status,
+            func.count(models.AssessmentTracker.id),
+        )
+        .group_by(models.AssessmentTracker.status)
+        .all()
+    )
+    return {status: count for status, count in counts}
+
+
+def enqueue_badge_issuance(
+    db: Session, assessment_tracker_entry: models.AssessmentTracker
+):
+    """
+    Queue the badge issuance for an approved assessment tracker entry.
+
+    The job is committed with the session.
+
+    :param db: Generator for Session of database
+    :param assessment_tracker_entry: assessment tracker entry
+
+    :returns: The job as an sqlalchemy object.
+    """
+    now = datetime.utcnow()
+    job = models.BadgeIssuanceJobs(
+        tracker=assessment_tracker_entry,
+        status="pending",
+        attempts=0,
+        next_attempt_at=now,
+        created_at=now,
+        updated_at=now,
+    )
+    db.add(job)
+    return job
+
+
+def claim_badge_issuance_job(db: Session, lease: float):
+    """
+    Claim the next due badge issuance job.
+
+    Rows locked by another worker are skipped. The job is marked as
+    running until `lease` seconds from now, after which it is due again
+    (e.g. if the worker died while processing it).
+
+    :param db: Generator for Session of database
+    :param lease: seconds the job stays claimed
+
+    :returns: The claimed job as an sqlalchemy object, or None if no job
+    is due.
+    """
+    now = datetime.utcnow()
+    job = (
+        db.query(models.BadgeIssuanceJobs)
+        .filter(
+            models.BadgeIssuanceJobs.status.in_(["pending", "running"]),
+            models.BadgeIssuanceJobs.next_attempt_at <= now,
+        )
+        .order_by(models.BadgeIssuanceJobs.next_attempt_at)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if job is None:
+        db.commit()
+        return None
+
+    job.status = "running"
+    job.attempts += 1
+    job.next_attempt_at = now + timedelta(seconds=lease)
+    job.updated_at = now
+    db.commit()
+    return job
+
+
+def complete_badge_issuance_job(
+    db: Session, job: models.BadgeIssuanceJobs, assertion_id: str
+):
+    """
+    Mark a badge issuance job as done, and log the issued assertion.
+
+    :param db: Generator for Session of database
+    :param job: badge issuance job
+    :param assertion_id: entityId of the issued assertion
+
+    :returns: True
+    """
+    job.status = "done"
+    job.assertion_id = assertion_id
+    job.last_error = None
+    job.updated_at = datetime.utcnow()
+    add_assessment_event(
+        db=db,
+        assessment_tracker_entry=job.tracker,
+        data={
+            "timestamp": str(job.updated_at),
+            "commit": job.tracker.latest_commit,
+            "badge_issued": assertion_id,
+        },
+    )
+    db.commit()
+
+    return True
+
+
+def fail_badge_issuance_job(
+    db: Session,
+    job: models.BadgeIssuanceJobs,
+    error: str,
+    max_attempts: int,
+    backoff: float,
+):
+    """
+    Record a failed badge issuance attempt.
+
+    The job is retried after `backoff` seconds, doubled for each attempt,
+    or marked as failed (and logged) after `max_attempts` attempts.
+
+    :param db: Generator for Session of database
+    :param job: badge issuance job
+    :param error: error of the attempt
+    :param max_attempts: attempts before giving up
+    :param backoff: delay in seconds before the first retry
+
+    :returns: True if the job will be retried
+    """
+    now = datetime.utcnow()
+    job.last_error = error
+    job.updated_at = now
+    retry = job.attempts < max_attempts
+    if retry:
+        job.status = "pending"
+        job.next_attempt_at = now + timedelta(
+            seconds=backoff * 2 ** (job.attempts - 1)
+        )
+    else:
+        job.status = "failed"
+        add_assessment_event(
+            db=db,
+            assessment_tracker_entry=job.tracker,
+            data={
+                "timestamp": str(now),
+                "commit": job.tracker.latest_commit,
+                "badge_issuance_failed": error,
+            },
+        )
+    db.commit()
+
+    return retry
+
+
 def update_assessment_log(
     db: Session,
     entry_id: int,
     latest_commit: str,
     update_logs: dict,
     status: str = None,
+    force: bool = False,
 ) -> bool:
     """
     Update the assessment tracker entry log.
 
+    If the log entry holds a check result (`checks_passed`), it is also
+    kept as the last check result of the entry (see `utils.verify_check`).
+
     :param db: Generator for Session of database
     :param assessment_tracker_id: assessment tracker entry id
     :param latest_commit: latest commit
     :param update_logs: logs to update as a dict
+    :param status: new status of the entry, if it changes
+    :param force: admin override, set the status even if the transition
+        is not allowed (e.g. to reset an entry)
 
     :returns: True
 
-    :raises: ValueError if the assessment tracker entry does not exist
+    :raises: ValueError if the assessment tracker entry does not exist, or
+        if the status transition is not allowed
+    :raises: StaleDataError if the entry was updated concurrently
     """
     # Get the assessment tracker entry
     assessment_tracker_entry = get_assessment_tracker_entry_by_id(
@@ -582,13 +955,31 @@ def update_assessment_log(
     # Update the logs
     assessment_tracker_entry.last_updated = datetime.utcnow()
     assessment_tracker_entry.latest_commit = latest_commit
-    if status:
-        assessment_tracker_entry.status = status
-    logs = list(assessment_tracker_entry.log)
     update_logs["commit"] = latest_commit
     update_logs["timestamp"] = str(assessment_tracker_entry.last_updated)
-    logs.append(update_logs)
-    assessment_tracker_entry.log = logs
+    # Keep the last check result, committed together with the log entry
+    if "checks_passed" in update_logs:
+        assessment_tracker_entry.last_check_commit = latest_commit
+        assessment_tracker_entry.last_check_passed = bool(
+            update_logs["checks_passed"]
+        )
+        assessment_tracker_entry.last_check_at = (
+            assessment_tracker_entry.last_updated
+        )
+    if status and status != assessment_tracker_entry.status:
+        transition_status(
+            db=db,
+            assessment_tracker_entry=assessment_tracker_entry,
+            status=status,
+            data=update_logs,
+            force=force,
+        )
+    else:
+        add_assessment_event(
+            db=db,
+            assessment_tracker_entry=assessment_tracker_entry,
+            data=update_logs,
+        )
 
     # Commit the changes
     db.add(assessment_tracker_entry)
@@ -662,6 +1053,10 @@ def delete_user(db: Session, user_id: int, settings: dict) -> None:
                     db.delete(assertions)
                     db.commit()
                 # Delete assessment tracker entry
+                if at.status == UNDER_REVIEW:
+                    update_open_reviews(
+                        db=db, reviewer_id=at.reviewer_id, change=-1
+                    )
                 db.delete(at)
                 db.commit()
 
@@ -696,6 +1091,12 @@ def delete_assessment_tracker_entry(
         db=db, assessment_id=delete_request.assessment_id
     )
     user = get_user_by_id(db=db, user_id=delete_request.user_id)
+    if assessment_tracker_entry.status == UNDER_REVIEW:
+        update_open_reviews(
+            db=db,
+            reviewer_id=assessment_tracker_entry.reviewer_id,
+            change=-1,
+        )
     db.delete(assessment_tracker_entry)
     db.commit()
 
@@ -0,0 +1,32 @@
+# Lifecycle of an assessment tracker entry
+PRE_ASSESSMENT = "Pre-assessment"
+INITIATED = "Initiated"
+UNDER_REVIEW = "Under review"
+APPROVED = "Approved"
+
+# Allowed status transitions: current status -> target statuses
+TRANSITIONS = {
+    # Repo provisioned by the bot (/api/init/complete)
+    PRE_ASSESSMENT: {INITIATED},
+    # Reviewer assigned (/api/review), or approved without review
+    INITIATED: {UNDER_REVIEW, APPROVED},
+    # Approved by the reviewer (/api/approve), or sent back to the trainee
+    # when the reviewer requests changes (/api/changes) or the checks of a
+    # new commit fail (/api/check)
+    UNDER_REVIEW: {APPROVED, INITIATED},
+    # Final, the badge is issued in the background (admins can still reset
+    # an entry with a forced update, see /api/update)
+    APPROVED: set(),
+}
+
+
+def can_transition(current: str, status: str) -> bool:
+    """
+    Check if an entry can move from its current status to another one.
+
+    :param current: current status of the entry
+    :param status: target status
+
+    :returns: True if the transition is allowed
+    """
+    return status in TRANSITIONS.get(current, set())
@@ -1,3 +1,4 @@
+from datetime import timedelta
 from functools import lru_cache
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -73,6 +74,22 @@ SQLALCHEMY_DATABASE_URI = (
 engine = create_engine(SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Background badge issuance (see app/worker.py): seconds between polls of
+# the job table when idle, attempts per job, delay in seconds before the
+# first retry (doubled for each retry), and seconds a claimed job stays
+# claimed before another worker may take it over
+badge_worker_poll_interval = 5
+badge_job_max_attempts = 8
+badge_job_backoff = 30
+badge_job_lease = 300
+
+# Badgr bearer tokens are refreshed this long before they expire
+badgr_token_refresh_margin = timedelta(minutes=5)
+
+# Badges looked up by entityId are reloaded at most this often (seconds)
+# when an unknown entityId is looked up
+badge_map_reload_interval = 60
+
 # to get local DB
 def get_db():
     """
@@ -0,0 +1,176 @@
+# Badgr bearer token shared by the CRUD app and the sync lambda
+#
+# The two are deployed separately, so this module is kept identical in
+# crud/app/utils/badgr_auth.py and sync/utils/badgr_auth.py (checked by
+# sync/tests/test_badgr_auth.py). It only depends on the settings and the
+# "badgr_auth" table, not on the models of either app.
+import requests
+from datetime import datetime, timedelta
+from sqlalchemy import (
+    DateTime,
+    Integer,
+    String,
+    column,
+    insert,
+    select,
+    table,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+# Single row table (id 1) holding the current token
+badgr_auth = table(
+    "badgr_auth",
+    column("id", Integer),
+    column("bearer_token", String),
+    column("expires_at", DateTime),
+    column("refresh_token", String),
+)
+
+
+def request_bearer_token(config, refresh_token: str = None):
+    """
+    Request a new bearer token from the Badgr API.
+    Scope is limited to read-only access for organization-level badges.
+    Includes write access for user-level badges.
+
+    :param config: The configuration dictionary for the Badgr API
+    :param refresh_token: The refresh token of the previous bearer token,
+        or None to log in with the username and password
+
+    :return: The token response (access_token, refresh_token, expires_in)
+    """
+    url = config.BADGR_BASE_URL + "/o/token/"
+    if refresh_token is None:
+        payload = {
+            "username": config.BADGR_USERNAME,
+            "password": config.BADGR_PASSWORD,
+            "scope": config.BADGR_SCOPE,
+            "grant_type": config.BADGR_GRANT_TYPE,
+            "client_id": config.BADGR_CLIENT_ID,
+        }
+    else:
+        payload = {
+            "refresh_token": refresh_token,
+            "grant_type": "refresh_token",
+            "client_id": config.BADGR_CLIENT_ID,
+        }
+    response = requests.request("POST", url, data=payload)
+    try:
+        token = response.json()
+    except ValueError:  # pragma: no cover
+        token = {}
+    if "access_token" not in token:  # pragma: no cover
+        raise Exception("Badgr API provided no access token.")
+    return token
+
+
+def read_bearer_token(db: Session):
+    """
+    Read the row of the "badgr_auth" table, or None if there is none
+    """
+    return db.execute(select(badgr_auth).where(badgr_auth.c.id == 1)).first()
+
+
+def is_valid(auth, refresh_margin: timedelta, now: datetime) -> bool:
+    """
+    Check if a stored token does not expire within `refresh_margin`
+    """
+    return (
+        auth is not None
+        and auth.bearer_token is not None
+        and auth.expires_at is not None
+        and auth.expires_at - refresh_margin > now
+    )
+
+
+def load_bearer_token(
+    db: Session,
+    config,
+    refresh_margin: timedelta,
+    persist: bool = True,
+):
+    """
+    Get the bearer token stored in the "badgr_auth" table, refreshing it
+    if it expires within `refresh_margin`.
+
+    No lock is held while the token is requested: the row is read, the
+    new token requested, then stored only if the row still holds the token
+    which was read. If another process stored a new token first, its
+    token is used instead.
+
+    :param db: The database session
+    :param config: The configuration dictionary for the Badgr API
+    :param refresh_margin: How long before its expiry a token is refreshed
+    :param persist: Store a new token. If False (dry run), nothing is
+        written and a new token is requested with the password, since
+        using the stored refresh token would revoke it.
+
+    :return: The bearer token and its expiry time
+    """
+    if not persist:
+        auth = read_bearer_token(db)
+        now = datetime.utcnow()
+        if is_valid(auth, refresh_margin, now):
+            return auth.bearer_token, auth.expires_at
+        token = request_bearer_token(config)
+        expires_at = now + timedelta(seconds=token.get("expires_in", 3600))
+        return token["access_token"], expires_at
+
+    try:
+        auth = read_bearer_token(db)
+        if auth is None:
+            # First use: create the row (another process may be doing so)
+            try:
+                db.execute(insert(badgr_auth).values(id=1))
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+            auth = read_bearer_token(db)
+        # End the transaction before calling the Badgr API
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    now = datetime.utcnow()
+    if is_valid(auth, refresh_margin, now):
+        return auth.bearer_token, auth.expires_at
+
+    token = None
+    if auth.refresh_token is not None:
+        try:
+            token = request_bearer_token(config, auth.refresh_token)
+        except Exception as e:
+            print("Badgr refresh token rejected: " + str(e))
+    if token is None:
+        token = request_bearer_token(config)
+    expires_at = now + timedelta(seconds=token.get("expires_in", 3600))
+
+    try:
+        # Store the token unless another process stored one meanwhile
+        result = db.execute(
+            update(badgr_auth)
+            .where(badgr_auth.c.id == 1)
+            .where(
+                badgr_auth.c.bearer_token.isnot_distinct_from(
+                    auth.bearer_token
+                )
+            )
+            .values(
+                bearer_token=token["access_token"],
+                refresh_token=token.get("refresh_token", auth.refresh_token),
+                expires_at=expires_at,
+            )
+        )
+        db.commit()
+        if result.rowcount == 0:
+            winner = read_bearer_token(db)
+            db.commit()
+            if is_valid(winner, refresh_margin, now):
+                return winner.bearer_token, winner.expires_at
+    except Exception:
+        db.rollback()
+        raise
+    return token["access_token"], expires_at
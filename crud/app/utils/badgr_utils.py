@@ -1,39 +1,158 @@
 # Script for issue badge to a user
 import requests
 import json
-from datetime import datetime
-from app import Settings
-from app.db import Assertions
+import threading
+import time
+from datetime import datetime, timedelta
+from app import (
+    Settings,
+    SessionLocal,
+    badge_map_reload_interval,
+    badgr_token_refresh_margin,
+)
+from app.db import Assertions, BadgrAuth, Badges
+from app.utils.badgr_auth import load_bearer_token
+
+
+class BadgrTokenProvider:
+    """
+    Badgr bearer token shared by all the Badgr calls of the process
+
+    The token is cached in memory and in the "badgr_auth" table (shared
+    with the other processes and the sync lambda), and refreshed with its
+    refresh token `refresh_margin` before it expires.
+    """
+
+    def __init__(self, session_factory, refresh_margin: timedelta):
+        self.session_factory = session_factory
+        self.refresh_margin = refresh_margin
+        self.lock = threading.Lock()
+        self.token = None
+        self.expires_at = None
+
+    def valid(self) -> bool:
+        return (
+            self.token is not None
+            and self.expires_at - self.refresh_margin > datetime.utcnow()
+        )
+
+    def get(self, config: Settings) -> str:
+        """
+        Get the bearer token, loading or refreshing it if needed
+
+        :param config: The configuration dictionary for the Badgr API
+
+        :return: The bearer token as a string
+        """
+        if self.valid():
+            return self.token
+        with self.lock:
+            if not self.valid():
+                db = self.session_factory()
+                try:
+                    self.token, self.expires_at = load_bearer_token(
+                        db=db,
+                        config=config,
+                        refresh_margin=self.refresh_margin,
+                    )
+                finally:
+                    db.close()
+            return self.token
+
+    def invalidate(self, token: str):
+        """
+        Drop a token rejected by the Badgr API, so the next call refreshes it
+        """
+        with self.lock:
+            if self.token == token:
+                self.token = None
+                self.expires_at = None
+        db = self.session_factory()
+        try:
+            db.query(BadgrAuth).filter(BadgrAuth.bearer_token == token).update(
+                {BadgrAuth.expires_at: datetime.utcnow()},
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+# Bearer token shared by the API and the badge worker of this process
+badgr_tokens = BadgrTokenProvider(
+    session_factory=SessionLocal,
+    refresh_margin=badgr_token_refresh_margin,
+)
 
 
 def get_bearer_token(config: Settings):
     """
-    Get the bearer token from the Badgr API.
-    Scope is limited to read-only access for organization-level badges.
-    Includes write access for user-level badges.
+    Get the bearer token for the Badgr API (cached, see BadgrTokenProvider)
 
     :param config: The configuration dictionary for the Badgr API
 
     :return: The bearer token as a string
     """
-    url = config.BADGR_BASE_URL + "/o/token/"
-    payload = {
-        "username": config.BADGR_USERNAME,
-        "password": config.BADGR_PASSWORD,
-        "scope": config.BADGR_SCOPE,
-        "grant_type": config.BADGR_GRANT_TYPE,
-        "client_id": config.BADGR_CLIENT_ID,
-    }
-    response = requests.request("POST", url, data=payload)
-    try:
-        token = response.json()["access_token"]
-        return token
-    except KeyError:  # pragma: no cover
-        raise Exception("Badgr API provided no access token.")
+    return badgr_tokens.get(config)
+
+
+class BadgeMap:
+    """
+    Process-level map of the badges (entityId -> Badges)
+
+    Badges rarely change, so they are loaded once, and loaded again when
+    an unknown entityId is looked up (a badge created since), at most once
+    per `reload_interval` seconds. Until then, an unknown entityId is
+    answered from the loaded badges (cached as missing).
+    """
+
+    def __init__(self, session_factory, reload_interval: float = 60):
+        self.session_factory = session_factory
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self.badges = None
+        self.loaded_at = 0.0
+
+    def load(self) -> dict:
+        db = self.session_factory()
+        try:
+            badges = db.query(Badges).all()
+        finally:
+            # Closing detaches the badges, their attributes stay loaded
+            db.close()
+        return {badge.entityId: badge for badge in badges}
+
+    def get(self, entity_id: str):
+        """
+        Get a badge by entityId
+
+        :param entity_id: The entityId of the badge class
+
+        :return: The badge, or None if it is not in the database
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.badges is None or (
+                entity_id not in self.badges
+                and now - self.loaded_at >= self.reload_interval
+            ):
+                self.badges = self.load()
+                self.loaded_at = now
+            return self.badges.get(entity_id)
+
+
+# Badges shared by the API and the badge worker of this process
+badge_map = BadgeMap(
+    session_factory=SessionLocal, reload_interval=badge_map_reload_interval
+)
 
 
 def get_assertion(
-    assessment_name: str, user_email: str, bearer_token: str, config: Settings
+    assessment_name: str,
+    user_email: str,
+    bearer_token: str,
+    config: Settings,
+    num: int = 1,
 ):
     """
     Get the badge assertion from the Badgr API
@@ -42,6 +161,7 @@ def get_assertion(
     :param user_email: The user's email
     :param bearer_token: The bearer token (from the Badgr API)
     :param config: The configuration dictionary for the Badgr API
+    :param num: The max number of assertions to get (newest first)
 
     :return: The assertion as a response object
     """
@@ -52,7 +172,8 @@ def get_assertion(
         + "/assertions"
         + "?recipient="
         + user_email
-        + "&num=1"
+        + "&num="
+        + str(num)
     )
 
     headers = {
@@ -247,6 +368,7 @@ def issue_badge(
     assessment_name: str,
     bearer_token: str,
     config: Settings,
+    reference: str = None,
 ):
     """
     Issue a badgr badge to a user
@@ -257,6 +379,8 @@ def issue_badge(
     :param assessment_name: The assessment name
     :param bearer_token: The bearer token (from the Badgr API)
     :param config: The configuration dictionary for the Badgr API
+    :param reference: Added to the evidence narrative, to find the
+        assertion issued by this call later
 
     :return: The assertion as a response object
     """
@@ -269,6 +393,9 @@ def issue_badge(
     )
     # Prepare the payload with custom text and evidence
     # TODO: Have a way to add in custom URL and evidence for the assertion
+    evidence_narrative = "Link to a place where someone can see the results???"
+    if reference is not None:
+        evidence_narrative += " (" + reference + ")"
     payload = json.dumps(
         {
             "recipient": {
@@ -286,9 +413,7 @@ def issue_badge(
             "evidence": [
                 {
                     "url": "https://bioresnet.org/",
-                    "narrative": (
-                        "Link to a place where someone can see the results???"
-                    )
+                    "narrative": evidence_narrative,
                 }
             ],
             "notify": True,
@@ -5,33 +5,20 @@ def verify_check(assessment_tracker_entry: models.AssessmentTracker):
     """
     Verifies that the commit is passing the checks.
 
-    :param db: Generator for Session of database
+    Answers from the last check result kept on the entry (see
+    `crud.update_assessment_log`), without reading the log.
+
     :param assessment_tracker_entry: inputs assessment tracker entry from database
 
     :returns: boolean True if the latest commit is passing the checks.
 
-    :errors: ValueError if logs are not available or if the commit has not been checked.
+    :errors: ValueError if the latest commit has not been checked.
     """
-    # Get the log
-    log = assessment_tracker_entry.log
-    if log is None:
-        raise ValueError("No logs found.")
-
-    # Get latest commit
-    last_log_by_commit = [
-        lg
-        for lg in log
-        if lg.get("commit", "NA") == assessment_tracker_entry.latest_commit
-    ]
-    if last_log_by_commit == []:
-        raise ValueError("No logs found for latest commit.")
-
-    # Get the logs where checks were run
-    commit_log_checks = [
-        lg for lg in last_log_by_commit if "checks_passed" in lg.keys()
-    ]
-    if commit_log_checks == []:
+    if (
+        assessment_tracker_entry.last_check_commit is None
+        or assessment_tracker_entry.last_check_commit
+        != assessment_tracker_entry.latest_commit
+    ):
         raise ValueError("Check results not available for latest commit.")
-    last_log = commit_log_checks[-1]
     # Return checks results
-    return last_log["checks_passed"]
+    return assessment_tracker_entry.last_check_passed
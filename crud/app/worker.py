@@ -0,0 +1,190 @@
+import threading
+from app import crud, utils
+import app.db.models as models
+from app.dependencies import (
+    Settings,
+    SessionLocal,
+    settings,
+    badge_worker_poll_interval,
+    badge_job_max_attempts,
+    badge_job_backoff,
+    badge_job_lease,
+)
+
+
+class BadgeIssuer:
+    """
+    Background worker issuing the badges of approved assessments
+
+    The badge issuance jobs are queued by `crud.approve_assessment`, in the
+    same commit as the approval. The worker claims the due jobs (rows
+    claimed by the workers of other processes are skipped), issues the
+    badge with Badgr and adds the assertion. Failed attempts are retried
+    with exponential backoff.
+
+    The assertion of a job is tagged with the job id (in its evidence), so
+    a retry only reuses the assertion issued by a previous attempt of the
+    same job, among the `recent_assertions` latest of the recipient.
+    """
+
+    recent_assertions = 10
+
+    def __init__(
+        self,
+        settings: Settings,
+        poll_interval: float,
+        max_attempts: int,
+        backoff: float,
+        lease: float,
+    ):
+        self.settings = settings
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Start the worker thread
+        """
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the worker thread, after the job in progress
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                processed = self.run_once()
+            except Exception as e:  # pragma: no cover
+                print("Badge worker error: " + str(e))
+                processed = False
+            # Poll again right away while jobs are due
+            if not processed:
+                self.stopped.wait(self.poll_interval)
+
+    def run_once(self) -> bool:
+        """
+        Process the next due job
+
+        :returns: True if a job was processed
+        """
+        db = SessionLocal()
+        try:
+            job = crud.claim_badge_issuance_job(db=db, lease=self.lease)
+            if job is None:
+                return False
+            try:
+                assertion_id = self.issue(db=db, job=job)
+                crud.complete_badge_issuance_job(
+                    db=db, job=job, assertion_id=assertion_id
+                )
+            except Exception as e:
+                print(f"Badge issuance job {job.id} failed: {e}")
+                db.rollback()
+                crud.fail_badge_issuance_job(
+                    db=db,
+                    job=job,
+                    error=str(e),
+                    max_attempts=self.max_attempts,
+                    backoff=self.backoff,
+                )
+            return True
+        finally:
+            db.close()
+
+    def issue(self, db, job: models.BadgeIssuanceJobs) -> str:
+        """
+        Issue the badge of a job and add the assertion
+
+        :returns: The entityId of the assertion
+        """
+        entry = job.tracker
+        user = entry.user
+        assessment = entry.assessment
+        bt = utils.get_bearer_token(self.settings)
+
+        # A previous attempt may have issued the badge before failing: look
+        # for the assertion issued for this job (not any earlier one)
+        reference = self.reference(job)
+        assertion = None
+        if job.attempts > 1:
+            resp = utils.get_assertion(
+                assessment_name=assessment.name,
+                user_email=user.email,
+                bearer_token=bt,
+                config=self.settings,
+                num=self.recent_assertions,
+            )
+            if resp.status_code == 401:
+                # The cached token was revoked, refresh it for the retry
+                utils.badgr_tokens.invalidate(bt)
+            resp.raise_for_status()
+            assertion = self.find_assertion(resp.json()["result"], reference)
+
+        if assertion is None:
+            resp = utils.issue_badge(
+                user_email=user.email,
+                user_first=user.first_name,
+                user_last=user.last_name,
+                assessment_name=assessment.name,
+                bearer_token=bt,
+                config=self.settings,
+                reference=reference,
+            )
+            if resp.status_code == 401:
+                utils.badgr_tokens.invalidate(bt)
+            resp.raise_for_status()
+            assertion = resp.json()["result"][0]
+
+        # Add assertion to database
+        existing = (
+            db.query(models.Assertions)
+            .filter(models.Assertions.entityId == assertion["entityId"])
+            .first()
+        )
+        if existing is None:
+            crud.add_assertion(db=db, entry_id=entry.id, assertion=assertion)
+
+        return assertion["entityId"]
+
+    def reference(self, job: models.BadgeIssuanceJobs) -> str:
+        """
+        Get the reference added to the evidence of the assertion of a job
+        """
+        return f"brn-badge-job-{job.id}"
+
+    def find_assertion(self, assertions: list, reference: str):
+        """
+        Find the assertion issued with a reference
+
+        :param assertions: The assertions (from the Badgr API)
+        :param reference: The reference given to `issue_badge`
+
+        :returns: The assertion, or None if none has the reference
+        """
+        for assertion in assertions:
+            for evidence in assertion.get("evidence") or []:
+                if f"({reference})" in (evidence.get("narrative") or ""):
+                    return assertion
+        return None
+
+
+# Worker started with the app
+badge_issuer = BadgeIssuer(
+    settings=settings,
+    poll_interval=badge_worker_poll_interval,
+    max_attempts=badge_job_max_attempts,
+    backoff=badge_job_backoff,
+    lease=badge_job_lease,
+)
@@ -1,5 +1,6 @@
 from fastapi import FastAPI
 from app.api import api_endpoints
+from app.worker import badge_issuer
 
 app = FastAPI(
     title="BRN API",
@@ -21,5 +22,21 @@ def root():
     return {"Hello World!"}
 
 
+@app.on_event("startup")
+def start_badge_issuer():
+    """
+    Start the background badge issuance worker
+    """
+    badge_issuer.start()
+
+
+@app.on_event("shutdown")
+def stop_badge_issuer():
+    """
+    Stop the background badge issuance worker
+    """
+    badge_issuer.stop()
+
+
 # Router links all the api endpoints to main.py
 app.include_router(api_endpoints.router)
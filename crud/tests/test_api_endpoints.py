@@ -68,6 +68,91 @@ def test_init(client: TestClient, db: Session):
     assert response.json() == {"detail": "Assessment ID does not exist"}
 
 
+def test_init_complete(client: TestClient, db: Session):
+
+    # Get assessment where name is Test
+    assessment = db.query(models.Assessments).filter(models.Assessments.name == "Test").first()
+
+    # get a user where username is brnbot
+    user = db.query(models.Users).filter(models.Users.username == "bioresnet").first()
+
+    commit = "".join(
+        random.choices(string.ascii_uppercase + string.digits, k=20)
+    )
+
+    # Failed provisioning job leaves the entry in "Pre-assessment"
+    request_json = {
+        "job_id": "test-job",
+        "user_id": user.id,
+        "assessment_id": assessment.id,
+        "status": "failed",
+        "detail": "Test failure",
+    }
+    response = client.post("/api/init/complete", json=request_json)
+    assert response.status_code == 200
+    assert response.json() == {"Assessment Initiated": False}
+    tracker_entry = crud.get_assessment_tracker_entry(
+        db=db, user_id=user.id, assessment_id=assessment.id
+    )
+    db.refresh(tracker_entry)
+    assert tracker_entry.status == "Pre-assessment"
+    assert tracker_entry.log[-1]["init_failed"] == "Test failure"
+
+    # Error on completing without the repo and commit
+    request_json = {
+        "job_id": "test-job",
+        "user_id": user.id,
+        "assessment_id": assessment.id,
+        "status": "complete",
+        "github_url": None,
+        "latest_commit": None,
+    }
+    response = client.post("/api/init/complete", json=request_json)
+    assert response.status_code == 422
+    db.refresh(tracker_entry)
+    assert tracker_entry.status == "Pre-assessment"
+
+    # Error on an unknown job status
+    request_json["status"] = "running"
+    response = client.post("/api/init/complete", json=request_json)
+    assert response.status_code == 422
+
+    # Successful provisioning job initiates the assessment
+    request_json = {
+        "job_id": "test-job",
+        "user_id": user.id,
+        "assessment_id": assessment.id,
+        "status": "complete",
+        "github_url": "https://github.com/brn-test-assessment/test-repo",
+        "latest_commit": commit,
+    }
+    response = client.post("/api/init/complete", json=request_json)
+    assert response.status_code == 200
+    assert response.json() == {"Assessment Initiated": True}
+    tracker_entry = crud.get_assessment_tracker_entry(
+        db=db, user_id=user.id, assessment_id=assessment.id
+    )
+    db.refresh(tracker_entry)
+    assert tracker_entry.status == "Initiated"
+    assert tracker_entry.latest_commit == commit
+
+    assert tracker_entry.repo_name == "test-repo"
+
+    # A retried callback is accepted without changes
+    version_id = tracker_entry.version_id
+    response = client.post("/api/init/complete", json=request_json)
+    assert response.status_code == 200
+    assert response.json() == {"Assessment Initiated": True}
+    db.refresh(tracker_entry)
+    assert tracker_entry.version_id == version_id
+
+    # Error on completing for a second time with another commit
+    request_json["latest_commit"] = commit + "-other"
+    response = client.post("/api/init/complete", json=request_json)
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Assessment already initiated."}
+
+
 def test_view(client: TestClient, db: Session):
 
     # Get assessment where name is Test
@@ -116,6 +201,13 @@ def test_view(client: TestClient, db: Session):
     assert response.json() == {"detail": "Assessment tracker entry unavailable."}
 
 
+def test_status_stats(client: TestClient, db: Session):
+    response = client.get("/api/stats/status")
+    assert response.status_code == 200
+    counts = response.json()
+    assert sum(counts.values()) == db.query(models.AssessmentTracker).count()
+
+
 def test_check(client: TestClient,  db: Session):
 
     db = next(get_db())
@@ -195,6 +287,70 @@ def test_review(client: TestClient, db: Session):
     assert response.status_code == 200
 
 
+def test_changes(client: TestClient, db: Session):
+
+    db = next(get_db())
+
+    # For some reason, we have to retrieve the db session again
+    assessment = db.query(models.Assessments).filter(models.Assessments.name == "Test").first()
+    user = db.query(models.Users).filter(models.Users.username == "bioresnet").first()
+    assessment_tracker_entry = crud.get_assessment_tracker_entry(
+        db=db, user_id=user.id, assessment_id=assessment.id
+    )
+    assert assessment_tracker_entry.status == "Under review"
+    reviewer = crud.get_reviewer_by_id(
+        db=db, reviewer_id=assessment_tracker_entry.reviewer_id
+    )
+    revuser = crud.get_user_by_id(db=db, user_id=reviewer.user_id)
+    commit = assessment_tracker_entry.latest_commit
+
+    # Error if not requested by the assigned reviewer
+    request_json = {"reviewer_username": user.username, "latest_commit": commit}
+    response = client.patch("/api/changes", json=request_json)
+    assert response.status_code == 422
+
+    # The reviewer sends the assessment back to the trainee
+    request_json = {"reviewer_username": revuser.username, "latest_commit": commit}
+    response = client.patch("/api/changes", json=request_json)
+    assert response.status_code == 200
+    assert response.json() == {"Changes Requested": True}
+    db.expire_all()
+    assessment_tracker_entry = crud.get_assessment_tracker_entry(
+        db=db, user_id=user.id, assessment_id=assessment.id
+    )
+    assert assessment_tracker_entry.status == "Initiated"
+    assert assessment_tracker_entry.log[-1]["changes_requested"]
+
+    # Error if not under review anymore
+    response = client.patch("/api/changes", json=request_json)
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Assessment is not under review."}
+
+    # Review again, then failing checks send it back as well
+    response = client.post(
+        "/api/check", json={"latest_commit": commit, "passed": True}
+    )
+    assert response.status_code == 200
+    response = client.post("/api/review", json={"latest_commit": commit})
+    assert response.status_code == 200
+    response = client.post(
+        "/api/check", json={"latest_commit": commit, "passed": False}
+    )
+    assert response.status_code == 200
+    db.expire_all()
+    assessment_tracker_entry = crud.get_assessment_tracker_entry(
+        db=db, user_id=user.id, assessment_id=assessment.id
+    )
+    assert assessment_tracker_entry.status == "Initiated"
+
+    # Under review again for subsequent tests
+    response = client.post(
+        "/api/check", json={"latest_commit": commit, "passed": True}
+    )
+    response = client.post("/api/review", json={"latest_commit": commit})
+    assert response.status_code == 200
+
+
 def test_approve(client: TestClient, db: Session):
 
     db = next(get_db())
@@ -216,10 +372,16 @@ def test_approve(client: TestClient, db: Session):
         "latest_commit": assessment_tracker_entry.latest_commit,
     }
     response = client.patch("/api/approve", json=request_json)
+    assert response.status_code == 200
+    assert response.json() == {"Assessment Approved": True}
 
-    # Badge is missing
-    # TODO: Fix this so that it produces a 200 response
-    assert response.status_code == 422
+    # The badge is queued for the background worker
+    job = (
+        db.query(models.BadgeIssuanceJobs)
+        .filter(models.BadgeIssuanceJobs.tracker_id == assessment_tracker_entry.id)
+        .first()
+    )
+    assert job is not None
 
 
 def test_update(client: TestClient, db: Session):
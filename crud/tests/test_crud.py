@@ -1,12 +1,14 @@
 import random
 import string
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 import pytest
 import copy
 from app import crud, utils
 import app.db.models as models
-from app.dependencies import settings
+from app.dependencies import settings, SessionLocal
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 import time
 from datetime import datetime
 
@@ -150,7 +152,7 @@ def test_get_assessment_tracker_entry(db: Session):
         )
     except Exception:
         assessment_tracker_entry = models.AssessmentTracker(
-            assessment_id=assessment.id, user_id=user.id, latest_commit='sdjad8j', log={}, status="init"
+            assessment_id=assessment.id, user_id=user.id, latest_commit='sdjad8j', status="init"
         )
         db.add(assessment_tracker_entry)
         db.commit()
@@ -227,6 +229,58 @@ def test_select_reviewer(db: Session):
     assert reviewer.user_id != assessment_tracker_entry.user_id
 
 
+def test_select_reviewer_least_loaded(db: Session):
+
+    # get a valid assessment tracker entry
+    assessment_tracker_entry = db.query(models.AssessmentTracker).first()
+
+    # Reviewers who can review the assessment
+    reviewers = (
+        db.query(models.Reviewers)
+        .filter(
+            or_(
+                models.Reviewers.assessment_reviewing_id
+                == assessment_tracker_entry.assessment_id,
+                models.Reviewers.assessment_reviewing_id.is_(None),
+            )
+        )
+        .all()
+    )
+    others = [
+        reviewer
+        for reviewer in reviewers
+        if reviewer.user_id != assessment_tracker_entry.user_id
+    ]
+    if not others:
+        pytest.skip("No reviewer available for the assessment")
+    open_reviews = {reviewer.id: reviewer.open_reviews for reviewer in reviewers}
+
+    # Select outside of the testing environment
+    production_settings = settings.copy(update={"APP_ENV_NAME": "production"})
+    try:
+        # The submitter is excluded, even if less loaded
+        for reviewer in reviewers:
+            if reviewer.user_id == assessment_tracker_entry.user_id:
+                reviewer.open_reviews = 0
+            else:
+                reviewer.open_reviews = 10
+        # The least loaded reviewer is picked
+        others[-1].open_reviews = 1
+        db.commit()
+
+        reviewer = crud.select_reviewer(
+            db=db,
+            assessment_tracker_entry=assessment_tracker_entry,
+            settings=production_settings,
+        )
+        assert reviewer.id == others[-1].id
+        assert reviewer.user_id != assessment_tracker_entry.user_id
+    finally:
+        for reviewer in reviewers:
+            reviewer.open_reviews = open_reviews[reviewer.id]
+        db.commit()
+
+
 def test_approve_assessment(
     db: Session,
 ):
@@ -268,9 +322,7 @@ def test_approve_assessment(
     # Approve assessment
     approve_assess = crud.approve_assessment(
         db=db,
-        trainee=trainee,
-        assessment=assessment,
-        reviewer=reviewer,
+        assessment_tracker_entry=assessment_tracker_entry,
         reviewer_username=reviewer_username,
     )
     assert approve_assess
@@ -286,9 +338,7 @@ def test_approve_assessment(
     with pytest.raises(ValueError) as exc:
         crud.approve_assessment(
             db=db,
-            trainee=trainee,
-            assessment=assessment,
-            reviewer=reviewer,
+            assessment_tracker_entry=assessment_tracker_entry,
             reviewer_username=reviewer_username,
         )
     assert "Assessment is not under review." in str(exc.value)
@@ -310,9 +360,7 @@ def test_approve_assessment(
     with pytest.raises(ValueError) as exc:
         crud.approve_assessment(
             db=db,
-            trainee=trainee,
-            assessment=assessment,
-            reviewer=reviewer,
+            assessment_tracker_entry=assessment_tracker_entry,
             reviewer_username=reviewer_username,
         )
     assert "No reviewer is assigned to the assessment." in str(exc.value)
@@ -341,9 +389,7 @@ def test_approve_assessment(
     with pytest.raises(ValueError) as exc:
         crud.approve_assessment(
             db=db,
-            trainee=trainee,
-            assessment=assessment,
-            reviewer=reviewer,
+            assessment_tracker_entry=assessment_tracker_entry,
             reviewer_username=reviewer_username,
         )
     assert "Last commit checks failed." in str(exc.value)
@@ -362,15 +408,14 @@ def test_approve_assessment(
     )
     # Set reviewer id
     assessment_tracker_entry.reviewer_id = reviewer.id
+    db.commit()
     # Get wrong reviewer
     reviewer = crud.get_reviewer_by_username(db=db, username="brnbot3")
     reviewer_username = crud.get_user_by_id(db=db, user_id=reviewer.user_id).username
     with pytest.raises(ValueError) as exc:
         crud.approve_assessment(
             db=db,
-            trainee=trainee,
-            assessment=assessment,
-            reviewer=reviewer,
+            assessment_tracker_entry=assessment_tracker_entry,
             reviewer_username=reviewer_username,
         )
     assert (
@@ -386,9 +431,7 @@ def test_approve_assessment(
     with pytest.raises(ValueError) as exc:
         crud.approve_assessment(
             db=db,
-            trainee=trainee,
-            assessment=assessment,
-            reviewer=reviewer,
+            assessment_tracker_entry=assessment_tracker_entry,
             reviewer_username=reviewer_username,
         )
     assert "Reviewer cannot be the same as the trainee." in str(exc.value)
@@ -515,3 +558,122 @@ def test_update_assessment_log(db: Session):
             update_logs=copy.deepcopy(test_log),
         )
     assert "Assessment tracker entry unavailable." in str(exc.value)
+
+
+def test_transition_status(db: Session):
+
+    # Allowed and forbidden transitions
+    assert crud.can_transition(crud.PRE_ASSESSMENT, crud.INITIATED)
+    assert crud.can_transition(crud.UNDER_REVIEW, crud.APPROVED)
+    # Sent back to the trainee from review
+    assert crud.can_transition(crud.UNDER_REVIEW, crud.INITIATED)
+    assert not crud.can_transition(crud.PRE_ASSESSMENT, crud.APPROVED)
+    assert not crud.can_transition(crud.APPROVED, crud.INITIATED)
+    assert not crud.can_transition(crud.APPROVED, crud.APPROVED)
+
+    # Transient entry, not added to the database
+    assessment_tracker_entry = models.AssessmentTracker(
+        latest_commit="123456789", status=crud.PRE_ASSESSMENT
+    )
+
+    # Unsuccessful transition
+    with pytest.raises(ValueError) as exc:
+        crud.transition_status(
+            db=db,
+            assessment_tracker_entry=assessment_tracker_entry,
+            status=crud.APPROVED,
+        )
+    assert "Invalid status transition" in str(exc.value)
+    assert assessment_tracker_entry.status == crud.PRE_ASSESSMENT
+
+    # Successful transition, recorded as an event
+    event = crud.transition_status(
+        db=db,
+        assessment_tracker_entry=assessment_tracker_entry,
+        status=crud.INITIATED,
+    )
+    assert assessment_tracker_entry.status == crud.INITIATED
+    assert event.data["from_status"] == crud.PRE_ASSESSMENT
+    assert assessment_tracker_entry.log[-1]["status"] == crud.INITIATED
+    db.rollback()
+
+
+def test_count_assessment_tracker_by_status(db: Session):
+    counts = crud.count_assessment_tracker_by_status(db=db)
+    assert sum(counts.values()) == db.query(models.AssessmentTracker).count()
+    for status, count in counts.items():
+        assert count == (
+            db.query(models.AssessmentTracker)
+            .filter(models.AssessmentTracker.status == status)
+            .count()
+        )
+
+
+def test_badge_issuance_jobs(db: Session):
+
+    # get a valid assessment tracker entry
+    assessment_tracker_entry = db.query(models.AssessmentTracker).first()
+
+    # Queue a job
+    job = crud.enqueue_badge_issuance(
+        db=db, assessment_tracker_entry=assessment_tracker_entry
+    )
+    db.commit()
+    assert job.status == "pending"
+
+    # Claim a due job
+    claimed = crud.claim_badge_issuance_job(db=db, lease=300)
+    assert claimed is not None
+    assert claimed.status == "running"
+    assert claimed.next_attempt_at > datetime.utcnow()
+
+    # Failed attempt, retried later
+    job.attempts = 1
+    assert crud.fail_badge_issuance_job(
+        db=db, job=job, error="Test error", max_attempts=2, backoff=30
+    )
+    assert job.status == "pending"
+    assert job.next_attempt_at > datetime.utcnow()
+
+    # Last failed attempt
+    job.attempts = 2
+    assert not crud.fail_badge_issuance_job(
+        db=db, job=job, error="Test error", max_attempts=2, backoff=30
+    )
+    assert job.status == "failed"
+    assert job.tracker.log[-1]["badge_issuance_failed"] == "Test error"
+
+    # Done
+    crud.complete_badge_issuance_job(db=db, job=job, assertion_id="Test")
+    assert job.status == "done"
+    assert job.assertion_id == "Test"
+    assert job.tracker.log[-1]["badge_issued"] == "Test"
+
+
+def test_assessment_tracker_version_conflict(db: Session):
+
+    # get a valid assessment tracker entry
+    assessment_tracker_entry = db.query(models.AssessmentTracker).first()
+    version_id = assessment_tracker_entry.version_id
+
+    # Load the same entry in a second session
+    other_db = SessionLocal()
+    try:
+        stale_entry = (
+            other_db.query(models.AssessmentTracker)
+            .filter(models.AssessmentTracker.id == assessment_tracker_entry.id)
+            .first()
+        )
+
+        # Update in the first session
+        assessment_tracker_entry.last_updated = datetime.utcnow()
+        db.commit()
+        assert assessment_tracker_entry.version_id == version_id + 1
+
+        # The update from the stale copy is rejected
+        stale_entry.last_updated = datetime.utcnow()
+        with pytest.raises(StaleDataError):
+            other_db.commit()
+        other_db.rollback()
+    finally:
+        other_db.close()
@@ -65,21 +65,17 @@ def test_verify_check(db: Session):
         )
     assert "Check results not available for latest commit." in str(exc.value)
 
-    # Fail due to missing logs
-    assessment_tracker_entry.log = None
-    with pytest.raises(ValueError) as exc:
-        utils.verify_check(
-            assessment_tracker_entry=assessment_tracker_entry,
-        )
-    assert "No logs found." in str(exc.value)
-
-    # Fail due to missing log for last commit
-    assessment_tracker_entry.log = [{"commit": "123456789"}]
+    # Fail due to checks run on another commit
+    other_commit_entry = models.AssessmentTracker(
+        latest_commit=assessment_tracker_entry.latest_commit,
+        last_check_commit="123456789",
+        last_check_passed=True,
+    )
     with pytest.raises(ValueError) as exc:
         utils.verify_check(
-            assessment_tracker_entry=assessment_tracker_entry,
+            assessment_tracker_entry=other_commit_entry,
         )
-    assert "No logs found for latest commit." in str(exc.value)
+    assert "Check results not available for latest commit." in str(exc.value)
 
     # Checks passed
     crud.update_assessment_log(
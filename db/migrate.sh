@@ -0,0 +1,28 @@
+#!/bin/bash
+# Apply the scripts of a migrations directory (db/migrations/) which are not
+# applied yet, in order, and record each one in the schema_migrations table.
+#
+# Usage: migrate.sh <migrations directory> <mysql options and database>
+# e.g. MYSQL_PWD=... bash db/migrate.sh db/migrations -h $MYSQL_HOST -u $MYSQL_USER $MYSQL_DATABASE
+
+set -euo pipefail
+
+migrations_dir=$1
+shift
+
+mysql "$@" -e "CREATE TABLE IF NOT EXISTS schema_migrations (
+    name VARCHAR(250) NOT NULL,
+    applied_at DATETIME NOT NULL,
+    PRIMARY KEY (name)
+)"
+applied=$(mysql "$@" -N -B -e "SELECT name FROM schema_migrations")
+
+for script in "$migrations_dir"/*.sql; do
+    name=$(basename "$script")
+    if grep -qxF "$name" <<< "$applied"; then
+        continue
+    fi
+    echo "Applying migration $name"
+    mysql "$@" < "$script"
+    mysql "$@" -e "INSERT INTO schema_migrations (name, applied_at) VALUES ('$name', NOW())"
+done
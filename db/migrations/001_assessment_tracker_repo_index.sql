@@ -0,0 +1,4 @@
+-- Index the tracker entries by repository, for the lookup done by ghbot
+-- on each webhook (see `is_valid_repo` in ghbot/bot/utils.py)
+CREATE INDEX ix_assessment_tracker_repo
+    ON assessment_tracker (repo_owner, repo_name);
@@ -0,0 +1,44 @@
+-- Move the assessment tracker log to an append-only table, one row per
+-- event (see `AssessmentEvents` in crud/app/db/models.py)
+CREATE TABLE IF NOT EXISTS assessment_events (
+    id INTEGER NOT NULL AUTO_INCREMENT,
+    tracker_id INTEGER NOT NULL,
+    `commit` VARCHAR(250),
+    status VARCHAR(250),
+    created_at DATETIME NOT NULL,
+    data JSON NOT NULL,
+    PRIMARY KEY (id),
+    UNIQUE (id),
+    INDEX ix_assessment_events_id (id),
+    INDEX ix_assessment_events_tracker_commit (tracker_id, `commit`, created_at),
+    CONSTRAINT fk_assessment_events_assessment_tracker
+        FOREIGN KEY (tracker_id) REFERENCES assessment_tracker (id)
+        ON DELETE CASCADE
+);
+
+-- Copy the existing logs, in order, for the entries without events yet
+-- (the log column is kept, but no longer written to)
+INSERT INTO assessment_events (tracker_id, `commit`, status, created_at, data)
+SELECT
+    t.id,
+    j.`commit`,
+    j.status,
+    COALESCE(j.created_at, t.last_updated, NOW()),
+    j.data
+FROM assessment_tracker t,
+    JSON_TABLE(
+        t.log,
+        '$[*]' COLUMNS (
+            seq FOR ORDINALITY,
+            `commit` VARCHAR(250) PATH '$.commit',
+            status VARCHAR(250) PATH '$.status',
+            created_at DATETIME(6) PATH '$.timestamp' NULL ON ERROR,
+            data JSON PATH '$'
+        )
+    ) AS j
+WHERE NOT EXISTS (
+    SELECT 1 FROM assessment_events e WHERE e.tracker_id = t.id
+)
+ORDER BY t.id, j.seq;
+
+ALTER TABLE assessment_tracker MODIFY log JSON NOT NULL DEFAULT (JSON_ARRAY());
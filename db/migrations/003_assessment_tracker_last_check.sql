@@ -0,0 +1,21 @@
+-- Keep the result of the last automated checks on the tracker entry, so
+-- approvals don't read the log (see `verify_check` in crud/app/utils/utils.py)
+ALTER TABLE assessment_tracker
+    ADD COLUMN last_check_commit VARCHAR(250),
+    ADD COLUMN last_check_passed BOOLEAN,
+    ADD COLUMN last_check_at DATETIME;
+
+-- Fill them from the last check event of each entry
+UPDATE assessment_tracker t
+JOIN (
+    SELECT tracker_id, MAX(id) AS id
+    FROM assessment_events
+    WHERE JSON_CONTAINS_PATH(data, 'one', '$.checks_passed')
+    GROUP BY tracker_id
+) last_check ON last_check.tracker_id = t.id
+JOIN assessment_events e ON e.id = last_check.id
+SET
+    t.last_check_commit = e.`commit`,
+    t.last_check_passed =
+        JSON_UNQUOTE(JSON_EXTRACT(e.data, '$.checks_passed')) = 'true',
+    t.last_check_at = e.created_at;
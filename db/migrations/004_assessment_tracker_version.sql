@@ -0,0 +1,5 @@
+-- Version of each tracker entry, checked and incremented by every update
+-- (optimistic concurrency control, see `version_id_col` in
+-- crud/app/db/models.py)
+ALTER TABLE assessment_tracker
+    ADD COLUMN version_id INTEGER NOT NULL DEFAULT 1;
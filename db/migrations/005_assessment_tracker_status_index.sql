@@ -0,0 +1,4 @@
+-- Index the tracker entries by status, for the per-status counts
+-- (see `/api/stats/status` in crud/app/api/api_endpoints.py)
+CREATE INDEX ix_assessment_tracker_status
+    ON assessment_tracker (status);
@@ -0,0 +1,16 @@
+-- Open review counts of the reviewers, and the index used to pick the
+-- least loaded eligible reviewer (see `select_reviewer` in
+-- crud/app/crud/crud.py)
+ALTER TABLE reviewers
+    ADD COLUMN open_reviews INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX ix_reviewers_pool
+    ON reviewers (assessment_reviewing_id, open_reviews, id);
+
+-- Count the entries currently under review by each reviewer
+UPDATE reviewers r
+SET r.open_reviews = (
+    SELECT COUNT(*)
+    FROM assessment_tracker t
+    WHERE t.reviewer_id = r.id AND t.status = 'Under review'
+);
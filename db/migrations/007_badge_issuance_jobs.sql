@@ -0,0 +1,20 @@
+-- Outbox of the badges to issue for approved assessments, processed by
+-- the CRUD app's background worker (see crud/app/worker.py)
+CREATE TABLE IF NOT EXISTS badge_issuance_jobs (
+    id INTEGER NOT NULL AUTO_INCREMENT,
+    tracker_id INTEGER NOT NULL,
+    status VARCHAR(250) NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME NOT NULL,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    last_error TEXT,
+    assertion_id VARCHAR(250),
+    PRIMARY KEY (id),
+    UNIQUE (id),
+    INDEX ix_badge_issuance_jobs_id (id),
+    INDEX ix_badge_issuance_jobs_due (status, next_attempt_at),
+    CONSTRAINT fk_badge_issuance_jobs_assessment_tracker
+        FOREIGN KEY (tracker_id) REFERENCES assessment_tracker (id)
+        ON DELETE CASCADE
+);
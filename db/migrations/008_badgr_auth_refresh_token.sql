@@ -0,0 +1,3 @@
+-- Refresh token of the cached Badgr bearer token, shared by the CRUD app
+-- and the sync lambda
+ALTER TABLE badgr_auth ADD COLUMN refresh_token VARCHAR(250);
@@ -0,0 +1,7 @@
+-- High-water marks of the sync lambda's incremental syncs
+CREATE TABLE IF NOT EXISTS sync_state (
+    name VARCHAR(250) NOT NULL,
+    high_water_mark DATETIME,
+    updated_at DATETIME,
+    PRIMARY KEY (name)
+);
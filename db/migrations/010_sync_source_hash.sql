@@ -0,0 +1,5 @@
+-- Hash of the values written by the sync lambda, so unchanged rows are
+-- not rewritten (rows without a hash are rewritten once)
+ALTER TABLE assessments ADD COLUMN source_hash VARCHAR(64);
+ALTER TABLE badges ADD COLUMN source_hash VARCHAR(64);
+ALTER TABLE assertions ADD COLUMN source_hash VARCHAR(64);
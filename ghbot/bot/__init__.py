@@ -3,3 +3,10 @@ from .dependencies import *
 from .utils import *
 from .schemas import *
 from .auth import *
+from .jobs import *
+from .templates import *
+from .client import *
+from .ratelimit import *
+from .deliveries import *
+from .webhooks import *
+from .repos import *
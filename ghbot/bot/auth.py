@@ -1,8 +1,9 @@
-import os
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-import json
-import requests
 from bot import dependencies
+from bot.client import gh_client
 
 
 def get_access_token(installation_id, jwt) -> dict:
@@ -23,7 +24,7 @@ def get_access_token(installation_id, jwt) -> dict:
     request_url = (
         f"{dependencies.gh_url}/app/installations/{installation_id}/access_tokens"
     )
-    response = requests.post(request_url, headers=headers)
+    response = gh_client.post(request_url, headers=headers)
     response_dict = response.json()
     print(response_dict)
     response.raise_for_status()
@@ -31,60 +32,177 @@ def get_access_token(installation_id, jwt) -> dict:
     return response_dict
 
 
-def get_all_access_tokens(installation_ids, jwt) -> dict:
+class TokenManager:
     """
-    Get the access tokens for the installations
+    In-memory cache of the installation access tokens
+
+    Holds one token per installation. Each token is refreshed in the
+    background shortly before GitHub expires it, and only one refresh per
+    installation runs at a time.
     """
 
-    print("Getting access tokens")
-    # Get the access tokens for the installations
-    print(installation_ids.items())
-    try:
-        token_dict = {
-            installation_id: get_access_token(installation_id, jwt)["token"]
-            for training, installation_id in installation_ids.items()
-        }
-    except KeyError:
-        token_dict = {}
-
-    # Save the access tokens along with the expiration time
-    current_tokens = {
-        "time": datetime.now(),
-        "expires": datetime.now() + timedelta(hours=1),
-        "tokens": token_dict,
-    }
+    def __init__(self, refresh_margin: timedelta):
+        self.refresh_margin = refresh_margin
+        self.tokens = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+        self.install_locks = {}
+
+    def get(self, installation_id: int) -> str:
+        """
+        Get a valid access token for the installation, minting it if needed
+
+        Args:
+            installation_id: The installation ID
+
+        Returns:
+            The access token
+        """
+        token = self.tokens.get(installation_id)
+        if token is not None and token["expires_at"] > datetime.utcnow():
+            return token["token"]
+        return self.refresh(installation_id, force=False)
+
+    def refresh(self, installation_id: int, force: bool = True) -> str:
+        """
+        Mint a new access token for the installation
+
+        Args:
+            installation_id: The installation ID
+            force: Mint even if the cached token is still valid
+
+        Returns:
+            The access token
+        """
+        with self.lock:
+            install_lock = self.install_locks.setdefault(
+                installation_id, threading.Lock()
+            )
 
-    # Save the access tokens to a file
-    with open(dependencies.token_fp, "w") as f:
-        json.dump(current_tokens, f, indent=4, sort_keys=True, default=str)
+        # Only one refresh in flight per installation
+        with install_lock:
+            token = self.tokens.get(installation_id)
+            if (
+                not force
+                and token is not None
+                and token["expires_at"] > datetime.utcnow()
+            ):
+                # Refreshed while waiting for the lock
+                return token["token"]
+            print(f"Getting access token: {installation_id}")
+            jwt = dependencies.git_integration.create_jwt()
+            response_dict = get_access_token(installation_id, jwt=jwt)
+            # GitHub returns the expiry time, e.g. "2016-07-11T22:14:10Z"
+            expires_at = datetime.strptime(
+                response_dict["expires_at"], "%Y-%m-%dT%H:%M:%SZ"
+            )
+            self.tokens[installation_id] = {
+                "token": response_dict["token"],
+                "expires_at": expires_at,
+            }
+        self.schedule(installation_id, expires_at - self.refresh_margin)
+        return response_dict["token"]
 
-    # Return the access tokens
-    return current_tokens
+    def warm(self, installation_ids: list) -> dict:
+        """
+        Mint the tokens for several installations concurrently
 
+        Args:
+            installation_ids: The installation IDs
 
-def retrieve_access_tokens():
+        Returns:
+            Dict mapping each installation ID to its error, for the
+            installations which failed
+        """
+        errors = {}
+        with ThreadPoolExecutor(
+            max_workers=dependencies.token_mint_workers
+        ) as executor:
+            futures = {
+                installation_id: executor.submit(self.get, installation_id)
+                for installation_id in installation_ids
+            }
+            for installation_id, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Token warm-up failed: {installation_id}: {e}")
+                    errors[installation_id] = str(e)
+        return errors
+
+    def schedule(self, installation_id: int, when: datetime):
+        """
+        Refresh the installation token in the background at the given time
+        """
+        delay = max((when - datetime.utcnow()).total_seconds(), 0)
+        timer = threading.Timer(
+            delay, self._background_refresh, args=[installation_id]
+        )
+        timer.daemon = True
+        with self.lock:
+            previous = self.timers.get(installation_id)
+            if previous is not None:
+                previous.cancel()
+            self.timers[installation_id] = timer
+        timer.start()
+
+    def _background_refresh(self, installation_id: int):
+        try:
+            self.refresh(installation_id)
+        except Exception as e:
+            # Keep using the current token and try again shortly
+            print(f"Token refresh failed: {installation_id}: {e}")
+            self.schedule(
+                installation_id,
+                datetime.utcnow() + dependencies.token_retry_interval,
+            )
+
+
+class LazyTokens(Mapping):
     """
-    Load the access tokens from the file and regenerate if expired
+    Read-only mapping of installation ID (str) to access token
+
+    Tokens are only minted for the installations actually looked up.
     """
-    # Create tokens if file doesn't exist
-    if not os.path.exists(dependencies.token_fp):
-        print("Getting jwt")
-        jwt = dependencies.git_integration.create_jwt()
-        print("Getting tokens")
-        get_all_access_tokens(dependencies.installation_ids, jwt=jwt)
-    with open(dependencies.token_fp, "r") as f:
-        current_tokens = json.load(f)
-    exp_time = datetime.strptime(
-        current_tokens["expires"], "%Y-%m-%d %H:%M:%S.%f"
-    )
-    if exp_time < datetime.now():
-        print("EXPIRED")
-        print("Getting jwt")
-        jwt = dependencies.git_integration.create_jwt()
-        print("Getting tokens")
-        get_all_access_tokens(dependencies.installation_ids, jwt=jwt)
-    else:
-        print("NOT EXPIRED")
-    with open(dependencies.token_fp, "r") as f:
-        current_tokens = json.load(f)
-        return current_tokens
+
+    def __init__(self, manager: TokenManager, installation_ids: list):
+        self.manager = manager
+        self.installation_ids = [str(i) for i in installation_ids]
+
+    def __getitem__(self, installation_id: str) -> str:
+        if str(installation_id) not in self.installation_ids:
+            raise KeyError(installation_id)
+        return self.manager.get(int(installation_id))
+
+    def __iter__(self):
+        return iter(self.installation_ids)
+
+    def __len__(self) -> int:
+        return len(self.installation_ids)
+
+    def __contains__(self, installation_id) -> bool:
+        return str(installation_id) in self.installation_ids
+
+
+# Tokens shared by all requests in this process
+token_manager = TokenManager(refresh_margin=dependencies.token_refresh_margin)
+
+
+def retrieve_access_tokens() -> dict:
+    """
+    Get the access tokens for the installations from the token manager
+
+    The tokens are minted lazily, when looked up by installation ID.
+    """
+    return {
+        "tokens": LazyTokens(
+            token_manager, list(dependencies.installation_ids.values())
+        )
+    }
+
+
+def warm_access_tokens() -> dict:
+    """
+    Mint the tokens for all installations ahead of the first request
+    """
+    return token_manager.warm(list(dependencies.installation_ids.values()))
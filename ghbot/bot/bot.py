@@ -1,8 +1,11 @@
-import requests
+import httpx
 import random
 import copy
 from bot.dependencies import Settings
-from bot import utils, dependencies, schemas
+from bot import utils, dependencies, jobs, schemas
+from bot.client import crud_client
+from bot.repos import repo_cache
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 class Bot:
@@ -69,7 +72,43 @@ class Bot:
             "conclusion": payload["workflow_run"]["conclusion"],
         }
 
-    def process_cmd(self, payload: dict, access_tokens: dict):
+    async def process_webhook(
+        self, event: str, payload: dict, access_tokens: dict, db: AsyncSession
+    ):
+        """
+        Process a webhook delivery and run the appropriate bot function
+
+        Args:
+            event: The GitHub event name
+            payload: The webhook payload
+            access_tokens: The installation access tokens
+            db: The async DB session
+        """
+        action = payload["action"]
+        if event == "issue_comment" and action == "created":
+            # Check if comment is for the bot and the repo is valid
+            if utils.is_for_bot(payload) and await utils.is_valid_repo(
+                payload, db=db
+            ):
+                sender = payload["sender"]["login"]
+                message = payload["comment"]["body"]
+                print(sender + ": " + message)
+                return await self.process_cmd(
+                    payload, access_tokens=access_tokens
+                )
+        elif utils.is_pr_commit(payload=payload, event=event):
+            print("is PR commit")
+            return await self.process_commit(
+                payload, access_tokens=access_tokens
+            )
+        elif utils.is_workflow_run(payload=payload):
+            print("is workflow run")
+            return await self.process_done_check(
+                payload, access_tokens=access_tokens
+            )
+        return None
+
+    async def process_cmd(self, payload: dict, access_tokens: dict):
         """
         Process the command and run the appropriate bot function
 
@@ -78,13 +117,13 @@ class Bot:
         """
         if utils.is_for_bot(payload):
             cmd = payload["comment"]["body"].split(" ")[1]
-            return getattr(self, str(cmd), self.invalid)(
+            return await getattr(self, str(cmd), self.invalid)(
                 payload, access_tokens=access_tokens
             )
         else:
             return None
 
-    def process_commit(self, payload: dict, access_tokens: dict):
+    async def process_commit(self, payload: dict, access_tokens: dict):
         """
         Process the commit and run the update function
         """
@@ -102,7 +141,7 @@ class Bot:
             "latest_commit": kwarg_dict["last_commit"],
             "log": {"message": log},
         }
-        response = requests.patch(
+        response = await crud_client.patch(
             request_url,
             json=body,
         )
@@ -113,11 +152,11 @@ class Bot:
                 + kwarg_dict["last_commit"]
                 + "\n\nRun `@brnbot check` to test your code."
             )
-            utils.post_comment(text, **kwarg_dict)
+            await utils.post_comment(text, **kwarg_dict)
             return response
-        except requests.exceptions.HTTPError as e:  # pragma: no cover
+        except httpx.HTTPStatusError as e:  # pragma: no cover
             err = f"**Error**: {response.json()['detail']}"
-            utils.post_comment(err, **kwarg_dict)
+            await utils.post_comment(err, **kwarg_dict)
             raise e
         except Exception as e:  # pragma: no cover
             err = (
@@ -125,15 +164,34 @@ class Bot:
                 + "\n\n"
                 + "**Please contact the maintainer for this bot.**"
             )
-            utils.post_comment(err, **kwarg_dict)
+            await utils.post_comment(err, **kwarg_dict)
             raise e
 
     def process_init_payload(
-        self, init_request: schemas.InitBotRequest, access_tokens: dict, seed: int=None
+        self,
+        init_request: schemas.InitBotRequest,
+        access_tokens: dict,
+        seed: int = None,
+        progress=None,
     ):
         """
         Process the init payload
+
+        Args:
+            init_request: The init request
+            access_tokens: The installation access tokens
+            seed: Optional seed for the random repo suffix
+            progress: Optional callback, called with the name of each step
+                before it runs
+
+        Returns:
+            The URL of the new repo and the SHA of its latest commit
         """
+        if progress is None:
+
+            def progress(step):
+                return None
+
         access_token = access_tokens["tokens"][str(init_request.install_id)]
 
         # Get 6 random numbers and letters
@@ -151,40 +209,140 @@ class Bot:
 
         # Create a repo, and upload the code, and create a branch
         print(f"Creating repo: {repo_name}")
+        progress("create_repo")
         tmp_sha = utils.init_create_repo(
             init_request=init_request,
             repo_name=repo_name,
             access_token=access_token,
         )
         print(f"Filling repo: {repo_name}")
-        utils.init_fill_repo(
-            init_request, 
-            repo_name=repo_name, 
-            access_token=access_token,
-            settings=self.settings,
-        )
-        print(f"Creating feedback branch: {repo_name}")
-        utils.init_create_feedback_branch(
-            init_request, repo_name=repo_name, access_token=access_token
-        )
-        print(f"Deleting .tmp file: {repo_name}")
-        latest_commit = utils.init_delete_tmp(
-            init_request,
-            repo_name=repo_name,
-            access_token=access_token,
-            tmp_sha=tmp_sha,
-        )
+        progress("fill_repo")
+        if dependencies.init_bulk_upload:
+            # Single commit upload, which also replaces the .tmp file
+            template_sha, latest_commit = utils.init_fill_repo(
+                init_request,
+                repo_name=repo_name,
+                access_token=access_token,
+                settings=self.settings,
+            )
+            print(f"Creating feedback branch: {repo_name}")
+            progress("create_feedback_branch")
+            utils.init_create_feedback_branch(
+                init_request,
+                repo_name=repo_name,
+                access_token=access_token,
+                sha=template_sha,
+            )
+        else:
+            utils.init_fill_repo(
+                init_request,
+                repo_name=repo_name,
+                access_token=access_token,
+                settings=self.settings,
+                bulk=False,
+            )
+            print(f"Creating feedback branch: {repo_name}")
+            progress("create_feedback_branch")
+            utils.init_create_feedback_branch(
+                init_request, repo_name=repo_name, access_token=access_token
+            )
+            print(f"Deleting .tmp file: {repo_name}")
+            progress("delete_tmp")
+            latest_commit = utils.init_delete_tmp(
+                init_request,
+                repo_name=repo_name,
+                access_token=access_token,
+                tmp_sha=tmp_sha,
+            )
         print(f"Creating PR: {repo_name}")
+        progress("create_pr")
         http_repo = utils.init_create_pr(
             init_request, repo_name=repo_name, access_token=access_token
         )
         print(f"Adding collaborator: {repo_name}")
+        progress("add_collaborator")
         utils.init_add_collaborator(
             init_request, repo_name=repo_name, access_token=access_token
         )
 
         return http_repo, latest_commit
 
+    def process_init_job(
+        self,
+        init_request: schemas.InitBotRequest,
+        access_tokens: dict,
+        job_id: str,
+        progress,
+        note,
+    ):
+        """
+        Run the init payload as a background job and report the outcome
+        to the CRUD app
+
+        The job's result is the provisioning result. The delivery of the
+        callback is recorded apart (the "notify" note), so a repo which was
+        provisioned is not reported as a failed job if the callback fails,
+        and a provisioning error is not hidden by a callback error.
+        """
+        body = {
+            "job_id": job_id,
+            "user_id": init_request.user_id,
+            "assessment_id": init_request.assessment_id,
+        }
+        try:
+            http_repo, latest_commit = self.process_init_payload(
+                init_request, access_tokens=access_tokens, progress=progress
+            )
+            body.update(
+                {
+                    "status": "complete",
+                    "github_url": http_repo,
+                    "latest_commit": latest_commit,
+                }
+            )
+        except Exception as e:
+            body.update({"status": "failed", "detail": str(e)})
+            self.notify_init_complete(body, note=note)
+            raise e
+
+        self.notify_init_complete(body, note=note)
+        # The tracker entry now points at the new repo
+        repo_name = http_repo.split("/")[-1]
+        repo_cache.invalidate(init_request.github_org, repo_name)
+        return {"github_url": http_repo, "latest_commit": latest_commit}
+
+    def notify_init_complete(self, body: dict, note):
+        """
+        Send the outcome of an init job to the CRUD app
+
+        The callback goes through the pooled CRUD client, and is retried on
+        network errors, 5xx and conflicts (the CRUD app accepts the same
+        outcome twice). Errors are recorded with `note` and not raised.
+
+        Args:
+            body: The outcome of the job
+            note: The job's callback recording the outcome of the callback
+
+        Returns:
+            True if the CRUD app was notified
+        """
+        if body["user_id"] is None or body["assessment_id"] is None:
+            # Not started by the CRUD app, so nobody is waiting for it
+            note("notify", {"status": "skipped"})
+            return False
+        request_url = f"{self.CRUD_APP_URL}/api/init/complete"
+        try:
+            response = jobs.init_queue.run_async(
+                crud_client.post(request_url, json=body, idempotent=True)
+            )
+            response.raise_for_status()
+        except Exception as e:
+            print(f"Init job {body['job_id']}: CRUD app not notified: {e}")
+            note("notify", {"status": "failed", "error": str(e)})
+            return False
+        note("notify", {"status": "done"})
+        return True
+
     def process_delete_repo(
         self, delete_request: schemas.DeleteBotRequest, access_tokens: dict
     ):
@@ -196,11 +354,14 @@ class Bot:
             delete_request=delete_request,
             access_token=access_token,
         )
+        repo_cache.invalidate(
+            delete_request.github_org, delete_request.repo_name
+        )
         return True
 
     # Bot commands #
 
-    def invalid(self, payload: dict, access_tokens: dict):
+    async def invalid(self, payload: dict, access_tokens: dict):
         """
         Return an error message
         """
@@ -208,10 +369,10 @@ class Bot:
             payload, access_tokens=access_tokens
         )
         text = "Invalid command. Try @brnbot help"
-        utils.post_comment(text, **kwarg_dict)
+        await utils.post_comment(text, **kwarg_dict)
         return True
 
-    def hello(self, payload: dict, access_tokens: dict):
+    async def hello(self, payload: dict, access_tokens: dict):
         """
         Say hello to the user
         """
@@ -220,10 +381,10 @@ class Bot:
         )
         text = f"Hello, @{kwarg_dict['sender']}! 😊"
         print("Hello")
-        utils.post_comment(text, **kwarg_dict)
+        await utils.post_comment(text, **kwarg_dict)
         return True
 
-    def help(self, payload: dict, access_tokens: dict):
+    async def help(self, payload: dict, access_tokens: dict):
         """
         Return a list of commands
         """
@@ -238,10 +399,10 @@ class Bot:
             desc = self.cmds_descriptions[cmd]
             text += f"\t* {desc}\n"
 
-        utils.post_comment(text, **kwarg_dict)
+        await utils.post_comment(text, **kwarg_dict)
         return True
 
-    def check(self, payload: dict, access_tokens: dict):
+    async def check(self, payload: dict, access_tokens: dict):
         """
         Check the skill assessment using automated tests via API
         """
@@ -250,18 +411,18 @@ class Bot:
         )
         actions_url = f"{self.gh_http}/{kwarg_dict['owner']}/{kwarg_dict['repo_name']}/actions/"
         try:
-            response = utils.dispatch_workflow(**kwarg_dict)
+            response = await utils.dispatch_workflow(**kwarg_dict)
             response.raise_for_status()
             text = (
                 "Automated checks ✅ in progress ⏳. View them here: [`link`]("
                 + actions_url
                 + ")"
             )
-            utils.post_comment(text, **kwarg_dict)
+            await utils.post_comment(text, **kwarg_dict)
             return True
-        except requests.exceptions.HTTPError as e:  # pragma: no cover
+        except httpx.HTTPStatusError as e:  # pragma: no cover
             err = f"**Error**: {str(e)}" + "\n"
-            utils.post_comment(err, **kwarg_dict)
+            await utils.post_comment(err, **kwarg_dict)
             raise e
         except Exception as e:  # pragma: no cover
             err = (
@@ -269,10 +430,10 @@ class Bot:
                 + "\n\n"
                 + "**Please contact the maintainer for this bot.**"
             )
-            utils.post_comment(err, **kwarg_dict)
+            await utils.post_comment(err, **kwarg_dict)
             raise e
 
-    def process_done_check(self, payload: dict, access_tokens: dict):
+    async def process_done_check(self, payload: dict, access_tokens: dict):
         kwarg_dict = self.parse_workflow_run_payload(
             payload, access_tokens=access_tokens
         )
@@ -280,11 +441,12 @@ class Bot:
         print(kwarg_dict)
 
         # Confirm that latest commit is the same as the one in the database
-        latest_commit = utils.get_last_commit(
+        last_commit = await utils.get_last_commit(
             owner=kwarg_dict["owner"],
             repo_name=kwarg_dict["repo_name"],
             access_token=kwarg_dict["access_token"],
-        )["sha"]
+        )
+        latest_commit = last_commit["sha"]
         if latest_commit != kwarg_dict["last_commit"]:
             msg = (
                 "Checks are complete 🔥! However, the current commit has changed"
@@ -292,14 +454,14 @@ class Bot:
                 + "checks were initiated. Re-run the checks with `@brnbot"
                 " check`."
             )
-            utils.post_comment(msg, **kwarg_dict)
+            await utils.post_comment(msg, **kwarg_dict)
             return None
 
         # Check the skill assessment in the database using API
         passed = kwarg_dict["conclusion"] != "failure"
         request_url = f"{self.CRUD_APP_URL}/api/check"
         body = {"latest_commit": latest_commit, "passed": passed}
-        response = requests.post(
+        response = await crud_client.post(
             request_url,
             json=body,
         )
@@ -324,7 +486,7 @@ class Bot:
                     + actions_url
                     + ")"
                 )
-            utils.post_comment(text, **kwarg_dict)
+            await utils.post_comment(text, **kwarg_dict)
             if not response.json()["review_required"] and passed:
                 # Approve the assessment and issue badge
                 kwarg_dict2 = copy.deepcopy(kwarg_dict)
@@ -332,13 +494,13 @@ class Bot:
                     "sender"
                 ] = "brnbot"  # Set the sender as brnbot to avoid error
                 kwarg_dict2['CRUD_APP_URL'] = self.CRUD_APP_URL
-                response = utils.approve_assessment(**kwarg_dict2)
+                response = await utils.approve_assessment(**kwarg_dict2)
                 return response
             else:
                 return response
-        except requests.exceptions.HTTPError as e:  # pragma: no cover
+        except httpx.HTTPStatusError as e:  # pragma: no cover
             err = f"**Error**: {response.json()['detail']}" + "\n"
-            utils.post_comment(err, **kwarg_dict)
+            await utils.post_comment(err, **kwarg_dict)
             raise e
         except Exception as e:  # pragma: no cover
             err = (
@@ -346,10 +508,10 @@ class Bot:
                 + "\n\n"
                 + "**Please contact the maintainer for this bot.**"
             )
-            utils.post_comment(err, **kwarg_dict)
+            await utils.post_comment(err, **kwarg_dict)
             raise e
 
-    def review(self, payload: dict, access_tokens: dict):
+    async def review(self, payload: dict, access_tokens: dict):
         """
         Find a reviewer for the assessment via API
         """
@@ -358,33 +520,34 @@ class Bot:
         )
         # Find a reviewer for the assessment in the database using API
         request_url = f"{self.CRUD_APP_URL}/api/review"
+        last_commit = await utils.get_last_commit(
+            owner=kwarg_dict["owner"],
+            repo_name=kwarg_dict["repo_name"],
+            access_token=kwarg_dict["access_token"],
+        )
         body = {
-            "latest_commit": utils.get_last_commit(
-                owner=kwarg_dict["owner"],
-                repo_name=kwarg_dict["repo_name"],
-                access_token=kwarg_dict["access_token"],
-            )["sha"],
+            "latest_commit": last_commit["sha"],
         }
         print(body)
-        response = requests.post(
+        response = await crud_client.post(
             request_url,
             json=body,
         )
         try:
             response.raise_for_status()
             reviewer = response.json()["reviewer_username"]
-            utils.assign_reviewer(reviewer, **kwarg_dict)
+            await utils.assign_reviewer(reviewer, **kwarg_dict)
             text = (
                 "Reviewer assigned 🔥. Welcome @"
                 + response.json()["reviewer_username"]
                 + "!"
             )
-            utils.post_comment(text, **kwarg_dict)
+            await utils.post_comment(text, **kwarg_dict)
             return response
-        except requests.exceptions.HTTPError as e:  # pragma: no cover
+        except httpx.HTTPStatusError as e:  # pragma: no cover
             print(str(e))
             err = f"**Error**: {e}" + "\n"
-            utils.post_comment(err, **kwarg_dict)
+            await utils.post_comment(err, **kwarg_dict)
             raise e
         except Exception as e:  # pragma: no cover
             err = (
@@ -392,10 +555,10 @@ class Bot:
                 + "\n\n"
                 + "**Please contact the maintainer for this bot.**"
             )
-            utils.post_comment(err, **kwarg_dict)
+            await utils.post_comment(err, **kwarg_dict)
             raise e
 
-    def unreview(self, payload: dict, access_tokens: dict):
+    async def unreview(self, payload: dict, access_tokens: dict):
         """
         Remove a reviewer for the assessment via API
         """
@@ -403,18 +566,18 @@ class Bot:
             payload, access_tokens=access_tokens
         )
         # Remove a reviewer from the github api
-        response = utils.get_reviewer(**kwarg_dict)
+        response = await utils.get_reviewer(**kwarg_dict)
         try:
             response.raise_for_status()
             reviewer_username = response.json()["users"][0]["login"]
-            response_remove = utils.remove_reviewer(
+            response_remove = await utils.remove_reviewer(
                 reviewer_username, **kwarg_dict
             )
             response_remove.raise_for_status()
             return response_remove
-        except requests.exceptions.HTTPError as e:  # pragma: no cover
+        except httpx.HTTPStatusError as e:  # pragma: no cover
             err = f"**Error**: {response.json()['detail']}" + "\n"
-            utils.post_comment(err, **kwarg_dict)
+            await utils.post_comment(err, **kwarg_dict)
             raise e
         except Exception as e:
             err = (
@@ -422,10 +585,10 @@ class Bot:
                 + "\n\n"
                 + "**Please contact the maintainer for this bot.**"
             )
-            utils.post_comment(err, **kwarg_dict)
+            await utils.post_comment(err, **kwarg_dict)
             raise e
 
-    def approve(self, payload: dict, access_tokens: dict):
+    async def approve(self, payload: dict, access_tokens: dict):
         """
         Approve the assessment via API
         """
@@ -433,5 +596,16 @@ class Bot:
             payload, access_tokens=access_tokens
         )
         kwarg_dict['CRUD_APP_URL'] = self.CRUD_APP_URL
-        resonse = utils.approve_assessment(**kwarg_dict)
+        resonse = await utils.approve_assessment(**kwarg_dict)
         return resonse
+
+    async def changes(self, payload: dict, access_tokens: dict):
+        """
+        Request changes on the assessment under review via API
+        """
+        kwarg_dict = self.parse_comment_payload(
+            payload, access_tokens=access_tokens
+        )
+        kwarg_dict['CRUD_APP_URL'] = self.CRUD_APP_URL
+        response = await utils.request_changes(**kwarg_dict)
+        return response
@@ -0,0 +1,344 @@
+import asyncio
+import threading
+import time
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from bot import dependencies
+from bot.ratelimit import RateLimiter
+
+
+class GitHubClient:
+    """
+    Shared HTTP client for the GitHub API
+
+    All calls go through a single requests session, so connections to
+    api.github.com are pooled and kept alive between calls instead of
+    paying a new TCP + TLS handshake every time. The session sets the
+    default headers and every call gets a default timeout.
+
+    Calls are scheduled by a rate limiter, which only delays them when
+    GitHub's rate limit headers (or the write token bucket) require it,
+    and retries calls rejected by a rate limit when the wait is short.
+
+    Note: requests (urllib3) only speaks HTTP/1.1, so keep-alive pooling
+    is used instead of HTTP/2 multiplexing.
+    """
+
+    def __init__(
+        self,
+        pool_maxsize: int,
+        timeout: tuple,
+        limiter: RateLimiter,
+        max_retries: int = 2,
+        max_retry_wait: float = 60,
+    ):
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        self.adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_maxsize, pool_block=False
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.headers.update(
+            {
+                "Accept": dependencies.accept_header,
+                "User-Agent": dependencies.user_agent,
+            }
+        )
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request to the GitHub API
+
+        Args:
+            method: The HTTP method
+            url: The request URL
+            **kwargs: Passed on to `requests.Session.request`
+
+        Returns:
+            The response from the GitHub API
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        authorization = (kwargs.get("headers") or {}).get("Authorization")
+        attempt = 0
+        while True:
+            delay = self.limiter.delay(authorization, method)
+            if delay > 0:
+                time.sleep(delay)
+            with self.lock:
+                self.requests += 1
+            response = self.session.request(method, url, **kwargs)
+            retry = self.limiter.update(authorization, response)
+            if (
+                retry is None
+                or attempt >= self.max_retries
+                or retry > self.max_retry_wait
+            ):
+                return response
+            attempt += 1
+            print(f"Rate limited, retrying in {retry:.1f}s: {method} {url}")
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def stats(self) -> dict:
+        """
+        Get the connection pool statistics
+
+        Returns:
+            The number of requests sent through the client, and for each
+            host pool the connections opened, the requests sent and the
+            idle connections available for reuse
+        """
+        pools = {}
+        poolmanager = self.adapter.poolmanager
+        for key in list(poolmanager.pools.keys()):
+            pool = poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            # The pool queue is padded with None for unopened slots
+            idle = [conn for conn in list(pool.pool.queue) if conn is not None]
+            pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle_connections": len(idle),
+                "max_connections": self.pool_maxsize,
+            }
+        with self.lock:
+            total = self.requests
+        return {
+            "requests": total,
+            "pools": pools,
+            "rate_limit": self.limiter.stats(),
+        }
+
+
+class AsyncHTTPClient:
+    """
+    Shared non-blocking HTTP client for the webhook path (asyncio)
+
+    Wraps an httpx.AsyncClient with a keep-alive connection pool (HTTP/2
+    when `http2` is set, which needs the h2 package). The httpx client is
+    bound to the event loop which first uses it, so a new one is created
+    if the loop changes (e.g. between `asyncio.run` calls).
+
+    When a rate limiter is given, calls are scheduled by it like the
+    GitHubClient calls, waiting with `asyncio.sleep`.
+
+    Calls rejected with a 409 (the CRUD app's response to a concurrent
+    update of the same assessment) are retried `conflict_retries` times,
+    so they apply to the current state.
+
+    Idempotent calls (GET, HEAD, PUT, DELETE, OPTIONS, or any call made
+    with `idempotent=True`) which fail with a network error or a 5xx are
+    retried `server_retries` times, waiting `server_backoff` seconds
+    (doubled after each retry). Other calls are never retried on these
+    errors, as they may have been applied.
+    """
+
+    idempotent_methods = ["GET", "HEAD", "PUT", "DELETE", "OPTIONS"]
+    retry_statuses = [500, 502, 503, 504]
+
+    def __init__(
+        self,
+        pool_maxsize: int,
+        timeout: tuple,
+        headers: dict = None,
+        limiter: RateLimiter = None,
+        max_retries: int = 2,
+        max_retry_wait: float = 60,
+        conflict_retries: int = 0,
+        conflict_backoff: float = 0.5,
+        server_retries: int = 0,
+        server_backoff: float = 1,
+        http2: bool = False,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.pool_maxsize = pool_maxsize
+        self.timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        self.headers = headers or {}
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        self.conflict_retries = conflict_retries
+        self.conflict_backoff = conflict_backoff
+        self.server_retries = server_retries
+        self.server_backoff = server_backoff
+        self.http2 = http2
+        self.transport = transport
+        self.client = None
+        self.loop = None
+        self.requests = 0
+
+    def get_client(self) -> httpx.AsyncClient:
+        # Create the httpx client for the running event loop
+        loop = asyncio.get_running_loop()
+        if self.client is None or self.loop is not loop:
+            self.client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=self.timeout,
+                http2=self.http2,
+                transport=self.transport,
+                limits=httpx.Limits(
+                    max_connections=self.pool_maxsize,
+                    max_keepalive_connections=self.pool_maxsize,
+                ),
+            )
+            self.loop = loop
+        return self.client
+
+    async def request(
+        self, method: str, url: str, idempotent: bool = None, **kwargs
+    ) -> httpx.Response:
+        """
+        Send a request
+
+        Args:
+            method: The HTTP method
+            url: The request URL
+            idempotent: If the call can be retried on a network error or
+                a 5xx (by default, if the method is idempotent)
+            **kwargs: Passed on to `httpx.AsyncClient.request`
+
+        Returns:
+            The response
+        """
+        client = self.get_client()
+        authorization = (kwargs.get("headers") or {}).get("Authorization")
+        if idempotent is None:
+            idempotent = method.upper() in self.idempotent_methods
+        attempt = 0
+        conflicts = 0
+        failures = 0
+        while True:
+            if self.limiter is not None:
+                delay = self.limiter.delay(authorization, method)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self.requests += 1
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if not idempotent or failures >= self.server_retries:
+                    raise
+                failures += 1
+                print(f"{e!r}, retrying: {method} {url}")
+                await asyncio.sleep(self.server_backoff * 2 ** (failures - 1))
+                continue
+            if (
+                idempotent
+                and response.status_code in self.retry_statuses
+                and failures < self.server_retries
+            ):
+                failures += 1
+                print(f"HTTP {response.status_code}, retrying: {method} {url}")
+                await asyncio.sleep(self.server_backoff * 2 ** (failures - 1))
+                continue
+            if (
+                response.status_code == 409
+                and conflicts < self.conflict_retries
+            ):
+                conflicts += 1
+                print(f"Conflict, retrying: {method} {url}")
+                await asyncio.sleep(self.conflict_backoff * conflicts)
+                continue
+            if self.limiter is None:
+                return response
+            retry = self.limiter.update(authorization, response)
+            if (
+                retry is None
+                or attempt >= self.max_retries
+                or retry > self.max_retry_wait
+            ):
+                return response
+            attempt += 1
+            print(f"Rate limited, retrying in {retry:.1f}s: {method} {url}")
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PATCH", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> httpx.Response:
+        # httpx.AsyncClient.delete does not take a body
+        return await self.request("DELETE", url, **kwargs)
+
+    async def aclose(self):
+        """
+        Close the pooled connections
+        """
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def stats(self) -> dict:
+        """
+        Get the number of requests sent and the protocol used
+        """
+        return {
+            "requests": self.requests,
+            "http2": self.http2,
+            "max_connections": self.pool_maxsize,
+        }
+
+
+# Rate limits shared by the sync and async GitHub clients
+gh_limiter = RateLimiter(
+    write_capacity=dependencies.gh_write_burst,
+    write_rate=dependencies.gh_write_rate,
+)
+
+# Client shared by all (blocking) GitHub calls in this process
+gh_client = GitHubClient(
+    pool_maxsize=dependencies.gh_pool_maxsize,
+    timeout=dependencies.gh_timeout,
+    limiter=gh_limiter,
+)
+
+# Client shared by all GitHub calls on the webhook path
+agh_client = AsyncHTTPClient(
+    pool_maxsize=dependencies.gh_pool_maxsize,
+    timeout=dependencies.gh_timeout,
+    headers={
+        "Accept": dependencies.accept_header,
+        "User-Agent": dependencies.user_agent,
+    },
+    limiter=gh_limiter,
+    server_retries=dependencies.http_retries,
+    server_backoff=dependencies.http_retry_backoff,
+    http2=dependencies.gh_http2,
+)
+
+# Client shared by all CRUD app calls on the webhook path
+crud_client = AsyncHTTPClient(
+    pool_maxsize=dependencies.crud_pool_maxsize,
+    timeout=dependencies.crud_timeout,
+    conflict_retries=dependencies.crud_conflict_retries,
+    server_retries=dependencies.http_retries,
+    server_backoff=dependencies.http_retry_backoff,
+)
@@ -0,0 +1,254 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from bot import dependencies
+
+
+class DeliveryLedger:
+    """
+    Ledger of the webhook deliveries, keyed by their GUID (the
+    `X-GitHub-Delivery` header)
+
+    Backed by a local SQLite table, shared by all worker processes on the
+    host. The GUID is the primary key, so recording a delivery is a single
+    indexed insert which tells whether it was seen before. A delivery is
+    `accepted` (with its payload) when it is recorded and `done` once it
+    was processed; only done deliveries are duplicates.
+
+    Each accepted delivery is claimed by the process which queued it for
+    `lease` seconds, and the claims of queued and running deliveries are
+    renewed while the process runs. Deliveries whose claim expired (the
+    process stopped before processing them) are recovered and processed by
+    another process, or by the same one after a restart.
+
+    Entries expire after `ttl` seconds (GitHub only redelivers recent
+    deliveries) and are purged using the index on `received_at`.
+
+    The methods do blocking SQLite calls, so async code should run them
+    in a thread (`run_in_threadpool`).
+    """
+
+    columns = [
+        "guid",
+        "event",
+        "payload",
+        "status",
+        "owner",
+        "claimed_until",
+        "received_at",
+    ]
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float,
+        lease: float = 60,
+        purge_interval: float = 60,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.lease = lease
+        self.purge_interval = purge_interval
+        # Identifies the claims of this process
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.recovered = 0
+        self.last_purge = 0.0
+        self.conn = None
+
+    def connect(self) -> sqlite3.Connection:
+        # Must be called with the lock held
+        if self.conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(
+                self.path, timeout=10, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            columns = [
+                row[1]
+                for row in conn.execute("PRAGMA table_info(deliveries)")
+            ]
+            if columns and columns != self.columns:
+                # Ledger from an older version (only used for dedupe)
+                conn.execute("DROP TABLE deliveries")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS deliveries ("
+                " guid TEXT PRIMARY KEY,"
+                " event TEXT,"
+                " payload TEXT,"
+                " status TEXT NOT NULL,"
+                " owner TEXT,"
+                " claimed_until REAL,"
+                " received_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_deliveries_received_at"
+                " ON deliveries (received_at)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_deliveries_claims"
+                " ON deliveries (status, claimed_until)"
+            )
+            conn.commit()
+            self.conn = conn
+        return self.conn
+
+    def record(self, guid: str, event: str, payload: dict) -> bool:
+        """
+        Record a delivery as accepted, claimed by this process
+
+        Args:
+            guid: The delivery GUID
+            event: The GitHub event name
+            payload: The webhook payload
+
+        Returns:
+            True if the delivery must be processed, False if it was
+            already processed (or is being processed)
+        """
+        now = time.time()
+        with self.lock:
+            conn = self.connect()
+            if now - self.last_purge > self.purge_interval:
+                self.purge(now)
+            values = (
+                event,
+                json.dumps(payload),
+                self.owner,
+                now + self.lease,
+                now,
+                guid,
+            )
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO deliveries"
+                " (event, payload, status, owner, claimed_until,"
+                " received_at, guid)"
+                " VALUES (?, ?, 'accepted', ?, ?, ?, ?)",
+                values,
+            )
+            if cursor.rowcount == 0:
+                # Take over an expired entry (kept until it is purged) or
+                # an accepted delivery whose claim expired
+                cursor = conn.execute(
+                    "UPDATE deliveries SET event = ?, payload = ?,"
+                    " status = 'accepted', owner = ?, claimed_until = ?,"
+                    " received_at = ?"
+                    " WHERE guid = ? AND (received_at < ?"
+                    " OR (status = 'accepted' AND claimed_until < ?))",
+                    values + (now - self.ttl, now),
+                )
+            conn.commit()
+            if cursor.rowcount == 0:
+                self.hits += 1
+                return False
+            self.misses += 1
+            return True
+
+    def complete(self, guid: str):
+        """
+        Mark a delivery as done, so a redelivery is skipped
+        """
+        with self.lock:
+            conn = self.connect()
+            conn.execute(
+                "UPDATE deliveries SET status = 'done', payload = NULL,"
+                " owner = NULL, claimed_until = NULL WHERE guid = ?",
+                (guid,),
+            )
+            conn.commit()
+
+    def forget(self, guid: str):
+        """
+        Remove a delivery, so that a redelivery is processed again
+        """
+        with self.lock:
+            conn = self.connect()
+            conn.execute("DELETE FROM deliveries WHERE guid = ?", (guid,))
+            conn.commit()
+
+    def renew(self, guids: list):
+        """
+        Extend the claims of this process on deliveries still queued or
+        running
+        """
+        until = time.time() + self.lease
+        with self.lock:
+            conn = self.connect()
+            # Stay under SQLite's limit of parameters per statement
+            for i in range(0, len(guids), 500):
+                chunk = guids[i : i + 500]
+                conn.execute(
+                    "UPDATE deliveries SET claimed_until = ?"
+                    " WHERE owner = ? AND status = 'accepted'"
+                    " AND guid IN (" + ", ".join("?" * len(chunk)) + ")",
+                    [until, self.owner] + chunk,
+                )
+            conn.commit()
+
+    def recover(self, limit: int) -> list:
+        """
+        Claim accepted deliveries whose claim expired
+
+        Args:
+            limit: The max number of deliveries to claim
+
+        Returns:
+            The claimed deliveries, as (guid, event, payload) tuples
+        """
+        now = time.time()
+        recovered = []
+        with self.lock:
+            conn = self.connect()
+            rows = conn.execute(
+                "SELECT guid, event, payload, claimed_until FROM deliveries"
+                " WHERE status = 'accepted' AND claimed_until < ?"
+                " AND received_at >= ? LIMIT ?",
+                (now, now - self.ttl, limit),
+            ).fetchall()
+            for guid, event, payload, claimed_until in rows:
+                # Another process may claim it first
+                cursor = conn.execute(
+                    "UPDATE deliveries SET owner = ?, claimed_until = ?"
+                    " WHERE guid = ? AND status = 'accepted'"
+                    " AND claimed_until = ?",
+                    (self.owner, now + self.lease, guid, claimed_until),
+                )
+                if cursor.rowcount == 1:
+                    recovered.append((guid, event, json.loads(payload)))
+            conn.commit()
+            self.recovered += len(recovered)
+        return recovered
+
+    def purge(self, now: float):
+        # Must be called with the lock held
+        self.conn.execute(
+            "DELETE FROM deliveries WHERE received_at < ?", (now - self.ttl,)
+        )
+        self.conn.commit()
+        self.last_purge = now
+
+    def stats(self) -> dict:
+        """
+        Get the duplicate deliveries skipped (hits), the new deliveries
+        (misses) recorded and the deliveries recovered by this process
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "recovered": self.recovered,
+            }
+
+
+# Ledger shared by the webhook endpoint of this process
+delivery_ledger = DeliveryLedger(
+    path=dependencies.delivery_ledger_path,
+    ttl=dependencies.delivery_ledger_ttl.total_seconds(),
+    lease=dependencies.delivery_claim_lease,
+)
@@ -1,9 +1,11 @@
 import os
+from datetime import timedelta
 from functools import lru_cache
 from pydantic import BaseSettings
 from github import GithubIntegration
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 
 # Base URL for the GitHub API
 gh_url = "https://api.github.com"
@@ -14,12 +16,85 @@ gh_http = "https://github.com"
 # Header for the GitHub API
 accept_header = "application/vnd.github.v3+json"
 
+# User agent for the GitHub API
+user_agent = "brnbot"
+
+# Max number of pooled connections to the GitHub API
+gh_pool_maxsize = 32
+
+# Timeouts (connect, read) in seconds for the GitHub API
+gh_timeout = (5, 30)
+
+# Use HTTP/2 for the GitHub API on the webhook path (needs h2, pinned in
+# requirements.txt)
+gh_http2 = True
+
+# Max number of pooled connections and timeouts (connect, read) in
+# seconds for the CRUD app (webhook path)
+crud_pool_maxsize = 32
+crud_timeout = (5, 60)
+
+# Retries of CRUD calls rejected by a concurrent update of the assessment
+crud_conflict_retries = 3
+
+# Write calls per token allowed in a burst, and refill rate (per second),
+# to stay under GitHub's secondary rate limit on content creation
+gh_write_burst = 80
+gh_write_rate = 80 / 60
+
 # Filename for all actions workflows
 workflow_filename = "checks.yml"
 
 # ref for all trainee git
 git_ref = "main"
 
+# Number of background workers for /init provisioning jobs
+init_workers = 4
+
+# Number of asyncio workers for webhook deliveries
+webhook_workers = 16
+
+# Retries of idempotent calls on the webhook path which fail with a
+# network error or a 500/502/503/504, and delay in seconds before the first
+# retry (doubled after each retry)
+http_retries = 2
+http_retry_backoff = 1
+
+# Ledger of accepted webhook deliveries (GitHub redelivers for 3 days)
+delivery_ledger_path = "botdata/deliveries.sqlite3"
+delivery_ledger_ttl = timedelta(days=3)
+
+# Seconds a process keeps its claim on the deliveries it accepted (renewed
+# while it runs); deliveries of a stopped process are recovered after it
+delivery_claim_lease = 60
+
+# Cache of the repo lookups for webhooks (TTLs in seconds)
+repo_cache_positive_ttl = 10 * 60
+repo_cache_negative_ttl = 60
+repo_cache_max_size = 10000
+
+# Upload template files in a single commit via the Git Data API
+init_bulk_upload = True
+
+# Max number of concurrent blob uploads per init
+blob_upload_workers = 5
+
+# Local cache of template releases downloaded from S3
+template_cache_dir = "botdata/templates"
+template_cache_max_bytes = 500 * 1024 * 1024
+# Seconds since its last use before a release may be evicted (longer than
+# an init, so releases used by other processes are not evicted)
+template_cache_min_age = 30 * 60
+
+# Refresh installation tokens this long before GitHub expires them
+token_refresh_margin = timedelta(minutes=5)
+
+# Wait this long before retrying a failed background token refresh
+token_retry_interval = timedelta(seconds=30)
+
+# Max number of installation tokens minted concurrently
+token_mint_workers = 4
+
 # Admin usernames
 admins = ["millerh1", "itchytummy", "bioresnet"]
 
@@ -46,8 +121,6 @@ if (
         "R Programming II": "h3lCNmoHRjmqNI5D5Q6a-g",
         "Test": "OcVxPZEORASs4dBL0h5mOw",
     }
-    # file for storing temporary access tokens
-    token_fp = "access_tokens.json"
 else:
     installation_ids = {
         "Test": 26363998,
@@ -55,11 +128,9 @@ else:
     BADGE_IDs = {
         "Test": "OcVxPZEORASs4dBL0h5mOw",
     }
-    # file for storing temporary access tokens
-    token_fp = "access_tokens.dev.json"
 
 # Dict of valid commands
-cmds = ["hello", "help", "review", "approve"]
+cmds = ["hello", "help", "review", "approve", "changes"]
 cmds_descriptions = {
     "hello": "Say hello",
     "help": "Show this help message",
@@ -72,6 +143,11 @@ cmds_descriptions = {
         + " command is available to reviewers to approve the"
         + " assessment and issue a badge."
     ),
+    "changes": (
+        "For skill assessments under review, this command is available"
+        + " to reviewers to request changes. The trainee requests a new"
+        + " review once the changes pass the checks."
+    ),
 }
 
 
@@ -148,6 +224,17 @@ SQLALCHEMY_DATABASE_URI = (
 engine = create_engine(SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Non-blocking engine and session for the webhook path
+ASYNC_SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace(
+    "mysql+pymysql://", "mysql+aiomysql://", 1
+)
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URI, pool_pre_ping=True
+)
+AsyncSessionLocal = sessionmaker(
+    async_engine, class_=AsyncSession, expire_on_commit=False
+)
+
 # to get local DB
 def get_db():
     """
@@ -161,4 +248,3 @@ def get_db():
     finally:
         db.close()
 
-
@@ -0,0 +1,156 @@
+import asyncio
+import copy
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from bot import dependencies
+
+
+class JobQueue:
+    """
+    Local worker pool for running long provisioning jobs in the background
+
+    Jobs are kept in memory, so their progress is only visible from the
+    worker process which accepted them.
+
+    Jobs run in threads, while the pooled async clients belong to the
+    app's event loop (see `bind`), so jobs run their async calls on it
+    with `run_async`.
+    """
+
+    def __init__(self, max_workers: int, max_jobs: int = 1000):
+        self.max_jobs = max_jobs
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="ghbot-job"
+        )
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.loop = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """
+        Set the event loop which runs the async calls of the jobs
+        """
+        self.loop = loop
+
+    def run_async(self, coro):
+        """
+        Run a coroutine from a job thread and wait for its result
+
+        Args:
+            coro: The coroutine, run on the bound event loop (or on a new
+                one if no loop is bound, e.g. outside of the app)
+
+        Returns:
+            The result of the coroutine
+        """
+        if self.loop is None or not self.loop.is_running():
+            return asyncio.run(coro)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def submit(self, fn, **kwargs) -> str:
+        """
+        Enqueue a job
+
+        Args:
+            fn: The function to run. It is called with the keyword arguments
+                plus `job_id`, a `progress` callback taking a step name and
+                a `note` callback taking a name and a value (see `note`).
+            **kwargs: The keyword arguments for the function
+
+        Returns:
+            The job ID
+        """
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "created": str(datetime.utcnow()),
+                "finished": None,
+                "steps": [],
+                "result": None,
+                "error": None,
+                "notes": {},
+            }
+            self._prune()
+        self.executor.submit(self._run, job_id, fn, kwargs)
+        return job_id
+
+    def get(self, job_id: str) -> dict:
+        """
+        Get a snapshot of the job, or None if the job is unknown
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return copy.deepcopy(job)
+
+    def record_step(self, job_id: str, step: str):
+        """
+        Mark the running step as done and start the next one
+        """
+        with self.lock:
+            job = self.jobs[job_id]
+            self._finish_step(job, "done")
+            job["steps"].append(
+                {
+                    "name": step,
+                    "status": "running",
+                    "started": str(datetime.utcnow()),
+                    "finished": None,
+                }
+            )
+        print(f"Job {job_id}: {step}")
+
+    def note(self, job_id: str, name: str, value):
+        """
+        Record an outcome of the job kept apart from its result (e.g. the
+        delivery of a callback), whether the job succeeds or fails
+        """
+        with self.lock:
+            self.jobs[job_id]["notes"][name] = value
+
+    def _prune(self):
+        # Forget the oldest finished jobs once over the limit
+        finished = [
+            key
+            for key, job in self.jobs.items()
+            if job["status"] in ["complete", "failed"]
+        ]
+        for key in finished[: max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[key]
+
+    def _finish_step(self, job: dict, status: str):
+        if job["steps"] and job["steps"][-1]["status"] == "running":
+            job["steps"][-1]["status"] = status
+            job["steps"][-1]["finished"] = str(datetime.utcnow())
+
+    def _run(self, job_id: str, fn, kwargs: dict):
+        with self.lock:
+            self.jobs[job_id]["status"] = "running"
+        try:
+            result = fn(
+                job_id=job_id,
+                progress=lambda step: self.record_step(job_id, step),
+                note=lambda name, value: self.note(job_id, name, value),
+                **kwargs,
+            )
+            with self.lock:
+                job = self.jobs[job_id]
+                self._finish_step(job, "done")
+                job["status"] = "complete"
+                job["result"] = result
+                job["finished"] = str(datetime.utcnow())
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            with self.lock:
+                job = self.jobs[job_id]
+                self._finish_step(job, "failed")
+                job["status"] = "failed"
+                job["error"] = str(e)
+                job["finished"] = str(datetime.utcnow())
+
+
+# Worker pool for /init provisioning jobs
+init_queue = JobQueue(max_workers=dependencies.init_workers)
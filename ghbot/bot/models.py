@@ -4,6 +4,7 @@ from sqlalchemy import (
     String,
     Integer,
     Column,
+    Index,
 )
 from typing import Any
 from sqlalchemy.ext.declarative import as_declarative, declared_attr
@@ -30,6 +31,9 @@ class AssessmentTracker(Base):
     """
 
     __tablename__ = "assessment_tracker"
+    __table_args__ = (
+        Index("ix_assessment_tracker_repo", "repo_owner", "repo_name"),
+    )
 
     id = Column(Integer, primary_key=True, unique=True, index=True)
     user_id = Column(
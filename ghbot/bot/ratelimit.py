@@ -0,0 +1,167 @@
+import hashlib
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `capacity` calls in a burst, refilled at `rate`
+    calls per second
+    """
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """
+        Take one call from the bucket
+
+        Returns:
+            How long (in seconds) the caller must wait before the call
+        """
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class RateLimiter:
+    """
+    Schedules GitHub API calls according to the rate limits GitHub reports
+
+    Each access token has its own state:
+    - The primary limit from the `X-RateLimit-Remaining` and
+      `X-RateLimit-Reset` headers. Once no calls remain, calls wait
+      until the reset time.
+    - A `Retry-After` (secondary limit) deadline. Calls wait until it.
+    - A token bucket for write calls, to stay under the secondary limit
+      on content creation.
+    Calls are only delayed when one of these requires it.
+    """
+
+    write_methods = ["POST", "PATCH", "PUT", "DELETE"]
+
+    def __init__(self, write_capacity: float, write_rate: float):
+        self.write_capacity = write_capacity
+        self.write_rate = write_rate
+        self.lock = threading.Lock()
+        self.states = {}
+        self.delays = 0
+        self.delayed_seconds = 0.0
+
+    def key(self, authorization: str) -> str:
+        # Don't keep the tokens themselves as keys
+        return hashlib.sha256((authorization or "").encode("utf-8")).hexdigest()
+
+    def state(self, key: str) -> dict:
+        # Must be called with the lock held
+        if key not in self.states:
+            self.states[key] = {
+                "remaining": None,
+                "reset": 0.0,
+                "retry_after": 0.0,
+                "writes": TokenBucket(self.write_capacity, self.write_rate),
+                "used": time.time(),
+            }
+        state = self.states[key]
+        state["used"] = time.time()
+        return state
+
+    def delay(self, authorization: str, method: str) -> float:
+        """
+        Reserve a call and get how long to wait before sending it
+
+        Args:
+            authorization: The Authorization header of the call
+            method: The HTTP method of the call
+
+        Returns:
+            The delay in seconds (0 under normal load)
+        """
+        now = time.time()
+        with self.lock:
+            self.prune(now)
+            state = self.state(self.key(authorization))
+            delay = max(state["retry_after"] - now, 0.0)
+            if state["remaining"] is not None and state["remaining"] <= 0:
+                delay = max(delay, state["reset"] - now)
+            if method.upper() in self.write_methods:
+                delay = max(delay, state["writes"].reserve())
+            if delay > 0:
+                self.delays += 1
+                self.delayed_seconds += delay
+        if delay > 0:
+            print(f"Rate limit: waiting {delay:.1f}s before {method}")
+        return delay
+
+    def update(self, authorization: str, response) -> float:
+        """
+        Record the rate limit state reported by a GitHub response
+
+        Args:
+            authorization: The Authorization header of the call
+            response: The response (anything with `status_code` and
+                `headers`)
+
+        Returns:
+            How long to wait before retrying the call if it was rejected
+            by a rate limit, otherwise None
+        """
+        now = time.time()
+        headers = response.headers
+        retry = None
+        with self.lock:
+            state = self.state(self.key(authorization))
+            if "X-RateLimit-Remaining" in headers:
+                state["remaining"] = int(headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Reset" in headers:
+                state["reset"] = float(headers["X-RateLimit-Reset"])
+            if response.status_code in [403, 429]:
+                if "Retry-After" in headers:
+                    retry = parse_retry_after(headers["Retry-After"], now)
+                    state["retry_after"] = now + retry
+                elif state["remaining"] == 0:
+                    retry = max(state["reset"] - now, 0.0)
+        return retry
+
+    def prune(self, now: float):
+        # Forget the tokens unused for a while (tokens expire after 1h)
+        for key in [
+            key
+            for key, state in self.states.items()
+            if now - state["used"] > 2 * 60 * 60
+        ]:
+            del self.states[key]
+
+    def stats(self) -> dict:
+        """
+        Get the number of delayed calls and the total delay
+        """
+        with self.lock:
+            return {
+                "tokens": len(self.states),
+                "delays": self.delays,
+                "delayed_seconds": round(self.delayed_seconds, 3),
+            }
+
+
+def parse_retry_after(value: str, now: float) -> float:
+    """
+    Parse a Retry-After header (seconds or HTTP date) into seconds
+    """
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - now, 0.0)
+        except (TypeError, ValueError):
+            return 60.0
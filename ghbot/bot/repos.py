@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+from bot import dependencies
+
+
+class RepoCache:
+    """
+    In-process cache of the repo lookups done for each webhook
+
+    Remembers whether (repo_owner, repo_name) has an assessment tracker
+    entry. Found repos are kept for `positive_ttl` seconds and unknown
+    repos for `negative_ttl` seconds (shorter, as a repo becomes known
+    when an init completes in any process). Entries are invalidated when
+    /init or /delete touches the repo in this process.
+    """
+
+    def __init__(
+        self, positive_ttl: float, negative_ttl: float, max_size: int
+    ):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, repo_owner: str, repo_name: str) -> bool:
+        """
+        Get the cached lookup result, or None if not cached (or expired)
+        """
+        key = (repo_owner, repo_name)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, repo_owner: str, repo_name: str, found: bool):
+        """
+        Cache a lookup result
+        """
+        ttl = self.positive_ttl if found else self.negative_ttl
+        with self.lock:
+            self.entries[(repo_owner, repo_name)] = (
+                found,
+                time.monotonic() + ttl,
+            )
+            self.entries.move_to_end((repo_owner, repo_name))
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, repo_owner: str, repo_name: str):
+        """
+        Forget the lookup result for a repo
+        """
+        with self.lock:
+            self.entries.pop((repo_owner, repo_name), None)
+
+    def stats(self) -> dict:
+        """
+        Get the number of cached repos and the hit / miss counters
+        """
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Repo lookups shared by all webhooks in this process
+repo_cache = RepoCache(
+    positive_ttl=dependencies.repo_cache_positive_ttl,
+    negative_ttl=dependencies.repo_cache_negative_ttl,
+    max_size=dependencies.repo_cache_max_size,
+)
@@ -1,4 +1,5 @@
 from re import S
+from typing import Optional
 from pydantic import BaseModel
 
 
@@ -16,6 +17,9 @@ class InitBotRequest(BaseModel):
     template_repo: str
     latest_release: str
     review_required: bool
+    # Identify the assessment tracker entry for the completion callback
+    user_id: Optional[int] = None
+    assessment_id: Optional[int] = None
 
 
 class DeleteBotRequest(BaseModel):
@@ -0,0 +1,333 @@
+import base64
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import boto3
+from botocore.exceptions import ClientError
+from bot import dependencies
+from bot.dependencies import Settings
+
+
+def git_blob_sha(content: bytes) -> str:
+    """
+    Get the git blob SHA of the content (same as `git hash-object`)
+    """
+    header = f"blob {len(content)}\0".encode("utf-8")
+    return hashlib.sha1(header + content).hexdigest()
+
+
+class TemplateCache:
+    """
+    Persistent on-disk cache of assessment template releases
+
+    File contents are stored once, keyed by their git blob SHA, already
+    base64-encoded for the GitHub API:
+        <root>/objects/<sha[:2]>/<sha>
+    Each (template_repo, latest_release) has a manifest of its files:
+        <root>/manifests/<template_repo>/<latest_release>.json
+
+    A release is downloaded from S3 the first time it is requested and
+    written into the cache atomically. The pre-encoded bundle published
+    by the sync lambda is used when available, otherwise the raw template
+    files are downloaded and encoded once. When the cache grows over its
+    size budget, the least recently used releases are evicted.
+
+    The cache directory is shared by the worker processes on the host:
+    publishing a release, reading a manifest and evicting hold a file
+    lock on the cache. A release is pinned from `acquire` to `release`
+    (while an init reads its files), and pinned releases are not evicted
+    by this process. Releases used in the last `min_age` seconds are not
+    evicted by any process, which covers the inits of other processes.
+    """
+
+    def __init__(self, root: str, max_bytes: int, min_age: float = 30 * 60):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.pins = {}
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Hold the cache lock of this process and of the other processes
+        """
+        with self.lock:
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, ".lock"), "w") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def object_path(self, sha: str) -> str:
+        """
+        Path to the cached (base64-encoded) file contents for a blob SHA
+        """
+        return os.path.join(self.root, "objects", sha[:2], sha)
+
+    def read_object(self, sha: str) -> str:
+        """
+        Read the base64-encoded file contents for a blob SHA
+        """
+        with open(self.object_path(sha), "r") as f:
+            return f.read()
+
+    def manifest_path(self, template_repo: str, latest_release: str) -> str:
+        """
+        Path to the manifest of a template release
+        """
+        return os.path.join(
+            self.root, "manifests", template_repo, latest_release + ".json"
+        )
+
+    def acquire(
+        self, template_repo: str, latest_release: str, settings: Settings
+    ) -> dict:
+        """
+        Get the manifest of a template release, downloading it if needed,
+        and pin it until `release` is called
+
+        Args:
+            template_repo: The template repo name
+            latest_release: The release tag
+            settings: The app settings (for S3 access)
+
+        Returns:
+            The manifest, with "files" mapping each path to its blob SHA
+            and "size" the total size of the files in bytes
+        """
+        with self.lock:
+            key_lock = self.key_locks.setdefault(
+                (template_repo, latest_release), threading.Lock()
+            )
+
+        # Only one fill in flight per release
+        manifest_path = self.manifest_path(template_repo, latest_release)
+        with key_lock:
+            manifest = None
+            with self.exclusive():
+                if os.path.exists(manifest_path):
+                    print(
+                        f"Template cache hit: {template_repo} {latest_release}"
+                    )
+                    with open(manifest_path, "r") as f:
+                        manifest = json.load(f)
+                    # Mark as recently used
+                    os.utime(manifest_path)
+                    self.pin(manifest_path)
+            if manifest is None:
+                print(f"Template cache miss: {template_repo} {latest_release}")
+                manifest = self.fill(template_repo, latest_release, settings)
+
+        try:
+            self.evict()
+        except OSError as e:
+            print(f"Template cache eviction failed: {e}")
+        return manifest
+
+    def release(self, manifest: dict):
+        """
+        Unpin a template release acquired with `acquire`
+        """
+        manifest_path = self.manifest_path(
+            manifest["template_repo"], manifest["latest_release"]
+        )
+        with self.lock:
+            self.pins[manifest_path] -= 1
+            if self.pins[manifest_path] == 0:
+                del self.pins[manifest_path]
+            try:
+                # Mark as recently used
+                os.utime(manifest_path)
+            except FileNotFoundError:
+                pass
+
+    def pin(self, manifest_path: str):
+        # Must be called with the lock held
+        self.pins[manifest_path] = self.pins.get(manifest_path, 0) + 1
+
+    def fill(
+        self, template_repo: str, latest_release: str, settings: Settings
+    ) -> dict:
+        """
+        Download a template release from S3 into the cache
+        """
+        # Configure s3 client
+        s3 = boto3.resource(
+            "s3",
+            aws_access_key_id=settings.AWS_ACCESS_KEY,
+            aws_secret_access_key=settings.AWS_SECRET_KEY,
+            region_name=settings.AWS_REGION,
+        )
+        bucket = s3.Bucket(settings.AWS_BUCKET)
+
+        # Download into a private directory so partial fills are never seen
+        tmp_dir = os.path.join(self.root, "tmp", uuid.uuid4().hex)
+        os.makedirs(tmp_dir)
+        try:
+            try:
+                downloads = self.download_bundle(
+                    bucket, template_repo, latest_release, tmp_dir
+                )
+            except (ClientError, ValueError) as e:
+                # Missing, truncated or corrupt bundle
+                print(f"No valid template bundle ({e}), downloading files")
+                downloads = self.download_files(
+                    bucket, template_repo, latest_release, tmp_dir
+                )
+
+            # Publish the files and the manifest (manifest last) while no
+            # eviction can run, and pin the release
+            with self.exclusive():
+                files = {}
+                size = 0
+                for path, (target, sha) in downloads.items():
+                    object_path = self.object_path(sha)
+                    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                    os.replace(target, object_path)
+                    files[path] = sha
+                    size += os.path.getsize(object_path)
+
+                manifest = {
+                    "template_repo": template_repo,
+                    "latest_release": latest_release,
+                    "files": files,
+                    "size": size,
+                }
+                manifest_path = self.manifest_path(
+                    template_repo, latest_release
+                )
+                os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+                tmp_manifest = os.path.join(tmp_dir, "manifest.json")
+                with open(tmp_manifest, "w") as f:
+                    json.dump(manifest, f, indent=4, sort_keys=True)
+                os.replace(tmp_manifest, manifest_path)
+                self.pin(manifest_path)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        print(f"Template cached: {template_repo} {latest_release}")
+        return manifest
+
+    def download_bundle(
+        self, bucket, template_repo: str, latest_release: str, tmp_dir: str
+    ) -> dict:
+        """
+        Download the pre-encoded bundle of a template release
+
+        The blob SHA of each file is computed again from its contents, so
+        a corrupt bundle is never cached.
+
+        Returns:
+            Dict mapping each path to its (downloaded file, blob SHA)
+
+        Raises:
+            ValueError: If the bundle is not valid JSON or a file does not
+                match its blob SHA
+        """
+        key = "bundles/" + template_repo + "/" + latest_release + ".json"
+        bundle = json.loads(bucket.Object(key).get()["Body"].read())
+        downloads = {}
+        for file in bundle["files"]:
+            # Raises binascii.Error (a ValueError) if not valid base64
+            content = base64.b64decode(file["content"], validate=True)
+            if git_blob_sha(content) != file["sha"]:
+                raise ValueError(f"Blob SHA mismatch for {file['path']}")
+            target = os.path.join(tmp_dir, uuid.uuid4().hex)
+            with open(target, "w") as f:
+                f.write(file["content"])
+            downloads[file["path"]] = (target, file["sha"])
+        return downloads
+
+    def download_files(
+        self, bucket, template_repo: str, latest_release: str, tmp_dir: str
+    ) -> dict:
+        """
+        Download the raw files of a template release and encode them
+
+        Returns:
+            Dict mapping each path to its (downloaded file, blob SHA)
+        """
+        # Object directory on s3
+        object_dir = "templates/" + template_repo + "/" + latest_release
+        downloads = {}
+        for obj in bucket.objects.filter(Prefix=object_dir):
+            if obj.key[-1] == "/":
+                continue
+            target = os.path.join(tmp_dir, uuid.uuid4().hex)
+            bucket.download_file(obj.key, target)
+            with open(target, "rb") as f:
+                content = f.read()
+            with open(target, "wb") as f:
+                f.write(base64.b64encode(content))
+            downloads[os.path.relpath(obj.key, object_dir)] = (
+                target,
+                git_blob_sha(content),
+            )
+        return downloads
+
+    def evict(self):
+        """
+        Evict the least recently used releases (except the pinned and
+        recently used ones) until the cache fits its size budget, then
+        remove the file contents no longer referenced
+        """
+        with self.exclusive():
+            now = time.time()
+            manifest_root = os.path.join(self.root, "manifests")
+            manifests = []
+            for subdir, dirs, files in os.walk(manifest_root):
+                for file in files:
+                    path = os.path.join(subdir, file)
+                    if path in self.pins:
+                        # Pinned releases count as used now (for the
+                        # other processes)
+                        os.utime(path)
+                    with open(path, "r") as f:
+                        manifest = json.load(f)
+                    manifests.append((os.path.getmtime(path), path, manifest))
+            if sum(m[2]["size"] for m in manifests) <= self.max_bytes:
+                return None
+
+            # Oldest first
+            manifests.sort(key=lambda m: m[0])
+            total = sum(m[2]["size"] for m in manifests)
+            kept = []
+            for mtime, path, manifest in manifests:
+                if (
+                    total > self.max_bytes
+                    and path not in self.pins
+                    and now - mtime > self.min_age
+                ):
+                    print(f"Evicting template: {path}")
+                    os.remove(path)
+                    total -= manifest["size"]
+                else:
+                    kept.append(manifest)
+
+            # Remove the file contents which are no longer referenced
+            referenced = {
+                sha for manifest in kept for sha in manifest["files"].values()
+            }
+            object_root = os.path.join(self.root, "objects")
+            for subdir, dirs, files in os.walk(object_root):
+                for file in files:
+                    if file not in referenced:
+                        os.remove(os.path.join(subdir, file))
+
+
+# Cache shared by all init jobs in this process
+template_cache = TemplateCache(
+    root=dependencies.template_cache_dir,
+    max_bytes=dependencies.template_cache_max_bytes,
+    min_age=dependencies.template_cache_min_age,
+)
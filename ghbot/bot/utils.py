@@ -1,18 +1,20 @@
 from pydoc import resolve
+import httpx
 import requests
-import time
-import os
 from datetime import datetime, timedelta, timezone
 from bot import dependencies, schemas
 from bot.models import AssessmentTracker
-import boto3
-from time import sleep
+from bot.templates import template_cache
+from bot.client import gh_client, agh_client, crud_client
+from bot.repos import repo_cache
 import base64
-from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from bot.dependencies import Settings
 
 
-def post_comment(text: str, **kwargs) -> requests.Response:
+async def post_comment(text: str, **kwargs) -> httpx.Response:
     """
     Post a comment to the issue
 
@@ -32,11 +34,10 @@ def post_comment(text: str, **kwargs) -> requests.Response:
     print("Post comment")
     print(request_url)
     print(headers)
-    time.sleep(1)  # Sleep for 1 second to avoid rate limiting
     print(f"Posting comment: {text}")
     print(kwargs["access_token"])
     print(request_url)
-    response = requests.post(
+    response = await agh_client.post(
         request_url,
         headers=headers,
         json={"body": text},
@@ -45,7 +46,7 @@ def post_comment(text: str, **kwargs) -> requests.Response:
     return response
 
 
-def assign_reviewer(reviewer_username: str, **kwarg_dict) -> requests.Response:
+async def assign_reviewer(reviewer_username: str, **kwarg_dict) -> httpx.Response:
     """
     Assign a reviewer to the assessment via API
     """
@@ -56,8 +57,7 @@ def assign_reviewer(reviewer_username: str, **kwarg_dict) -> requests.Response:
 
     # Add reviewer to the PR
     request_url = f"{kwarg_dict['pr_url']}/requested_reviewers"
-    sleep(1)
-    response = requests.post(
+    response = await agh_client.post(
         request_url,
         headers=headers,
         json={"reviewers": [reviewer_username]},
@@ -67,7 +67,7 @@ def assign_reviewer(reviewer_username: str, **kwarg_dict) -> requests.Response:
     return response
 
 
-def get_reviewer(**kwarg_dict) -> requests.Response:
+async def get_reviewer(**kwarg_dict) -> httpx.Response:
     """
     Get the reviewer from github API
     """
@@ -76,14 +76,14 @@ def get_reviewer(**kwarg_dict) -> requests.Response:
         "Accept": dependencies.accept_header,
     }
     request_url = f"{kwarg_dict['pr_url']}/requested_reviewers"
-    response = requests.get(
+    response = await agh_client.get(
         request_url,
         headers=headers,
     )
     return response
 
 
-def remove_reviewer(reviewer_username: str, **kwarg_dict) -> requests.Response:
+async def remove_reviewer(reviewer_username: str, **kwarg_dict) -> httpx.Response:
     """
     Remove the reviewer from the PR
     """
@@ -92,7 +92,7 @@ def remove_reviewer(reviewer_username: str, **kwarg_dict) -> requests.Response:
         "Accept": dependencies.accept_header,
     }
     request_url = f"{kwarg_dict['pr_url']}/requested_reviewers"
-    response = response = requests.delete(
+    response = response = await agh_client.delete(
         request_url,
         headers=headers,
         json={"reviewers": [reviewer_username]},
@@ -100,7 +100,7 @@ def remove_reviewer(reviewer_username: str, **kwarg_dict) -> requests.Response:
     return response
 
 
-def get_comment_by_id(comment_id, **kwargs) -> requests.Response:
+async def get_comment_by_id(comment_id, **kwargs) -> httpx.Response:
     """
     Get the comment by ID
     """
@@ -109,13 +109,13 @@ def get_comment_by_id(comment_id, **kwargs) -> requests.Response:
         "Accept": dependencies.accept_header,
     }
     request_url = f"{dependencies.gh_url}/repos/{kwargs['owner']}/{kwargs['repo_name']}/issues/{kwargs['issue_number']}/comments/{comment_id}"
-    response = requests.get(request_url, headers=headers)
+    response = await agh_client.get(request_url, headers=headers)
     return response
 
 
-def get_recent_comments(
+async def get_recent_comments(
     delt: timedelta = timedelta(minutes=1), **kwargs
-) -> requests.Response:
+) -> httpx.Response:
     """
     Retrieve the last comment
     """
@@ -125,7 +125,7 @@ def get_recent_comments(
     }
     request_url = f"{dependencies.gh_url}/repos/{kwargs['owner']}/{kwargs['repo_name']}/issues/{kwargs['issue_number']}/comments"
     one_minute_ago = datetime.now(tz=timezone.utc) - delt
-    response = requests.get(
+    response = await agh_client.get(
         request_url,
         headers=headers,
         params={"since": one_minute_ago.isoformat()},
@@ -133,7 +133,7 @@ def get_recent_comments(
     return response
 
 
-def get_last_comment(**kwargs) -> requests.Response:
+async def get_last_comment(**kwargs) -> httpx.Response:
     """
     Get the last comment
     """
@@ -142,11 +142,11 @@ def get_last_comment(**kwargs) -> requests.Response:
         "Accept": dependencies.accept_header,
     }
     request_url = f"{dependencies.gh_url}/repos/{kwargs['owner']}/{kwargs['repo_name']}/issues/{kwargs['issue_number']}/comments"
-    response = requests.get(request_url, headers=headers)
+    response = await agh_client.get(request_url, headers=headers)
     return response
 
 
-def delete_comment(comment_id, **kwargs) -> requests.Response:
+async def delete_comment(comment_id, **kwargs) -> httpx.Response:
     """
     Delete a comment
     """
@@ -155,7 +155,7 @@ def delete_comment(comment_id, **kwargs) -> requests.Response:
         "Accept": dependencies.accept_header,
     }
     request_url = f"{dependencies.gh_url}/repos/{kwargs['owner']}/{kwargs['repo_name']}/issues/comments/{comment_id}"
-    response = requests.delete(request_url, headers=headers)
+    response = await agh_client.delete(request_url, headers=headers)
     return response
 
 
@@ -174,7 +174,7 @@ def get_assessment_name(payload: dict) -> str:
     return assessment
 
 
-def get_last_commit(owner, repo_name, access_token) -> dict:
+async def get_last_commit(owner, repo_name, access_token) -> dict:
     """
     Get the last commit
 
@@ -191,7 +191,7 @@ def get_last_commit(owner, repo_name, access_token) -> dict:
         "Authorization": f"Bearer {access_token}",
         "Accept": dependencies.accept_header,
     }
-    response = requests.get(url, headers=headers)
+    response = await agh_client.get(url, headers=headers)
     commits = response.json()
     if len(commits) > 0:
         commit = commits[0]
@@ -214,27 +214,38 @@ def is_for_bot(payload: dict) -> bool:
         return False
 
 
-def is_valid_repo(payload: dict, db: Session) -> bool:
+async def is_valid_repo(payload: dict, db: AsyncSession) -> bool:
     """
     Check if the payload is for the bot
     """
+    repo_owner = payload["repository"]["owner"]["login"]
     repo_name = payload["repository"]["name"]
 
-    # Query the assessment tracker table for this repo name
-    assessment_tracker = (
-        db.query(AssessmentTracker)
-        .filter(AssessmentTracker.repo_name == repo_name)
-        .first()
+    cached = repo_cache.get(repo_owner, repo_name)
+    if cached is not None:
+        return cached
+
+    # Query the assessment tracker table for this repo
+    # (uses the (repo_owner, repo_name) index)
+    result = await db.execute(
+        select(AssessmentTracker.id)
+        .where(
+            AssessmentTracker.repo_owner == repo_owner,
+            AssessmentTracker.repo_name == repo_name,
+        )
+        .limit(1)
     )
+    assessment_tracker_id = result.scalars().first()
 
     print("AT")
 
-    if assessment_tracker is None:
+    if assessment_tracker_id is None:
         print("Entry unavailable in the assessment tracker table")
     else:
-        print(assessment_tracker.id)
+        print(assessment_tracker_id)
 
-    return assessment_tracker is not None
+    repo_cache.set(repo_owner, repo_name, assessment_tracker_id is not None)
+    return assessment_tracker_id is not None
 
 
 def is_pr_commit(payload: dict, event: str) -> bool:
@@ -286,7 +297,7 @@ def is_workflow_run(payload: dict) -> bool:
         return False
 
 
-def dispatch_workflow(**kwarg_dict) -> requests.Response:
+async def dispatch_workflow(**kwarg_dict) -> httpx.Response:
     # Dispatch workflow file
     request_url = (
         f"{dependencies.gh_url}/repos/{kwarg_dict['owner']}/"
@@ -299,7 +310,7 @@ def dispatch_workflow(**kwarg_dict) -> requests.Response:
     print("Dispatching workflow")
     print(request_url)
     print(headers)
-    response = requests.post(
+    response = await agh_client.post(
         request_url,
         headers=headers,
         json={
@@ -326,7 +337,7 @@ def delete_repo(
     print(request_url)
     print(headers)
     try:
-        response = requests.delete(request_url, headers=headers)
+        response = gh_client.delete(request_url, headers=headers)
         response.raise_for_status()
         print("Deleted repo")
     except requests.exceptions.HTTPError:  # pragma: no cover
@@ -334,7 +345,7 @@ def delete_repo(
         pass
 
 
-def archive_repo(**kwargs: dict):
+async def archive_repo(**kwargs: dict):
     """
     Process an archive repo request
     """
@@ -345,8 +356,7 @@ def archive_repo(**kwargs: dict):
         "archived": True,
     }
     try:
-        sleep(1)
-        response = requests.patch(
+        response = await agh_client.patch(
             request_url,
             json=body,
             headers={
@@ -356,7 +366,7 @@ def archive_repo(**kwargs: dict):
         )
         response.raise_for_status()
         print("Repo archived")
-    except requests.exceptions.HTTPError as e:  # pragma: no cover
+    except httpx.HTTPStatusError as e:  # pragma: no cover
         print(e)
         raise e
 
@@ -374,7 +384,7 @@ def init_create_repo(
     print(request_url)
     print(headers)
     try:
-        response = requests.delete(request_url, headers=headers)
+        response = gh_client.delete(request_url, headers=headers)
         response.raise_for_status()
         print("Deleted repo")
     except requests.exceptions.HTTPError:  # pragma: no cover
@@ -399,8 +409,7 @@ def init_create_repo(
     print(request_url)
     print(headers)
     try:
-        sleep(1)
-        response = requests.post(
+        response = gh_client.post(
             request_url,
             json=body,
             headers={"Authorization": f"token {access_token}"},
@@ -420,8 +429,7 @@ def init_create_repo(
             "content": base64content.decode("utf-8"),
             "branch": "main",
         }
-        sleep(1)
-        response = requests.put(
+        response = gh_client.put(
             request_url,
             json=body,
             headers={"Authorization": f"token {access_token}"},
@@ -435,93 +443,232 @@ def init_create_repo(
         raise e
 
 
+def init_create_blob(
+    init_request: schemas.InitBotRequest,
+    repo_name: str,
+    access_token: str,
+    sha: str,
+) -> str:
+    """
+    Create a git blob in the repo from the template cache
+
+    Args:
+        init_request: The init request
+        repo_name: The name of the repo
+        access_token: The installation access token
+        sha: The git blob SHA of the cached file
+
+    Returns:
+        The SHA of the blob
+    """
+    request_url = f"{dependencies.gh_url}/repos/{init_request.github_org}/{repo_name}/git/blobs"
+    body = {
+        # Already base64-encoded in the cache
+        "content": template_cache.read_object(sha),
+        "encoding": "base64",
+    }
+    response = gh_client.post(
+        request_url,
+        json=body,
+        headers={"Authorization": f"token {access_token}"},
+    )
+    response.raise_for_status()
+    if response.json()["sha"] != sha:
+        raise ValueError(f"Blob SHA mismatch for {sha}")
+    return sha
+
+
 def init_fill_repo(
-    init_request: schemas.InitBotRequest, 
-    repo_name: str, 
+    init_request: schemas.InitBotRequest,
+    repo_name: str,
     access_token: str,
     settings: Settings,
+    bulk: bool = True,
 ):
-    # Download the code from aws s3 and upload to github
+    """
+    Upload the template code (from the local template cache) to the repo
+
+    In bulk mode, the unique files which the repo does not have yet (read
+    from the tree of main in one call) are uploaded as blobs
+    (concurrently), using the blob SHAs precomputed in the template cache,
+    then committed in a single tree / commit. The template commit replaces the
+    .tmp file on main and is followed by an empty commit, so that main is
+    one commit ahead of the feedback branch. Main is moved with a single
+    ref update.
+
+    Args:
+        init_request: The init request
+        repo_name: The name of the repo
+        access_token: The installation access token
+        settings: The app settings
+        bulk: Upload all files in a single commit via the Git Data API
+
+    Returns:
+        In bulk mode, the SHA of the template commit (for the feedback
+        branch) and the SHA of the latest commit on main. Otherwise None.
+    """
+    manifest = None
     try:
-        # Configure s3 client
-        s3 = boto3.resource(
-            "s3",
-            aws_access_key_id=settings.AWS_ACCESS_KEY,
-            aws_secret_access_key=settings.AWS_SECRET_KEY,
-            region_name=settings.AWS_REGION,
+        # Get the template from the local cache (downloaded from s3 once),
+        # pinned so it is not evicted while its files are uploaded
+        manifest = template_cache.acquire(
+            init_request.template_repo,
+            init_request.latest_release,
+            settings=settings,
+        )
+        paths = sorted(manifest["files"].keys())
+        if not bulk:
+            for path in paths:
+                # Upload the code to github
+                # Get the base64 content of the file
+                base64content = template_cache.read_object(
+                    manifest["files"][path]
+                )
+                # Create the file in the repo
+                request_url = (
+                    f"{dependencies.gh_url}/repos/{init_request.github_org}/{repo_name}/contents/{path}"
+                )
+                body = {
+                    "message": "Adding assessment files...",
+                    "content": base64content,
+                    "branch": "main",
+                }
+                response_files = gh_client.put(
+                    request_url,
+                    json=body,
+                    headers={"Authorization": f"token {access_token}"},
+                )
+                response_files.raise_for_status()
+                print(f"{path} uploaded")
+            print("Code downloaded and uploaded to github")
+            return None
+
+        repo_url = (
+            f"{dependencies.gh_url}/repos/{init_request.github_org}/{repo_name}"
         )
-        bucket = s3.Bucket(settings.AWS_BUCKET)
-        # Object directory on s3
-        object_dir = (
-            "templates/"
-            + init_request.template_repo
-            + "/"
-            + init_request.latest_release
+        headers = {"Authorization": f"token {access_token}"}
+
+        # Get the SHA of the .tmp commit on the main branch
+        response = gh_client.get(
+            f"{repo_url}/git/refs/heads/main", headers=headers
         )
-        local_dir = (
-            "botdata/"
-            + init_request.template_repo
-            + "/"
-            + init_request.latest_release
+        response.raise_for_status()
+        parent_sha = response.json()["object"]["sha"]
+
+        # Skip the blobs the repo already has
+        response = gh_client.get(
+            f"{repo_url}/git/trees/{parent_sha}",
+            params={"recursive": "1"},
+            headers=headers,
         )
-        for obj in bucket.objects.filter(Prefix=object_dir):
-            target = (
-                obj.key
-                if local_dir is None
-                else os.path.join(
-                    local_dir, os.path.relpath(obj.key, object_dir)
+        response.raise_for_status()
+        existing = {
+            item["sha"]
+            for item in response.json()["tree"]
+            if item["type"] == "blob"
+        }
+
+        # Create the blobs concurrently, uploading identical files once
+        blob_shas = sorted(set(manifest["files"].values()) - existing)
+        with ThreadPoolExecutor(
+            max_workers=dependencies.blob_upload_workers
+        ) as executor:
+            list(
+                executor.map(
+                    lambda sha: init_create_blob(
+                        init_request,
+                        repo_name=repo_name,
+                        access_token=access_token,
+                        sha=sha,
+                    ),
+                    blob_shas,
                 )
             )
-            if not os.path.exists(os.path.dirname(target)):
-                os.makedirs(os.path.dirname(target))
-                os.chmod(os.path.dirname(target), 0o777)
-            if obj.key[-1] == "/":
-                continue
-            bucket.download_file(obj.key, target)
-            os.chmod(target, 0o777)
-
-            # Upload the code to github
-            # Get the base64 content of the file
-            with open(target, "rb") as f:
-                base64content = base64.b64encode(f.read())
-            # Create the file in the repo
-            request_url = (
-                f"{dependencies.gh_url}/repos/{init_request.github_org}/{repo_name}/contents/{os.path.relpath(target, local_dir)}"
-            )
-            body = {
-                "message": "Adding assessment files...",
-                "content": base64content.decode("utf-8"),
-                "branch": "main",
+        print(
+            f"{len(blob_shas)} blobs uploaded"
+            + f" ({len(existing)} already in the repo)"
+        )
+
+        # Create the tree (without the .tmp file)
+        tree = [
+            {
+                "path": path,
+                "mode": "100644",
+                "type": "blob",
+                "sha": manifest["files"][path],
             }
-            sleep(1)
-            response_files = requests.put(
-                request_url,
-                json=body,
-                headers={"Authorization": f"token {access_token}"},
-            )
-            response_files.raise_for_status()
-            print(f"{target} uploaded")
+            for path in paths
+        ]
+        response = gh_client.post(
+            f"{repo_url}/git/trees", json={"tree": tree}, headers=headers
+        )
+        response.raise_for_status()
+        tree_sha = response.json()["sha"]
+
+        # Commit the template code
+        response = gh_client.post(
+            f"{repo_url}/git/commits",
+            json={
+                "message": "Adding assessment files...",
+                "tree": tree_sha,
+                "parents": [parent_sha],
+            },
+            headers=headers,
+        )
+        response.raise_for_status()
+        template_sha = response.json()["sha"]
+
+        # Empty commit so that main is ahead of the feedback branch
+        response = gh_client.post(
+            f"{repo_url}/git/commits",
+            json={
+                "message": "Start skill assessment",
+                "tree": tree_sha,
+                "parents": [template_sha],
+            },
+            headers=headers,
+        )
+        response.raise_for_status()
+        latest_commit = response.json()["sha"]
+
+        # Move main to the new commits
+        response = gh_client.patch(
+            f"{repo_url}/git/refs/heads/main",
+            json={"sha": latest_commit},
+            headers=headers,
+        )
+        response.raise_for_status()
         print("Code downloaded and uploaded to github")
+        return template_sha, latest_commit
     except Exception as e:  # pragma: no cover
         print(e)
         raise e
+    finally:
+        if manifest is not None:
+            template_cache.release(manifest)
 
 
 def init_create_feedback_branch(
-    init_request: schemas.InitBotRequest, repo_name: str, access_token: str
+    init_request: schemas.InitBotRequest,
+    repo_name: str,
+    access_token: str,
+    sha: str = None,
 ):
     # Create a branch in the repo
     try:
 
-        # Get the SHA of the last commit on the main branch
-        request_url = f"{dependencies.gh_url}/repos/{init_request.github_org}/{repo_name}/git/refs/heads/main"
-        response = requests.get(
-            request_url,
-            headers={"Authorization": f"token {access_token}"},
-        )
-        response.raise_for_status()
-        print("Got ref")
-        sha2 = response.json()["object"]["sha"]
+        if sha is None:
+            # Get the SHA of the last commit on the main branch
+            request_url = f"{dependencies.gh_url}/repos/{init_request.github_org}/{repo_name}/git/refs/heads/main"
+            response = gh_client.get(
+                request_url,
+                headers={"Authorization": f"token {access_token}"},
+            )
+            response.raise_for_status()
+            print("Got ref")
+            sha2 = response.json()["object"]["sha"]
+        else:
+            sha2 = sha
 
         # Create the ref
         request_url = f"{dependencies.gh_url}/repos/{init_request.github_org}/{repo_name}/git/refs"
@@ -529,8 +676,7 @@ def init_create_feedback_branch(
             "ref": "refs/heads/feedback",
             "sha": sha2,
         }
-        sleep(1)
-        response = requests.post(
+        response = gh_client.post(
             request_url,
             json=body,
             headers={"Authorization": f"token {access_token}"},
@@ -556,8 +702,7 @@ def init_delete_tmp(
             "sha": tmp_sha,
             "branch": "main",
         }
-        sleep(1)
-        response = requests.delete(
+        response = gh_client.delete(
             request_url,
             json=body,
             headers={"Authorization": f"token {access_token}"},
@@ -662,8 +807,7 @@ def init_create_pr(
             "head": "main",
             "body": welcome_message,
         }
-        sleep(1)
-        response_pr = requests.post(
+        response_pr = gh_client.post(
             request_url,
             json=body,
             headers={"Authorization": f"token {access_token}"},
@@ -682,8 +826,7 @@ def init_add_collaborator(
     # Add the collaborator to the repo
     try:
         request_url = f"{dependencies.gh_url}/repos/{init_request.github_org}/{repo_name}/collaborators/{init_request.username}"
-        sleep(1)
-        response = requests.put(
+        response = gh_client.put(
             request_url,
             json={},
             headers={"Authorization": f"token {access_token}"},
@@ -695,19 +838,20 @@ def init_add_collaborator(
         raise e
 
 
-def approve_assessment(**kwarg_dict):
+async def approve_assessment(**kwarg_dict):
     # Approve the assessment in the database using API
     request_url = f"{kwarg_dict['CRUD_APP_URL']}/api/approve"
+    last_commit = await get_last_commit(
+        owner=kwarg_dict["owner"],
+        repo_name=kwarg_dict["repo_name"],
+        access_token=kwarg_dict["access_token"],
+    )
     body = {
         "reviewer_username": kwarg_dict["sender"],
-        "latest_commit": get_last_commit(
-            owner=kwarg_dict["owner"],
-            repo_name=kwarg_dict["repo_name"],
-            access_token=kwarg_dict["access_token"],
-        )["sha"],
+        "latest_commit": last_commit["sha"],
     }
     print(body)
-    response = requests.patch(
+    response = await crud_client.patch(
         request_url,
         json=body,
     )
@@ -717,15 +861,54 @@ def approve_assessment(**kwarg_dict):
             "Skill assessment approved 🎉. Please check your email for your"
             " badge 😎."
         )
-        post_comment(text, **kwarg_dict)
-        archive_repo(**kwarg_dict)
+        await post_comment(text, **kwarg_dict)
+        await archive_repo(**kwarg_dict)
         return response
-    except requests.exceptions.HTTPError as e:  # pragma: no cover
+    except httpx.HTTPStatusError as e:  # pragma: no cover
         msg = response.json()["detail"]
         if msg == "Reviewer cannot be the same as the trainee.":
             msg = "Trainee cannot approve their own skill assessment."
         err = f"**Error**: {msg}" + "\n"
-        post_comment(err, **kwarg_dict)
+        await post_comment(err, **kwarg_dict)
+        raise e
+    except Exception as e:  # pragma: no cover
+        err = (
+            f"**Error**: {e}"
+            + "\n\n"
+            + "**Please contact the maintainer for this bot.**"
+        )
+        await post_comment(err, **kwarg_dict)
+        raise e
+
+
+async def request_changes(**kwarg_dict):
+    # Send the assessment back to the trainee in the database using API
+    request_url = f"{kwarg_dict['CRUD_APP_URL']}/api/changes"
+    last_commit = await get_last_commit(
+        owner=kwarg_dict["owner"],
+        repo_name=kwarg_dict["repo_name"],
+        access_token=kwarg_dict["access_token"],
+    )
+    body = {
+        "reviewer_username": kwarg_dict["sender"],
+        "latest_commit": last_commit["sha"],
+    }
+    print(body)
+    response = await crud_client.patch(
+        request_url,
+        json=body,
+    )
+    try:
+        response.raise_for_status()
+        text = (
+            "Changes requested 📝. Push your changes, run `@brnbot check` and"
+            " request a new review with `@brnbot review`."
+        )
+        await post_comment(text, **kwarg_dict)
+        return response
+    except httpx.HTTPStatusError as e:  # pragma: no cover
+        err = f"**Error**: {response.json()['detail']}" + "\n"
+        await post_comment(err, **kwarg_dict)
         raise e
     except Exception as e:  # pragma: no cover
         err = (
@@ -733,5 +916,5 @@ def approve_assessment(**kwarg_dict):
             + "\n\n"
             + "**Please contact the maintainer for this bot.**"
         )
-        post_comment(err, **kwarg_dict)
+        await post_comment(err, **kwarg_dict)
         raise e
@@ -0,0 +1,210 @@
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from fastapi.concurrency import run_in_threadpool
+from bot import dependencies
+from bot.deliveries import DeliveryLedger, delivery_ledger
+
+
+class WebhookQueue:
+    """
+    Local background worker for GitHub webhook deliveries
+
+    Deliveries are recorded in the delivery ledger by their GUID (the
+    `X-GitHub-Delivery` header) with their payload when they are accepted,
+    and marked done once processed, so a redelivered webhook is only
+    processed once. Accepted deliveries are processed by a pool of asyncio
+    workers. The handlers are not idempotent (they post comments and
+    update the CRUD app), so a delivery is not replayed: transient
+    failures are retried by the HTTP clients, for the failed call only.
+    Failed deliveries are removed from the ledger, so that a manual
+    redelivery is processed again.
+
+    Every `recover_interval` seconds, the claims of the deliveries queued
+    or running in this process are renewed, and accepted deliveries left
+    unprocessed by a stopped process (their claim expired) are queued
+    again.
+
+    The state of each delivery is kept in memory, so it is only visible
+    from the worker process which processes it.
+    """
+
+    def __init__(
+        self,
+        ledger: DeliveryLedger,
+        workers: int,
+        recover_interval: float = 20,
+        max_queued: int = 1000,
+        max_deliveries: int = 10000,
+    ):
+        self.ledger = ledger
+        self.workers = workers
+        self.recover_interval = recover_interval
+        self.max_queued = max_queued
+        self.max_deliveries = max_deliveries
+        self.deliveries = OrderedDict()
+        self.handler = None
+        self.queue = None
+        self.tasks = []
+
+    async def start(self, handler):
+        """
+        Start the workers
+
+        Args:
+            handler: Coroutine function called with the event name and the
+                payload of each delivery
+        """
+        self.handler = handler
+        self.queue = asyncio.Queue(maxsize=self.max_queued)
+        self.tasks = [
+            asyncio.create_task(self._worker()) for i in range(self.workers)
+        ]
+        self.tasks.append(asyncio.create_task(self._recover_loop()))
+
+    async def stop(self):
+        """
+        Stop the workers (deliveries still queued or running stay accepted
+        in the ledger, and are recovered once their claim expires)
+        """
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def enqueue(self, guid: str, event: str, payload: dict) -> bool:
+        """
+        Record a delivery and queue it for processing
+
+        Args:
+            guid: The delivery GUID
+            event: The GitHub event name
+            payload: The webhook payload
+
+        Returns:
+            False if the delivery was already processed, otherwise True
+
+        Raises:
+            asyncio.QueueFull: If the queue is full
+        """
+        # Don't record deliveries which can't be queued
+        if self.queue.full():
+            raise asyncio.QueueFull()
+        if not await run_in_threadpool(
+            self.ledger.record, guid, event, payload
+        ):
+            print(f"Duplicate delivery: {guid}")
+            return False
+        try:
+            self._put(guid, event, payload)
+        except asyncio.QueueFull:
+            # Filled up while recording
+            await run_in_threadpool(self.ledger.forget, guid)
+            raise
+        return True
+
+    async def recover(self):
+        """
+        Renew the claims of the deliveries of this process, and queue the
+        deliveries left unprocessed by stopped processes
+        """
+        pending = [
+            guid
+            for guid, delivery in self.deliveries.items()
+            if delivery["status"] in ["queued", "running"]
+        ]
+        if pending:
+            await run_in_threadpool(self.ledger.renew, pending)
+        room = self.max_queued - self.queue.qsize()
+        if room <= 0:
+            return
+        recovered = await run_in_threadpool(self.ledger.recover, room)
+        for guid, event, payload in recovered:
+            print(f"Recovered delivery: {guid}")
+            self._put(guid, event, payload)
+
+    def _put(self, guid: str, event: str, payload: dict):
+        self.queue.put_nowait((guid, event, payload))
+        self.deliveries[guid] = {
+            "guid": guid,
+            "event": event,
+            "action": payload.get("action"),
+            "status": "queued",
+            "received": str(datetime.utcnow()),
+            "finished": None,
+            "error": None,
+        }
+        self._prune()
+
+    def get(self, guid: str) -> dict:
+        """
+        Get the state of a delivery, or None if the delivery is unknown
+        """
+        delivery = self.deliveries.get(guid)
+        return dict(delivery) if delivery is not None else None
+
+    def stats(self) -> dict:
+        """
+        Get the number of queued deliveries, the deliveries by status and
+        the ledger hit / miss counters
+        """
+        statuses = {}
+        for delivery in self.deliveries.values():
+            statuses[delivery["status"]] = (
+                statuses.get(delivery["status"], 0) + 1
+            )
+        return {
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "deliveries": statuses,
+            "ledger": self.ledger.stats(),
+        }
+
+    def _prune(self):
+        # Forget the oldest finished deliveries once over the limit
+        finished = [
+            key
+            for key, delivery in self.deliveries.items()
+            if delivery["status"] in ["complete", "failed"]
+        ]
+        for key in finished[
+            : max(0, len(self.deliveries) - self.max_deliveries)
+        ]:
+            del self.deliveries[key]
+
+    async def _recover_loop(self):
+        while True:
+            try:
+                await self.recover()
+            except Exception as e:
+                print(f"Delivery recovery failed: {e}")
+            await asyncio.sleep(self.recover_interval)
+
+    async def _worker(self):
+        while True:
+            guid, event, payload = await self.queue.get()
+            try:
+                await self._process(guid, event, payload)
+            finally:
+                self.queue.task_done()
+
+    async def _process(self, guid: str, event: str, payload: dict):
+        delivery = self.deliveries[guid]
+        delivery["status"] = "running"
+        try:
+            await self.handler(event, payload)
+            await run_in_threadpool(self.ledger.complete, guid)
+            delivery["status"] = "complete"
+        except Exception as e:
+            print(f"Delivery {guid} failed: {e}")
+            delivery["error"] = str(e)
+            delivery["status"] = "failed"
+            await run_in_threadpool(self.ledger.forget, guid)
+        delivery["finished"] = str(datetime.utcnow())
+
+
+# Worker pool for webhook deliveries
+webhook_queue = WebhookQueue(
+    ledger=delivery_ledger,
+    workers=dependencies.webhook_workers,
+    recover_interval=dependencies.delivery_claim_lease / 3,
+)
@@ -1,22 +1,63 @@
-from bot import utils, schemas, auth
-from bot.dependencies import get_settings, get_db, Settings
+import asyncio
+import uuid
+from bot import schemas, auth, jobs, client, dependencies, webhooks, repos
+from bot.dependencies import get_settings, AsyncSessionLocal, Settings
 from bot.bot import Bot
-from sqlalchemy.orm import Session
 from fastapi import FastAPI, Body, Header, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 
 app = FastAPI()
 
-@app.post("/")
-def bot(
-    payload: dict = Body(...),
-    x_github_event: str = Header(...),
-    access_tokens: dict = Depends(auth.retrieve_access_tokens),
-    db: Session = Depends(get_db),
-    settings: Settings = Depends(get_settings),
-) -> str:
 
+@app.on_event("startup")
+def warm_tokens():
+    # Mint the installation tokens concurrently before serving webhooks
+    auth.warm_access_tokens()
+
+
+@app.on_event("startup")
+async def start_webhook_workers():
+    await webhooks.webhook_queue.start(process_webhook)
+
+
+@app.on_event("startup")
+async def bind_job_queue():
+    # Init jobs run their CRUD app calls on the app's event loop
+    jobs.init_queue.bind(asyncio.get_running_loop())
+
+
+@app.on_event("shutdown")
+async def close_clients():
+    await webhooks.webhook_queue.stop()
+    await client.agh_client.aclose()
+    await client.crud_client.aclose()
+
+
+async def process_webhook(event: str, payload: dict):
+    """
+    Process a webhook delivery (run by the webhook workers)
+    """
     # Init the bot
-    brnbot = Bot(settings=settings)
+    brnbot = Bot(settings=get_settings())
+
+    # Mint the installation token (if not cached yet) off the event loop
+    install_id = payload.get("installation", {}).get("id")
+    if install_id in dependencies.installation_ids.values():
+        await run_in_threadpool(auth.token_manager.get, install_id)
+    access_tokens = auth.retrieve_access_tokens()
+
+    async with AsyncSessionLocal() as db:
+        await brnbot.process_webhook(
+            event, payload, access_tokens=access_tokens, db=db
+        )
+
+
+@app.post("/", status_code=202)
+async def bot(
+    payload: dict = Body(...),
+    x_github_event: str = Header(...),
+    x_github_delivery: str = Header(None),
+) -> dict:
 
     try:
         action = payload["action"]
@@ -30,23 +71,27 @@ def bot(
     event = x_github_event
     print(event + ": " + action)
 
-    if event == "issue_comment" and action == "created":
-        # Check if comment is for the bot and the repo is valid
-        if utils.is_for_bot(payload) and utils.is_valid_repo(payload, db=db):
-            sender = payload["sender"]["login"]
-            message = payload["comment"]["body"]
-            print(sender + ": " + message)
-            brnbot.process_cmd(payload, access_tokens=access_tokens)
-    elif utils.is_pr_commit(payload=payload, event=event):
-        print("is PR commit")
-        brnbot.process_commit(payload, access_tokens=access_tokens)
-    elif utils.is_workflow_run(payload=payload):
-        print("is workflow run")
-        brnbot.process_done_check(payload, access_tokens=access_tokens)
-    return "ok"
+    # Acknowledge now and process the delivery in the background
+    guid = x_github_delivery or uuid.uuid4().hex
+    try:
+        queued = await webhooks.webhook_queue.enqueue(guid, event, payload)
+    except asyncio.QueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many webhook deliveries queued",
+        )
+    return {"delivery": guid, "status": "queued" if queued else "duplicate"}
+
 
+@app.get("/deliveries/{guid}")
+def delivery_status(guid: str) -> dict:
+    delivery = webhooks.webhook_queue.get(guid)
+    if delivery is None:
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    return delivery
 
-@app.post("/init")
+
+@app.post("/init", status_code=202)
 def init(
     init_request: schemas.InitBotRequest,
     access_tokens: dict = Depends(auth.retrieve_access_tokens),
@@ -57,13 +102,21 @@ def init(
     brnbot = Bot(settings=settings)
 
     print("init")
-    gh_url, latest_commit = brnbot.process_init_payload(
-        init_request, access_tokens=access_tokens
+    # Provision the repo in the background and report back to the CRUD app
+    job_id = jobs.init_queue.submit(
+        brnbot.process_init_job,
+        init_request=init_request,
+        access_tokens=access_tokens,
     )
-    return {
-        "github_url": gh_url,
-        "latest_commit": latest_commit,
-    }
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.get("/init/{job_id}")
+def init_status(job_id: str) -> dict:
+    job = jobs.init_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 @app.post("/delete")
@@ -81,6 +134,18 @@ def delete(
     return "ok"
 
 
+@app.get("/stats")
+def stats() -> dict:
+    # Connection pool statistics of the GitHub client
+    return {
+        "github": client.gh_client.stats(),
+        "github_async": client.agh_client.stats(),
+        "crud_async": client.crud_client.stats(),
+        "webhooks": webhooks.webhook_queue.stats(),
+        "repo_cache": repos.repo_cache.stats(),
+    }
+
+
 @app.get("/")
 def root() -> dict:
     return {"message": "Hello World"}
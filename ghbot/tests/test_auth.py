@@ -0,0 +1,140 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import pytest
+from bot import auth
+
+
+class FakeIntegration:
+    def create_jwt(self):
+        return "jwt"
+
+
+@pytest.fixture
+def minted(monkeypatch):
+    """
+    Mint fake tokens (valid for an hour), and record the installations
+    """
+    minted = []
+
+    def get_access_token(installation_id, jwt):
+        minted.append(installation_id)
+        # Leave time for concurrent lookups to wait on the refresh
+        time.sleep(0.05)
+        expires_at = datetime.utcnow() + timedelta(hours=1)
+        return {
+            "token": f"token-{installation_id}-{len(minted)}",
+            "expires_at": expires_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+
+    monkeypatch.setattr(auth, "get_access_token", get_access_token)
+    monkeypatch.setattr(
+        auth.dependencies, "git_integration", FakeIntegration()
+    )
+    return minted
+
+
+@pytest.fixture
+def manager(monkeypatch) -> auth.TokenManager:
+    manager = auth.TokenManager(refresh_margin=timedelta(minutes=5))
+    # Record the background refreshes instead of starting timers
+    manager.scheduled = []
+    monkeypatch.setattr(
+        manager,
+        "schedule",
+        lambda installation_id, when: manager.scheduled.append(
+            (installation_id, when)
+        ),
+    )
+    return manager
+
+
+def test_token_cached(manager, minted):
+    token = manager.get(1)
+    assert token == "token-1-1"
+    assert manager.get(1) == token
+    assert minted == [1]
+
+    # The refresh is scheduled before the token expires
+    installation_id, when = manager.scheduled[-1]
+    assert installation_id == 1
+    expires_at = manager.tokens[1]["expires_at"]
+    assert when == expires_at - timedelta(minutes=5)
+
+
+def test_token_expired(manager, minted):
+    manager.get(1)
+    manager.tokens[1]["expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+    assert manager.get(1) == "token-1-2"
+    assert minted == [1, 1]
+
+
+def test_token_single_refresh(manager, minted):
+    # Concurrent lookups of the same installation mint a single token
+    tokens = []
+    threads = [
+        threading.Thread(target=lambda: tokens.append(manager.get(1)))
+        for i in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tokens == ["token-1-1"] * 5
+    assert minted == [1]
+
+
+def test_token_background_refresh_failed(manager, monkeypatch):
+    def get_access_token(installation_id, jwt):
+        raise RuntimeError("GitHub is down")
+
+    monkeypatch.setattr(auth, "get_access_token", get_access_token)
+    monkeypatch.setattr(
+        auth.dependencies, "git_integration", FakeIntegration()
+    )
+
+    # The refresh is tried again after the retry interval
+    before = datetime.utcnow()
+    manager._background_refresh(1)
+    installation_id, when = manager.scheduled[-1]
+    assert installation_id == 1
+    assert when >= before + auth.dependencies.token_retry_interval
+
+
+def test_token_warm(manager, minted, monkeypatch):
+    def get_access_token(installation_id, jwt):
+        if installation_id == 2:
+            raise RuntimeError("Not installed")
+        minted.append(installation_id)
+        expires_at = datetime.utcnow() + timedelta(hours=1)
+        return {
+            "token": f"token-{installation_id}",
+            "expires_at": expires_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+
+    monkeypatch.setattr(auth, "get_access_token", get_access_token)
+
+    # Failures are reported per installation
+    errors = manager.warm([1, 2, 3])
+    assert errors == {2: "Not installed"}
+    assert sorted(minted) == [1, 3]
+
+
+def test_lazy_tokens(manager, minted):
+    tokens = auth.LazyTokens(manager, [1, 2, 3])
+    assert len(tokens) == 3
+    assert list(tokens) == ["1", "2", "3"]
+    assert "2" in tokens
+    assert 2 in tokens
+    assert "4" not in tokens
+    # Nothing is minted until a token is looked up
+    assert minted == []
+
+    # Only the installations looked up are minted
+    assert tokens["2"] == "token-2-1"
+    assert tokens["2"] == "token-2-1"
+    assert minted == [2]
+
+    with pytest.raises(KeyError):
+        tokens["4"]
+    assert minted == [2]
@@ -1,3 +1,6 @@
+import asyncio
+import httpx
+import pytest
 import random
 import string
 import requests
@@ -101,6 +104,8 @@ def test_init():
         "latest_commit": payload["pull_request"]["head"]["sha"],
         "log": {},
         "status": "Initiated",
+        # Reset the entry whatever its current status
+        "force": True,
     }
     response = requests.patch(
         f"{bot.CRUD_APP_URL}/api/update",
@@ -155,13 +160,13 @@ def test_get_recent_comments():
     text = "test " + "".join(
         random.choices(string.ascii_uppercase + string.digits, k=20)
     )
-    response = utils.post_comment(text=text, **kwarg_dict)
+    response = asyncio.run(utils.post_comment(text=text, **kwarg_dict))
     # Comment should be posted to the test repo
     assert response.status_code == 201
     # Comment should be "test" for the test repo
     assert response.json()["body"] == text
     # Get last comment and check if it is the same as the one we posted
-    comments = utils.get_recent_comments(**kwarg_dict)
+    comments = asyncio.run(utils.get_recent_comments(**kwarg_dict))
     assert comments.json()[-1]["body"] == text
 
     # Confirm ordering of comments is correct
@@ -169,14 +174,14 @@ def test_get_recent_comments():
     text = "test 1 " + "".join(
         random.choices(string.ascii_uppercase + string.digits, k=20)
     )
-    utils.post_comment(text=text, **kwarg_dict)
+    asyncio.run(utils.post_comment(text=text, **kwarg_dict))
     text2 = "test 2 " + "".join(
         random.choices(string.ascii_uppercase + string.digits, k=20)
     )
-    utils.post_comment(text=text2, **kwarg_dict)
+    asyncio.run(utils.post_comment(text=text2, **kwarg_dict))
 
     # Get last comment and check if it is the same as the one we posted
-    comments = utils.get_recent_comments(**kwarg_dict)
+    comments = asyncio.run(utils.get_recent_comments(**kwarg_dict))
     assert comments.status_code == 200
     assert comments.json()[-1]["body"] == text2
     assert comments.json()[-2]["body"] == text
@@ -191,20 +196,20 @@ def test_delete_comment():
     text = "del " + "".join(
         random.choices(string.ascii_uppercase + string.digits, k=20)
     )
-    response = utils.post_comment(text=text, **kwarg_dict)
+    response = asyncio.run(utils.post_comment(text=text, **kwarg_dict))
     comment_id = response.json()["id"]
     # Check if the comment was posted
-    comments = utils.get_comment_by_id(comment_id, **kwarg_dict)
+    comments = asyncio.run(utils.get_comment_by_id(comment_id, **kwarg_dict))
     assert comments.status_code == 404
     # Delete the comment
-    response = utils.delete_comment(comment_id, **kwarg_dict)
+    response = asyncio.run(utils.delete_comment(comment_id, **kwarg_dict))
     assert response.status_code == 204
     # Check if the comment is deleted
-    comments = utils.get_comment_by_id(comment_id, **kwarg_dict)
+    comments = asyncio.run(utils.get_comment_by_id(comment_id, **kwarg_dict))
     assert comments.status_code == 404
 
     # Failure to delete because comment does not exist
-    response = utils.delete_comment(comment_id, **kwarg_dict)
+    response = asyncio.run(utils.delete_comment(comment_id, **kwarg_dict))
     assert response.status_code == 404
 
 
@@ -220,8 +225,8 @@ def test_hello():
 
     payload["comment"]["body"] = "@brnbot hello"
     kwarg_dict = bot.parse_comment_payload(payload, access_tokens=access_tokens)
-    assert bot.process_cmd(payload, access_tokens=access_tokens)
-    response = utils.get_recent_comments(**kwarg_dict)
+    assert asyncio.run(bot.process_cmd(payload, access_tokens=access_tokens))
+    response = asyncio.run(utils.get_recent_comments(**kwarg_dict))
     assert response.json()[-1]["body"] == f"Hello, @{kwarg_dict['sender']}! 😊"
 
 
@@ -231,8 +236,8 @@ def test_invalid():
     """
     payload["comment"]["body"] = "@brnbot invalid"
     kwarg_dict = bot.parse_comment_payload(payload, access_tokens=access_tokens)
-    assert bot.process_cmd(payload, access_tokens=access_tokens)
-    response = utils.get_recent_comments(**kwarg_dict)
+    assert asyncio.run(bot.process_cmd(payload, access_tokens=access_tokens))
+    response = asyncio.run(utils.get_recent_comments(**kwarg_dict))
     assert response.json()[-1]["body"] == "Invalid command. Try @brnbot help"
 
 
@@ -242,8 +247,8 @@ def test_help():
     """
     payload["comment"]["body"] = "@brnbot help"
     kwarg_dict = bot.parse_comment_payload(payload, access_tokens=access_tokens)
-    assert bot.process_cmd(payload, access_tokens=access_tokens)
-    response = utils.get_recent_comments(**kwarg_dict)
+    assert asyncio.run(bot.process_cmd(payload, access_tokens=access_tokens))
+    response = asyncio.run(utils.get_recent_comments(**kwarg_dict))
     assert "Available commands" in response.json()[-1]["body"]
 
 
@@ -253,14 +258,14 @@ def test_update_on_commit():
     """
 
     # Successful update command
-    response = bot.process_commit(payload, access_tokens=access_tokens)
+    response = asyncio.run(bot.process_commit(payload, access_tokens=access_tokens))
     kwarg_dict = bot.parse_commit_payload(
         payload, access_tokens=access_tokens
     )
     assert response.json()
     assert response.status_code == 200
     # Confirm the latest comment is the output of the command
-    response2 = utils.get_recent_comments(**kwarg_dict)
+    response2 = asyncio.run(utils.get_recent_comments(**kwarg_dict))
     assert kwarg_dict["last_commit"] in response2.json()[-1]["body"]
 
 
@@ -271,12 +276,12 @@ def test_check():
 
     # Successful check command
     payload["comment"]["body"] = "@brnbot check"
-    assert bot.process_cmd(payload, access_tokens=access_tokens)
+    assert asyncio.run(bot.process_cmd(payload, access_tokens=access_tokens))
 
     # Second person on the repo can request a check
     payload2 = copy.deepcopy(payload)
     payload2["sender"]["login"] = "brnbot2"
-    assert bot.process_cmd(payload2, access_tokens=access_tokens)
+    assert asyncio.run(bot.process_cmd(payload2, access_tokens=access_tokens))
 
 
 def test_review():
@@ -287,10 +292,12 @@ def test_review():
     # Set the assessment to be passing checks using the update command
     kwarg_dict = bot.parse_comment_payload(payload, access_tokens=access_tokens)
     # Get last commit
-    latest_commit = utils.get_last_commit(
-        owner=kwarg_dict["owner"],
-        repo_name=kwarg_dict["repo_name"],
-        access_token=kwarg_dict["access_token"],
+    latest_commit = asyncio.run(
+        utils.get_last_commit(
+            owner=kwarg_dict["owner"],
+            repo_name=kwarg_dict["repo_name"],
+            access_token=kwarg_dict["access_token"],
+        )
     )["sha"]
     # Update the assessment tracker to this commit
     request_url = f"{bot.CRUD_APP_URL}/api/update"
@@ -319,12 +326,32 @@ def test_review():
     print("Review")
     payload["comment"]["body"] = "@brnbot review"
     kwarg_dict = bot.parse_comment_payload(payload, access_tokens=access_tokens)
-    response = bot.process_cmd(payload, access_tokens=access_tokens)
+    response = asyncio.run(bot.process_cmd(payload, access_tokens=access_tokens))
     assert response.status_code == 200
     assert response.json()["reviewer_username"] != "bioresnet"
     # Confirm the reviewer is correct
-    reviewer_response = utils.get_reviewer(**kwarg_dict)
+    reviewer_response = asyncio.run(utils.get_reviewer(**kwarg_dict))
     assert (
         reviewer_response.json()["users"][0]["login"]
         == response.json()["reviewer_username"]
     )
+
+
+def test_changes():
+    """
+    Test the bot's changes command
+    """
+
+    # Only the assigned reviewer can request changes
+    payload["comment"]["body"] = "@brnbot changes"
+    kwarg_dict = bot.parse_comment_payload(payload, access_tokens=access_tokens)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(bot.process_cmd(payload, access_tokens=access_tokens))
+
+    # The reviewer sends the assessment back to the trainee
+    reviewer_response = asyncio.run(utils.get_reviewer(**kwarg_dict))
+    payload2 = copy.deepcopy(payload)
+    payload2["sender"]["login"] = reviewer_response.json()["users"][0]["login"]
+    response = asyncio.run(bot.process_cmd(payload2, access_tokens=access_tokens))
+    assert response.status_code == 200
+    assert response.json() == {"Changes Requested": True}
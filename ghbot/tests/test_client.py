@@ -0,0 +1,172 @@
+import asyncio
+import httpx
+import pytest
+from bot import client
+from bot.ratelimit import RateLimiter
+
+
+class FakeResponse:
+    """
+    Response of a mocked GitHub call
+    """
+
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSession:
+    """
+    Session returning the given responses in order
+    """
+
+    def __init__(self, responses: list):
+        self.responses = list(responses)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Record the waits instead of sleeping
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(client.time, "sleep", sleeps.append)
+    monkeypatch.setattr(client.asyncio, "sleep", sleep)
+    return sleeps
+
+
+def make_client(responses: list, **kwargs) -> client.GitHubClient:
+    gh_client = client.GitHubClient(
+        pool_maxsize=1,
+        timeout=(1, 1),
+        limiter=RateLimiter(write_capacity=10, write_rate=1),
+        **kwargs,
+    )
+    gh_client.session = FakeSession(responses)
+    return gh_client
+
+
+def test_github_client_retries_rate_limit(sleeps):
+    gh_client = make_client(
+        [FakeResponse(429, {"Retry-After": "2"}), FakeResponse(200)]
+    )
+    response = gh_client.get("https://api.github.com/repos/a/b")
+    assert response.status_code == 200
+    assert len(gh_client.session.calls) == 2
+    # The second call waits for the Retry-After delay
+    assert len(sleeps) == 1 and 1 < sleeps[0] <= 2
+    assert gh_client.session.calls[0][2]["timeout"] == (1, 1)
+
+
+def test_github_client_gives_up(sleeps):
+    # Too long a wait: the rejected response is returned
+    gh_client = make_client(
+        [FakeResponse(403, {"Retry-After": "3600"})], max_retry_wait=60
+    )
+    response = gh_client.post("https://api.github.com/repos/a/b/pulls")
+    assert response.status_code == 403
+    assert len(gh_client.session.calls) == 1
+
+    # At most max_retries retries
+    gh_client = make_client(
+        [FakeResponse(429, {"Retry-After": "0"})] * 3, max_retries=2
+    )
+    response = gh_client.get("https://api.github.com/repos/a/b")
+    assert response.status_code == 429
+    assert len(gh_client.session.calls) == 3
+    assert gh_client.stats()["requests"] == 3
+
+
+def run(http_client: client.AsyncHTTPClient, method: str, **kwargs):
+    async def request():
+        try:
+            return await http_client.request(
+                method, "https://crud.test/assessment", **kwargs
+            )
+        finally:
+            await http_client.aclose()
+
+    return asyncio.run(request())
+
+
+def make_async_client(statuses: list, **kwargs) -> tuple:
+    """
+    Client answering with the given statuses in order (an exception is
+    raised instead of answering), and the list of the calls made
+    """
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        status = statuses.pop(0)
+        if isinstance(status, Exception):
+            raise status
+        return httpx.Response(status)
+
+    http_client = client.AsyncHTTPClient(
+        pool_maxsize=1,
+        timeout=(1, 1),
+        transport=httpx.MockTransport(handler),
+        **kwargs,
+    )
+    return http_client, calls
+
+
+def test_server_error_retried_if_idempotent(sleeps):
+    http_client, calls = make_async_client(
+        [502, 503, 200], server_retries=2, server_backoff=1
+    )
+    assert run(http_client, "GET").status_code == 200
+    assert calls == ["GET", "GET", "GET"]
+    # The backoff doubles after each retry
+    assert sleeps == [1, 2]
+    assert http_client.stats()["requests"] == 3
+
+
+def test_server_error_not_retried_for_post(sleeps):
+    http_client, calls = make_async_client([502, 200], server_retries=2)
+    assert run(http_client, "POST").status_code == 502
+    assert calls == ["POST"]
+
+    # Unless the call is marked as idempotent
+    http_client, calls = make_async_client([502, 200], server_retries=2)
+    assert run(http_client, "POST", idempotent=True).status_code == 200
+    assert calls == ["POST", "POST"]
+
+
+def test_server_error_retries_exhausted(sleeps):
+    http_client, calls = make_async_client([500, 500, 500], server_retries=2)
+    assert run(http_client, "PUT").status_code == 500
+    assert len(calls) == 3
+
+
+def test_transport_error_retried_if_idempotent(sleeps):
+    error = httpx.ConnectError("Connection refused")
+    http_client, calls = make_async_client([error, 200], server_retries=2)
+    assert run(http_client, "GET").status_code == 200
+    assert len(calls) == 2
+
+    http_client, calls = make_async_client([error, 200], server_retries=2)
+    with pytest.raises(httpx.ConnectError):
+        run(http_client, "PATCH")
+    assert len(calls) == 1
+
+
+def test_conflict_retried(sleeps):
+    http_client, calls = make_async_client(
+        [409, 409, 200], conflict_retries=2, conflict_backoff=0.5
+    )
+    assert run(http_client, "PATCH").status_code == 200
+    assert len(calls) == 3
+    assert sleeps == [0.5, 1.0]
+
+    # Without conflict retries, the 409 is returned
+    http_client, calls = make_async_client([409, 200])
+    assert run(http_client, "PATCH").status_code == 409
@@ -0,0 +1,137 @@
+import sqlite3
+import pytest
+from bot import deliveries
+
+
+class Clock:
+    """
+    Fake clock for time.time
+    """
+
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(deliveries.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "ledger" / "deliveries.sqlite3")
+
+
+def test_record_duplicate(path, clock):
+    ledger = deliveries.DeliveryLedger(path, ttl=3600, lease=60)
+    assert ledger.record("guid-1", "push", {"ref": "main"})
+    # Accepted and still claimed: being processed
+    assert not ledger.record("guid-1", "push", {"ref": "main"})
+    ledger.complete("guid-1")
+    # Done: a duplicate
+    assert not ledger.record("guid-1", "push", {"ref": "main"})
+    assert ledger.stats() == {"hits": 2, "misses": 1, "recovered": 0}
+
+
+def test_forget(path, clock):
+    ledger = deliveries.DeliveryLedger(path, ttl=3600)
+    assert ledger.record("guid-1", "push", {})
+    ledger.complete("guid-1")
+    ledger.forget("guid-1")
+    # A forgotten delivery is processed again
+    assert ledger.record("guid-1", "push", {})
+
+
+def test_lease_expiry_and_recover(path, clock):
+    stopped = deliveries.DeliveryLedger(path, ttl=3600, lease=60)
+    ledger = deliveries.DeliveryLedger(path, ttl=3600, lease=60)
+    assert stopped.record("guid-1", "pull_request", {"action": "opened"})
+    assert stopped.record("guid-2", "pull_request", {"action": "closed"})
+
+    # Still claimed by the other process
+    assert ledger.recover(10) == []
+
+    # The claims of the stopped process expire
+    clock.now += 61
+    recovered = ledger.recover(1)
+    assert recovered == [("guid-1", "pull_request", {"action": "opened"})]
+    # A claimed delivery is not recovered twice
+    assert ledger.recover(10) == [
+        ("guid-2", "pull_request", {"action": "closed"})
+    ]
+    assert ledger.recover(10) == []
+    assert ledger.stats()["recovered"] == 2
+
+    # The claim of the new owner expires in turn if not renewed
+    clock.now += 61
+    assert stopped.recover(10) != []
+
+
+def test_renew(path, clock):
+    ledger = deliveries.DeliveryLedger(path, ttl=3600, lease=60)
+    other = deliveries.DeliveryLedger(path, ttl=3600, lease=60)
+    assert ledger.record("guid-1", "push", {})
+    assert ledger.record("guid-2", "push", {})
+
+    # Only the renewed claims are kept
+    clock.now += 50
+    ledger.renew(["guid-1"])
+    clock.now += 20
+    assert other.recover(10) == [("guid-2", "push", {})]
+
+    # Renewing the deliveries of another process does nothing
+    other.renew(["guid-1"])
+    clock.now += 50
+    assert other.recover(10) == [("guid-1", "push", {})]
+
+
+def test_record_takes_over_expired_claim(path, clock):
+    stopped = deliveries.DeliveryLedger(path, ttl=3600, lease=60)
+    ledger = deliveries.DeliveryLedger(path, ttl=3600, lease=60)
+    assert stopped.record("guid-1", "push", {})
+    clock.now += 61
+    # A redelivery of an abandoned delivery is processed
+    assert ledger.record("guid-1", "push", {})
+    assert stopped.recover(10) == []
+
+
+def test_ttl_and_purge(path, clock):
+    ledger = deliveries.DeliveryLedger(
+        path, ttl=3600, lease=60, purge_interval=60
+    )
+    assert ledger.record("guid-1", "push", {})
+    ledger.complete("guid-1")
+
+    # An expired entry is processed again, even before it is purged
+    clock.now += 3601
+    assert ledger.record("guid-1", "push", {})
+    assert ledger.recover(10) == []
+
+    # Expired entries are purged while recording
+    clock.now += 3601
+    assert ledger.record("guid-2", "push", {})
+    conn = sqlite3.connect(path)
+    guids = [row[0] for row in conn.execute("SELECT guid FROM deliveries")]
+    conn.close()
+    assert guids == ["guid-2"]
+
+
+def test_old_ledger_replaced(path, clock):
+    # Ledger of an older version, without payloads
+    ledger = deliveries.DeliveryLedger(path, ttl=3600)
+    ledger.connect()
+    ledger.conn.execute("DROP TABLE deliveries")
+    ledger.conn.execute(
+        "CREATE TABLE deliveries (guid TEXT PRIMARY KEY, received_at REAL)"
+    )
+    ledger.conn.execute("INSERT INTO deliveries VALUES ('guid-1', 0)")
+    ledger.conn.commit()
+    ledger.conn.close()
+
+    ledger = deliveries.DeliveryLedger(path, ttl=3600)
+    assert ledger.record("guid-1", "push", {})
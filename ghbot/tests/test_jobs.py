@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+from bot import jobs
+
+
+def wait_for(queue: jobs.JobQueue, job_id: str, timeout: float = 5) -> dict:
+    # Wait until the job is finished
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in ["complete", "failed"]:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_job_complete():
+    queue = jobs.JobQueue(max_workers=1)
+
+    def provision(job_id, progress, note, name):
+        progress("create_repo")
+        progress("create_pr")
+        note("notify", {"status": "done"})
+        return {"repo": name}
+
+    job_id = queue.submit(provision, name="test-repo")
+    job = wait_for(queue, job_id)
+    assert job["status"] == "complete"
+    assert job["result"] == {"repo": "test-repo"}
+    assert job["error"] is None
+    assert [step["name"] for step in job["steps"]] == [
+        "create_repo",
+        "create_pr",
+    ]
+    assert all(step["status"] == "done" for step in job["steps"])
+    assert job["notes"] == {"notify": {"status": "done"}}
+
+
+def test_job_failed():
+    queue = jobs.JobQueue(max_workers=1)
+
+    def provision(job_id, progress, note):
+        progress("create_repo")
+        note("notify", {"status": "failed"})
+        raise RuntimeError("Repo already exists")
+
+    job_id = queue.submit(provision)
+    job = wait_for(queue, job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "Repo already exists"
+    assert job["steps"][-1]["status"] == "failed"
+    # Notes are kept apart from the error
+    assert job["notes"] == {"notify": {"status": "failed"}}
+
+
+def test_job_unknown():
+    queue = jobs.JobQueue(max_workers=1)
+    assert queue.get("unknown") is None
+
+
+def test_job_prune():
+    queue = jobs.JobQueue(max_workers=1, max_jobs=2)
+    job_ids = []
+    for i in range(3):
+        job_ids.append(queue.submit(lambda job_id, progress, note: None))
+        wait_for(queue, job_ids[-1])
+
+    # The oldest finished job is forgotten once over the limit
+    job_ids.append(queue.submit(lambda job_id, progress, note: None))
+    wait_for(queue, job_ids[-1])
+    assert queue.get(job_ids[0]) is None
+    assert queue.get(job_ids[-1]) is not None
+
+
+def test_run_async():
+    queue = jobs.JobQueue(max_workers=1)
+
+    async def get_loop():
+        return asyncio.get_running_loop()
+
+    # Without a bound loop, the coroutine runs on a new loop
+    assert queue.run_async(get_loop()) is not None
+
+    # With a bound loop, job threads run the coroutine on it
+    async def main():
+        loop = asyncio.get_running_loop()
+        queue.bind(loop)
+        result = {}
+        thread = threading.Thread(
+            target=lambda: result.update(loop=queue.run_async(get_loop()))
+        )
+        thread.start()
+        while thread.is_alive():
+            await asyncio.sleep(0.01)
+        assert result["loop"] is loop
+
+    asyncio.run(main())
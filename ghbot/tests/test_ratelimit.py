@@ -0,0 +1,114 @@
+from email.utils import formatdate
+import pytest
+from bot import ratelimit
+
+
+class Clock:
+    """
+    Fake clock for time.time and time.monotonic
+    """
+
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "time", clock)
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+def test_parse_retry_after():
+    now = 1_700_000_000.0
+    assert ratelimit.parse_retry_after("30", now) == 30
+    assert ratelimit.parse_retry_after("-5", now) == 0
+    # HTTP date
+    assert ratelimit.parse_retry_after(
+        formatdate(now + 120, usegmt=True), now
+    ) == pytest.approx(120)
+    # A date in the past does not wait
+    assert ratelimit.parse_retry_after(
+        formatdate(now - 120, usegmt=True), now
+    ) == 0
+    # Unparseable: wait a minute
+    assert ratelimit.parse_retry_after("soon", now) == 60
+
+
+def test_token_bucket(clock):
+    bucket = ratelimit.TokenBucket(capacity=2, rate=0.5)
+    # The burst is not delayed
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    # Then calls wait for the refill
+    assert bucket.reserve() == pytest.approx(2)
+    assert bucket.reserve() == pytest.approx(4)
+
+    # The bucket refills up to its capacity
+    clock.now += 100
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(2)
+
+
+def test_rate_limiter_write_bucket(clock):
+    limiter = ratelimit.RateLimiter(write_capacity=1, write_rate=1)
+    assert limiter.delay("token a", "POST") == 0
+    assert limiter.delay("token a", "patch") == pytest.approx(1)
+    # Reads and other tokens are not delayed
+    assert limiter.delay("token a", "GET") == 0
+    assert limiter.delay("token b", "POST") == 0
+    assert limiter.stats()["delays"] == 1
+
+
+def test_rate_limiter_primary_limit(clock):
+    limiter = ratelimit.RateLimiter(write_capacity=10, write_rate=1)
+    reset = clock.now + 30
+    headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(reset)}
+
+    # A successful call using the last request does not retry
+    assert limiter.update("token", FakeResponse(200, headers)) is None
+    assert limiter.delay("token", "GET") == pytest.approx(30)
+
+    # A rejected call retries after the reset
+    assert limiter.update("token", FakeResponse(403, headers)) == (
+        pytest.approx(30)
+    )
+
+    # After the reset, calls are not delayed
+    clock.now = reset
+    assert limiter.delay("token", "GET") == 0
+
+
+def test_rate_limiter_retry_after(clock):
+    limiter = ratelimit.RateLimiter(write_capacity=10, write_rate=1)
+    response = FakeResponse(429, {"Retry-After": "10"})
+    assert limiter.update("token", response) == 10
+    # All the calls of the token wait for the deadline
+    assert limiter.delay("token", "GET") == pytest.approx(10)
+    clock.now += 4
+    assert limiter.delay("token", "GET") == pytest.approx(6)
+    assert limiter.delay("other token", "GET") == 0
+
+    # A 403 without rate limit headers is not retried
+    assert limiter.update("other token", FakeResponse(403)) is None
+
+
+def test_rate_limiter_prune(clock):
+    limiter = ratelimit.RateLimiter(write_capacity=10, write_rate=1)
+    limiter.delay("old token", "GET")
+    clock.now += 3 * 60 * 60
+    limiter.delay("new token", "GET")
+    # The tokens are not kept in clear
+    assert list(limiter.states) == [limiter.key("new token")]
+    assert limiter.stats()["tokens"] == 1
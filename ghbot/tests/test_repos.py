@@ -0,0 +1,70 @@
+import pytest
+from bot import repos
+
+
+class Clock:
+    """
+    Fake clock for time.monotonic
+    """
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(repos.time, "monotonic", clock)
+    return clock
+
+
+def test_repo_cache_ttls(clock):
+    cache = repos.RepoCache(positive_ttl=600, negative_ttl=60, max_size=10)
+    assert cache.get("owner", "known") is None
+    cache.set("owner", "known", True)
+    cache.set("owner", "unknown", False)
+    assert cache.get("owner", "known") is True
+    assert cache.get("owner", "unknown") is False
+
+    # Unknown repos expire first
+    clock.now += 61
+    assert cache.get("owner", "unknown") is None
+    assert cache.get("owner", "known") is True
+
+    clock.now += 540
+    assert cache.get("owner", "known") is None
+    assert cache.stats() == {"size": 0, "hits": 3, "misses": 3}
+
+
+def test_repo_cache_found_after_negative(clock):
+    cache = repos.RepoCache(positive_ttl=600, negative_ttl=60, max_size=10)
+    cache.set("owner", "repo", False)
+    # A repo found later is cached with the positive TTL
+    cache.set("owner", "repo", True)
+    clock.now += 300
+    assert cache.get("owner", "repo") is True
+
+
+def test_repo_cache_max_size(clock):
+    cache = repos.RepoCache(positive_ttl=600, negative_ttl=60, max_size=2)
+    cache.set("owner", "a", True)
+    cache.set("owner", "b", True)
+    # The least recently used entry is evicted
+    assert cache.get("owner", "a") is True
+    cache.set("owner", "c", True)
+    assert cache.get("owner", "b") is None
+    assert cache.get("owner", "a") is True
+    assert cache.get("owner", "c") is True
+    assert cache.stats()["size"] == 2
+
+
+def test_repo_cache_invalidate(clock):
+    cache = repos.RepoCache(positive_ttl=600, negative_ttl=60, max_size=10)
+    cache.set("owner", "repo", False)
+    cache.invalidate("owner", "repo")
+    assert cache.get("owner", "repo") is None
+    # Unknown repos are ignored
+    cache.invalidate("owner", "other")
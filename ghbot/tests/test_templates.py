@@ -0,0 +1,193 @@
+import base64
+import io
+import json
+import os
+import pytest
+from bot import templates
+
+
+class FakeObject:
+    def __init__(self, bucket, key: str):
+        self.bucket = bucket
+        self.key = key
+
+    def get(self):
+        if self.key not in self.bucket.files:
+            raise templates.ClientError(
+                {"Error": {"Code": "NoSuchKey"}}, "GetObject"
+            )
+        return {"Body": io.BytesIO(self.bucket.files[self.key])}
+
+
+class FakeObjects:
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def filter(self, Prefix: str):
+        return [
+            FakeObject(self.bucket, key)
+            for key in self.bucket.files
+            if key.startswith(Prefix)
+        ]
+
+
+class FakeBucket:
+    """
+    S3 bucket holding the template files (and bundles) in memory
+    """
+
+    def __init__(self, files: dict):
+        self.files = files
+        self.objects = FakeObjects(self)
+        self.downloads = 0
+
+    def Object(self, key: str):
+        return FakeObject(self, key)
+
+    def download_file(self, key: str, target: str):
+        self.downloads += 1
+        with open(target, "wb") as f:
+            f.write(self.files[key])
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    bucket = FakeBucket(
+        {
+            "templates/repo-a/v1/README.md": b"# A" * 100,
+            "templates/repo-b/v1/README.md": b"# B" * 100,
+            "templates/repo-c/v1/README.md": b"# C" * 100,
+        }
+    )
+    s3 = type("S3", (), {"Bucket": lambda self, name: bucket})()
+    monkeypatch.setattr(
+        templates.boto3, "resource", lambda *args, **kwargs: s3
+    )
+    return bucket
+
+
+settings = type(
+    "Settings",
+    (),
+    {
+        "AWS_ACCESS_KEY": "key",
+        "AWS_SECRET_KEY": "secret",
+        "AWS_REGION": "us-east-1",
+        "AWS_BUCKET": "bucket",
+    },
+)()
+
+
+def test_acquire_miss_then_hit(tmp_path, bucket):
+    cache = templates.TemplateCache(root=str(tmp_path), max_bytes=10**6)
+
+    manifest = cache.acquire("repo-a", "v1", settings)
+    sha = manifest["files"]["README.md"]
+    assert sha == templates.git_blob_sha(b"# A" * 100)
+    assert base64.b64decode(cache.read_object(sha)) == b"# A" * 100
+    cache.release(manifest)
+
+    # Served from the cache
+    assert cache.acquire("repo-a", "v1", settings) == manifest
+    cache.release(manifest)
+    assert bucket.downloads == 1
+    assert cache.pins == {}
+
+
+def test_evict_lru_except_pinned(tmp_path, bucket):
+    # Room for a single release, no minimum age
+    cache = templates.TemplateCache(
+        root=str(tmp_path), max_bytes=300, min_age=0
+    )
+
+    manifest_a = cache.acquire("repo-a", "v1", settings)
+    manifest_b = cache.acquire("repo-b", "v1", settings)
+
+    # Both are pinned, so neither is evicted
+    assert os.path.exists(cache.manifest_path("repo-a", "v1"))
+    assert os.path.exists(cache.manifest_path("repo-b", "v1"))
+
+    # Once released, the least recently used one is evicted with its files
+    cache.release(manifest_a)
+    cache.release(manifest_b)
+    os.utime(cache.manifest_path("repo-a", "v1"), (1, 1))
+    manifest_c = cache.acquire("repo-c", "v1", settings)
+    assert not os.path.exists(cache.manifest_path("repo-a", "v1"))
+    assert not os.path.exists(
+        cache.object_path(manifest_a["files"]["README.md"])
+    )
+    assert os.path.exists(cache.manifest_path("repo-c", "v1"))
+    cache.release(manifest_c)
+
+
+def test_evict_keeps_recently_used(tmp_path, bucket):
+    # Releases used in the last hour are kept, even over the budget
+    cache = templates.TemplateCache(
+        root=str(tmp_path), max_bytes=300, min_age=3600
+    )
+
+    manifest_a = cache.acquire("repo-a", "v1", settings)
+    cache.release(manifest_a)
+    manifest_b = cache.acquire("repo-b", "v1", settings)
+    cache.release(manifest_b)
+    assert os.path.exists(cache.manifest_path("repo-a", "v1"))
+    assert os.path.exists(cache.manifest_path("repo-b", "v1"))
+
+    # Once old enough, the oldest is evicted
+    os.utime(cache.manifest_path("repo-a", "v1"), (1, 1))
+    cache.min_age = 60
+    cache.evict()
+    assert not os.path.exists(cache.manifest_path("repo-a", "v1"))
+    assert os.path.exists(cache.manifest_path("repo-b", "v1"))
+    with open(cache.manifest_path("repo-b", "v1")) as f:
+        assert json.load(f) == manifest_b
+
+
+def make_bundle(files: dict) -> bytes:
+    return json.dumps(
+        {
+            "files": [
+                {
+                    "path": path,
+                    "sha": templates.git_blob_sha(content),
+                    "content": base64.b64encode(content).decode("utf-8"),
+                }
+                for path, content in files.items()
+            ]
+        }
+    ).encode("utf-8")
+
+
+def test_acquire_bundle(tmp_path, bucket):
+    bucket.files["bundles/repo-a/v1.json"] = make_bundle(
+        {"README.md": b"# A" * 100}
+    )
+    cache = templates.TemplateCache(root=str(tmp_path), max_bytes=10**6)
+
+    # The bundle is used instead of the raw files
+    manifest = cache.acquire("repo-a", "v1", settings)
+    cache.release(manifest)
+    assert manifest["files"] == {
+        "README.md": templates.git_blob_sha(b"# A" * 100)
+    }
+    assert bucket.downloads == 0
+
+
+def test_acquire_corrupt_bundle(tmp_path, bucket):
+    bundle = json.loads(make_bundle({"README.md": b"# A" * 100}))
+    bundle["files"][0]["content"] = base64.b64encode(b"# A").decode("utf-8")
+    bucket.files["bundles/repo-a/v1.json"] = json.dumps(bundle).encode()
+    bucket.files["bundles/repo-b/v1.json"] = make_bundle(
+        {"README.md": b"# B" * 100}
+    )[:50]
+    cache = templates.TemplateCache(root=str(tmp_path), max_bytes=10**6)
+
+    # A file not matching its SHA, or a truncated bundle, is not cached:
+    # the raw files are downloaded instead
+    for template_repo, content in [("repo-a", b"# A"), ("repo-b", b"# B")]:
+        manifest = cache.acquire(template_repo, "v1", settings)
+        cache.release(manifest)
+        sha = manifest["files"]["README.md"]
+        assert sha == templates.git_blob_sha(content * 100)
+        assert base64.b64decode(cache.read_object(sha)) == content * 100
+    assert bucket.downloads == 2
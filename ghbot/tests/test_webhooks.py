@@ -0,0 +1,138 @@
+import asyncio
+import pytest
+from bot.deliveries import DeliveryLedger
+from bot.webhooks import WebhookQueue
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return DeliveryLedger(path=str(tmp_path / "deliveries.sqlite3"), ttl=60)
+
+
+def run_queue(queue: WebhookQueue, handler, deliveries: list) -> list:
+    """
+    Enqueue the deliveries, wait until they are processed, and return the
+    results of enqueue
+    """
+
+    async def main():
+        await queue.start(handler)
+        try:
+            results = [
+                await queue.enqueue(guid, event, payload)
+                for guid, event, payload in deliveries
+            ]
+            await queue.queue.join()
+            return results
+        finally:
+            await queue.stop()
+
+    return asyncio.run(main())
+
+
+def test_webhook_processed(ledger):
+    handled = []
+
+    async def handler(event, payload):
+        handled.append((event, payload["action"]))
+
+    queue = WebhookQueue(ledger, workers=2)
+    results = run_queue(
+        queue,
+        handler,
+        [
+            ("guid-1", "pull_request", {"action": "opened"}),
+            ("guid-2", "check_suite", {"action": "completed"}),
+        ],
+    )
+    assert results == [True, True]
+    assert sorted(handled) == [
+        ("check_suite", "completed"),
+        ("pull_request", "opened"),
+    ]
+    delivery = queue.get("guid-1")
+    assert delivery["status"] == "complete"
+    assert delivery["action"] == "opened"
+    assert delivery["finished"] is not None
+    assert queue.get("unknown") is None
+    assert queue.stats()["deliveries"] == {"complete": 2}
+
+
+def test_webhook_duplicate(ledger):
+    handled = []
+
+    async def handler(event, payload):
+        handled.append(event)
+
+    # A redelivery of a processed delivery is skipped
+    queue = WebhookQueue(ledger, workers=1)
+    delivery = ("guid-1", "pull_request", {"action": "opened"})
+    assert run_queue(queue, handler, [delivery]) == [True]
+    assert run_queue(queue, handler, [delivery]) == [False]
+    assert handled == ["pull_request"]
+    assert queue.stats()["ledger"]["hits"] == 1
+
+
+def test_webhook_failed(ledger):
+    calls = []
+
+    async def handler(event, payload):
+        calls.append(event)
+        if len(calls) == 1:
+            raise RuntimeError("CRUD app unavailable")
+
+    queue = WebhookQueue(ledger, workers=1)
+    delivery = ("guid-1", "pull_request", {"action": "opened"})
+    assert run_queue(queue, handler, [delivery]) == [True]
+    assert queue.get("guid-1")["status"] == "failed"
+    assert queue.get("guid-1")["error"] == "CRUD app unavailable"
+
+    # The failed delivery is forgotten, so a redelivery is processed
+    assert run_queue(queue, handler, [delivery]) == [True]
+    assert queue.get("guid-1")["status"] == "complete"
+    assert len(calls) == 2
+
+
+def test_webhook_queue_full(ledger):
+    async def main():
+        queue = WebhookQueue(ledger, workers=0, max_queued=1)
+        await queue.start(None)
+        await queue.enqueue("guid-1", "push", {})
+        with pytest.raises(asyncio.QueueFull):
+            await queue.enqueue("guid-2", "push", {})
+        await queue.stop()
+
+    asyncio.run(main())
+    # The rejected delivery is not recorded
+    assert ledger.record("guid-2", "push", {})
+
+
+def test_webhook_recover(ledger):
+    # A delivery accepted by a process which stopped before processing it
+    stopped = DeliveryLedger(path=ledger.path, ttl=60, lease=0)
+    assert stopped.record("guid-1", "pull_request", {"action": "opened"})
+
+    handled = []
+
+    async def handler(event, payload):
+        handled.append((event, payload))
+
+    async def main():
+        queue = WebhookQueue(ledger, workers=1, recover_interval=60)
+        await queue.start(handler)
+        try:
+            # Recovered by the first recovery pass
+            for i in range(500):
+                if handled:
+                    break
+                await asyncio.sleep(0.01)
+            await queue.queue.join()
+            return queue
+        finally:
+            await queue.stop()
+
+    queue = asyncio.run(main())
+    assert handled == [("pull_request", {"action": "opened"})]
+    assert queue.get("guid-1")["status"] == "complete"
+    assert ledger.stats()["recovered"] == 1
+    assert not ledger.record("guid-1", "pull_request", {})
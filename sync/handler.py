@@ -4,6 +4,7 @@ from utils import (
     sync_assessments,
     download_releases_from_github,
     upload_releases_to_aws,
+    upload_release_bundles_to_aws,
     sync_badges,
 )
 from config import settings
@@ -27,8 +28,13 @@ def lambda_handler(event, context):
     1. Print the environment configuration
     2. Sync the assessments database from airtable
     3. Sync the badges from badgr
-    4. Sync the assertions from badgr
+    4. Sync the assertions from badgr (only the new ones, unless the
+       event has "full_sync": true)
     5. Sync the releases from github (code needed for launching new assessments)
+    6. Publish pre-encoded bundles of the releases for the bot
+
+    If the event has "dry_run": true, steps 2-4 only print the rows they
+    would insert or update, and steps 5-6 are skipped.
     """
 
     if context:
@@ -47,16 +53,27 @@ def lambda_handler(event, context):
         )
 
     # Run all sync functions
-    print(flm("Starting sync"))
+    event = event or {}
+    dry_run = bool(event.get("dry_run"))
+    print(flm("Starting sync" + (" (dry run)" if dry_run else "")))
 
     print(flm("Syncing assessments..."))
-    sync_assessments(settings=settings, db_session=db_session)
+    sync_assessments(settings=settings, db_session=db_session, dry_run=dry_run)
 
     print(flm("Syncing badges..."))
-    sync_badges(settings=settings, db_session=db_session)
+    sync_badges(settings=settings, db_session=db_session, dry_run=dry_run)
 
     print(flm("Syncing assertions..."))
-    sync_assertions(settings=settings, db_session=db_session)
+    sync_assertions(
+        settings=settings,
+        db_session=db_session,
+        full_sync=bool(event.get("full_sync")),
+        dry_run=dry_run,
+    )
+
+    if dry_run:
+        print(flm("Dry run complete!"))
+        return
 
     print(flm("Syncing code - Downloading..."))
     download_releases_from_github(settings=settings, db_session=db_session)
@@ -64,6 +81,9 @@ def lambda_handler(event, context):
     print(flm("Syncing code - Uploading..."))
     upload_releases_to_aws(settings=settings)
 
+    print(flm("Syncing code - Bundling..."))
+    upload_release_bundles_to_aws(settings=settings)
+
     print(flm("Syncing complete!"))
 
 
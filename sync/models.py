@@ -50,6 +50,8 @@ class Assessments(Base):
     github_org = Column(String(250))
     repo_prefix = Column(String(250))
     install_id = Column(String(250))
+    # Hash of the values written by the sync lambda
+    source_hash = Column(String(64))
 
 
 class Badges(Base):
@@ -78,6 +80,8 @@ class Badges(Base):
     tags = Column(String(250))
     expires = Column(Text)
     extensions = Column(Text)
+    # Hash of the values written by the sync lambda
+    source_hash = Column(String(64))
 
 
 class Assertions(Base):
@@ -121,6 +125,9 @@ class Assertions(Base):
     embed_card_html = Column(Text(10000))
     embed_badge_html = Column(Text(10000))
 
+    # Hash of the values written by the sync lambda
+    source_hash = Column(String(64))
+
     # Assessment tracker info
     assessment_tracker_id = Column(
         Integer,
@@ -130,3 +137,27 @@ class Assertions(Base):
             name="fk_assertions_assessment_tracker",
         ),
     )
+
+
+class BadgrAuth(Base):
+    """
+    SQLAlchemy model for the "badgr_auth" table
+    """
+
+    __tablename__ = "badgr_auth"
+    id = Column(Integer, primary_key=True, unique=True, index=True)
+    bearer_token = Column(String(250))
+    expires_at = Column(DateTime)
+    refresh_token = Column(String(250))
+
+
+class SyncState(Base):
+    """
+    SQLAlchemy model for the "sync_state" table
+    High-water marks of the incremental syncs, by name
+    """
+
+    __tablename__ = "sync_state"
+    name = Column(String(250), primary_key=True)
+    high_water_mark = Column(DateTime)
+    updated_at = Column(DateTime)
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+from config import settings
+from utils import badgr
+
+
+class Page:
+    """
+    Response of a mocked page of assertions
+    """
+
+    def __init__(self, result: list, next_url: str = None):
+        self.result = result
+        self.next_url = next_url
+
+    def json(self):
+        return {
+            "result": self.result,
+            "pagination": {"nextResults": self.next_url},
+        }
+
+
+def make_assertion(entity_id: str, created_at: datetime = None):
+    assertion = {"entityId": entity_id}
+    if created_at is not None:
+        assertion["createdAt"] = created_at.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return assertion
+
+
+def mock_pages(monkeypatch, pages: list) -> list:
+    """
+    Serve the pages (lists of assertions, newest first) from
+    get_assertions_page, and return the list of the URLs requested
+    """
+    requested = []
+
+    def get_assertions_page(bearer_token, config, url=None, num=100):
+        requested.append(url)
+        index = 0 if url is None else int(url)
+        next_url = str(index + 1) if index + 1 < len(pages) else None
+        return Page(pages[index], next_url)
+
+    monkeypatch.setattr(badgr, "get_assertions_page", get_assertions_page)
+    return requested
+
+
+def test_iter_assertions_full(monkeypatch):
+
+    now = datetime(2024, 1, 31)
+    pages = [
+        [make_assertion("A1", now), make_assertion("A2", now)],
+        [make_assertion("A3", now - timedelta(days=30))],
+    ]
+    requested = mock_pages(monkeypatch, pages)
+
+    # All the pages are read without a high water mark
+    assertions = list(badgr.iter_assertions("token", settings))
+    assert [a["entityId"] for a in assertions] == ["A1", "A2", "A3"]
+    assert requested == [None, "1"]
+
+
+def test_iter_assertions_stops_on_old_page(monkeypatch):
+
+    now = datetime(2024, 1, 31)
+    pages = [
+        [make_assertion("A1", now), make_assertion("A2", now)],
+        [
+            make_assertion("A3", now - timedelta(days=2)),
+            make_assertion("A4", now - timedelta(days=10)),
+        ],
+        [make_assertion("A5", now - timedelta(days=20))],
+        [make_assertion("A6", now - timedelta(days=30))],
+    ]
+    requested = mock_pages(monkeypatch, pages)
+
+    # Read from the high water mark, minus the overlap window
+    high_water_mark = now - timedelta(days=1, hours=12)
+    since = high_water_mark - badgr.assertions_sync_overlap
+    assertions = list(badgr.iter_assertions("token", settings, since=since))
+
+    # The assertions of the overlap window are synced again
+    assert [a["entityId"] for a in assertions] == ["A1", "A2", "A3"]
+    # The first page without new assertions stops the paging
+    assert requested == [None, "1", "2"]
+
+
+def test_iter_assertions_without_created_at(monkeypatch):
+
+    now = datetime(2024, 1, 31)
+    pages = [
+        [make_assertion("A1", now)],
+        [make_assertion("A2"), make_assertion("A3", now - timedelta(days=10))],
+        [make_assertion("A4"), make_assertion("A5")],
+        [make_assertion("A6", now)],
+    ]
+    requested = mock_pages(monkeypatch, pages)
+
+    # Assertions without createdAt are synced, but are not new
+    assertions = list(
+        badgr.iter_assertions(
+            "token", settings, since=now - timedelta(days=1)
+        )
+    )
+    assert [a["entityId"] for a in assertions] == ["A1", "A2"]
+    assert requested == [None, "1"]
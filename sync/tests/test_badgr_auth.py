@@ -0,0 +1,167 @@
+import os
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from config import settings
+from models import BadgrAuth
+from utils import badgr_auth
+
+refresh_margin = timedelta(minutes=5)
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://")
+    BadgrAuth.__table__.create(engine)
+    return sessionmaker(bind=engine, autoflush=False)
+
+
+@pytest.fixture
+def requested(monkeypatch):
+    """
+    Mock the Badgr token endpoint, and return the list of the refresh
+    tokens used (None for a password login)
+    """
+    requested = []
+
+    def request_bearer_token(config, refresh_token=None):
+        requested.append(refresh_token)
+        if refresh_token == "revoked":
+            raise Exception("Badgr API provided no access token.")
+        return {
+            "access_token": f"token-{len(requested)}",
+            "refresh_token": f"refresh-{len(requested)}",
+            "expires_in": 3600,
+        }
+
+    monkeypatch.setattr(
+        badgr_auth, "request_bearer_token", request_bearer_token
+    )
+    return requested
+
+
+def store(session_factory, **values):
+    db = session_factory()
+    db.merge(BadgrAuth(id=1, **values))
+    db.commit()
+    db.close()
+
+
+def stored(session_factory) -> BadgrAuth:
+    db = session_factory()
+    auth = db.query(BadgrAuth).filter(BadgrAuth.id == 1).first()
+    db.close()
+    return auth
+
+
+def load(session_factory, persist: bool = True):
+    db = session_factory()
+    try:
+        return badgr_auth.load_bearer_token(
+            db=db,
+            config=settings,
+            refresh_margin=refresh_margin,
+            persist=persist,
+        )
+    finally:
+        db.close()
+
+
+def test_shared_with_crud():
+    # The module is the same in the CRUD app (when both are checked out)
+    here = os.path.dirname(os.path.abspath(__file__))
+    crud_copy = os.path.join(
+        here, "..", "..", "crud", "app", "utils", "badgr_auth.py"
+    )
+    if not os.path.exists(crud_copy):
+        pytest.skip("CRUD app not checked out")
+    with open(crud_copy) as crud_file, open(badgr_auth.__file__) as sync_file:
+        assert crud_file.read() == sync_file.read()
+
+
+def test_first_use(session_factory, requested):
+    token, expires_at = load(session_factory)
+    assert token == "token-1"
+    assert requested == [None]
+    auth = stored(session_factory)
+    assert auth.bearer_token == "token-1"
+    assert auth.refresh_token == "refresh-1"
+    assert auth.expires_at == expires_at
+
+
+def test_valid_token(session_factory, requested):
+    expires_at = datetime.utcnow() + timedelta(hours=1)
+    store(session_factory, bearer_token="current", expires_at=expires_at)
+    assert load(session_factory) == ("current", expires_at)
+    assert requested == []
+
+
+def test_refresh(session_factory, requested):
+    # Expires within the refresh margin
+    store(
+        session_factory,
+        bearer_token="old",
+        refresh_token="refresh-old",
+        expires_at=datetime.utcnow() + timedelta(minutes=1),
+    )
+    assert load(session_factory)[0] == "token-1"
+    assert requested == ["refresh-old"]
+    assert stored(session_factory).refresh_token == "refresh-1"
+
+
+def test_refresh_rejected(session_factory, requested):
+    store(
+        session_factory,
+        bearer_token="old",
+        refresh_token="revoked",
+        expires_at=datetime.utcnow(),
+    )
+    # Falls back to the password
+    assert load(session_factory)[0] == "token-2"
+    assert requested == ["revoked", None]
+    assert stored(session_factory).bearer_token == "token-2"
+
+
+def test_refreshed_concurrently(session_factory, requested, monkeypatch):
+    store(
+        session_factory,
+        bearer_token="old",
+        refresh_token="refresh-old",
+        expires_at=datetime.utcnow(),
+    )
+    winner_expires_at = datetime.utcnow() + timedelta(hours=1)
+    request_bearer_token = badgr_auth.request_bearer_token
+
+    def slow_request(config, refresh_token=None):
+        # Another process stores its token while this one waits for Badgr
+        store(
+            session_factory,
+            bearer_token="winner",
+            refresh_token="refresh-winner",
+            expires_at=winner_expires_at,
+        )
+        return request_bearer_token(config, refresh_token)
+
+    monkeypatch.setattr(badgr_auth, "request_bearer_token", slow_request)
+
+    # The token of the other process is kept and used
+    assert load(session_factory) == ("winner", winner_expires_at)
+    auth = stored(session_factory)
+    assert auth.bearer_token == "winner"
+    assert auth.refresh_token == "refresh-winner"
+
+
+def test_dry_run(session_factory, requested):
+    store(
+        session_factory,
+        bearer_token="old",
+        refresh_token="refresh-old",
+        expires_at=datetime.utcnow(),
+    )
+    # The refresh token is not used and nothing is stored
+    assert load(session_factory, persist=False)[0] == "token-1"
+    assert requested == [None]
+    auth = stored(session_factory)
+    assert auth.bearer_token == "old"
+    assert auth.refresh_token == "refresh-old"
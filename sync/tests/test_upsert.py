@@ -0,0 +1,142 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Assertions, Badges, SyncState
+from utils import upsert
+
+
+@pytest.fixture
+def db_session():
+    # The rows are compared in a local database (dry runs only read)
+    engine = create_engine("sqlite://")
+    for model in [Badges, SyncState]:
+        model.__table__.create(engine)
+    db_session = sessionmaker(bind=engine, autoflush=False)()
+    yield db_session
+    db_session.close()
+
+
+def store(db_session, model, row: dict):
+    """
+    Store a row as bulk_upsert would (with the hash of its values)
+    """
+    table = model.__table__
+    row = {
+        name: upsert.coerce_value(table.c[name], value)
+        for name, value in row.items()
+    }
+    if "source_hash" in table.c:
+        row["source_hash"] = upsert.row_hash(row)
+    db_session.add(model(**row))
+    db_session.commit()
+
+
+def test_coerce_value():
+
+    created_at = Badges.__table__.c.createdAt
+    name = Badges.__table__.c.name
+    revoked = Assertions.__table__.c.revoked
+
+    # DateTime: UTC, without microseconds (as stored)
+    assert upsert.coerce_value(
+        created_at, "2024-01-02T03:04:05.678901Z"
+    ) == datetime(2024, 1, 2, 3, 4, 5)
+    assert upsert.coerce_value(
+        created_at, "2024-01-02T05:04:05+02:00"
+    ) == datetime(2024, 1, 2, 3, 4, 5)
+    assert upsert.coerce_value(created_at, "None") is None
+    assert upsert.coerce_value(created_at, None) is None
+
+    # String: "None" is a value
+    assert upsert.coerce_value(name, "None") == "None"
+    assert upsert.coerce_value(name, 42) == "42"
+
+    # Boolean strings
+    assert upsert.coerce_value(revoked, "True") is True
+    assert upsert.coerce_value(revoked, "False") is False
+    assert upsert.coerce_value(revoked, "None") is None
+    assert upsert.coerce_value(revoked, True) is True
+
+
+def test_bulk_upsert_counts(db_session):
+
+    store(db_session, Badges, {"entityId": "B1", "name": "Badge 1"})
+    store(db_session, Badges, {"entityId": "B2", "name": "Badge 2"})
+
+    rows = [
+        # Unchanged
+        {"entityId": "B1", "name": "Badge 1"},
+        # Updated
+        {"entityId": "B2", "name": "Badge 2 (renamed)"},
+        # Inserted
+        {"entityId": "B3", "name": "Badge 3"},
+    ]
+    counts = upsert.bulk_upsert(
+        db_session, Badges, rows, key="entityId", dry_run=True
+    )
+    assert counts == {"inserted": 1, "updated": 1, "unchanged": 1}
+
+
+def test_bulk_upsert_repeated_keys(db_session):
+
+    store(db_session, Badges, {"entityId": "B1", "name": "Badge 1"})
+
+    # The last row of a repeated key wins
+    rows = [
+        {"entityId": "B1", "name": "Badge 1 (renamed)"},
+        {"entityId": "B1", "name": "Badge 1"},
+        {"entityId": "B2", "name": "Badge 2"},
+        {"entityId": "B2", "name": "Badge 2"},
+    ]
+    counts = upsert.bulk_upsert(
+        db_session, Badges, rows, key="entityId", dry_run=True
+    )
+    assert counts == {"inserted": 1, "updated": 0, "unchanged": 1}
+
+
+def test_bulk_upsert_coerced_values(db_session):
+
+    # Without a source_hash column, the values are compared as stored
+    store(
+        db_session,
+        SyncState,
+        {"name": "assertions", "high_water_mark": datetime(2024, 1, 2)},
+    )
+    store(db_session, SyncState, {"name": "badges", "high_water_mark": None})
+
+    rows = [
+        {"name": "assertions", "high_water_mark": "2024-01-02T00:00:00.5Z"},
+        {"name": "badges", "high_water_mark": "None"},
+    ]
+    counts = upsert.bulk_upsert(
+        db_session, SyncState, rows, key="name", dry_run=True
+    )
+    assert counts == {"inserted": 0, "updated": 0, "unchanged": 2}
+
+    rows = [{"name": "assertions", "high_water_mark": "2024-01-03T00:00:00Z"}]
+    counts = upsert.bulk_upsert(
+        db_session, SyncState, rows, key="name", dry_run=True
+    )
+    assert counts == {"inserted": 0, "updated": 1, "unchanged": 0}
+
+
+def test_bulk_upsert_dry_run_diff(db_session, capsys):
+
+    store(
+        db_session,
+        Badges,
+        {"entityId": "B1", "name": "Badge 1", "description": "First"},
+    )
+
+    rows = [
+        {"entityId": "B1", "name": "Badge 1", "description": "Changed"},
+        {"entityId": "B2", "name": "Badge 2", "description": "Second"},
+    ]
+    upsert.bulk_upsert(db_session, Badges, rows, key="entityId", dry_run=True)
+
+    # The changed columns of the updated rows are listed
+    output = capsys.readouterr().out
+    assert "badges B1 would be updated: description, source_hash" in output
+    assert "badges B2 would be inserted" in output
+    assert db_session.query(Badges).count() == 1
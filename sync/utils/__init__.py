@@ -1,3 +1,4 @@
 from .airtable import *
 from .badgr import *
 from .gh_templates import *
+from .upsert import *
@@ -1,35 +1,46 @@
 # Script for issue badge to a user
 import requests
-from datetime import datetime
+from datetime import datetime, timedelta
 from config import Settings
-from models import Badges, Assertions
+from models import Badges, Assertions, SyncState
 from sqlalchemy.orm import Session
+from .badgr_auth import load_bearer_token
+from .upsert import bulk_upsert, format_counts
 
 
-def badgr_bearer_token(config: Settings):
+# Bearer token kept between the invocations of a warm lambda
+bearer_token_cache = {"token": None, "expires_at": None}
+
+# Tokens are refreshed this long before they expire
+bearer_token_refresh_margin = timedelta(minutes=5)
+
+
+def badgr_bearer_token(
+    config: Settings, db_session: Session, dry_run: bool = False
+):
     """
-    Get the bearer token from the Badgr API.
-    Scope is limited to read-only access for organization-level badges.
-    Includes write access for user-level badges.
+    Get the bearer token for the Badgr API, from memory or the
+    "badgr_auth" table, refreshing it before it expires.
 
     :param config: The configuration dictionary for the Badgr API
+    :param db_session: The database session
+    :param dry_run: Do not store a new token in the database
 
     :return: The bearer token as a string
     """
-    url = config.BADGR_BASE_URL + "/o/token/"
-    payload = {
-        "username": config.BADGR_USERNAME,
-        "password": config.BADGR_PASSWORD,
-        "scope": config.BADGR_SCOPE,
-        "grant_type": config.BADGR_GRANT_TYPE,
-        "client_id": config.BADGR_CLIENT_ID,
-    }
-    response = requests.request("POST", url, data=payload)
-    try:
-        token = response.json()["access_token"]
-        return token
-    except KeyError:  # pragma: no cover
-        raise Exception("Badgr API provided no access token.")
+    cached = bearer_token_cache
+    if (
+        cached["token"] is None
+        or cached["expires_at"] - bearer_token_refresh_margin
+        <= datetime.utcnow()
+    ):
+        cached["token"], cached["expires_at"] = load_bearer_token(
+            db=db_session,
+            config=config,
+            refresh_margin=bearer_token_refresh_margin,
+            persist=not dry_run,
+        )
+    return cached["token"]
 
 
 def get_all_badges(bearer_token: str, config: Settings):
@@ -55,23 +66,29 @@ def get_all_badges(bearer_token: str, config: Settings):
     return response
 
 
-def get_all_assertions(bearer_token: str, config: Settings):
+def get_assertions_page(
+    bearer_token: str, config: Settings, url: str = None, num: int = 100
+):
     """
-    Get the badge assertion from the Badgr API
+    Get a page of the issuer's assertions from the Badgr API (newest first)
 
-    :param assessment_name: The assessment name
-    :param user_email: The user's email
     :param bearer_token: The bearer token (from the Badgr API)
     :param config: The configuration dictionary for the Badgr API
+    :param url: The URL of the page (the "nextResults" cursor of the
+        previous page), or None for the first page
+    :param num: The number of assertions per page
 
-    :return: The assertion as a response object
+    :return: The page as a response object
     """
-    url = (
-        config.BADGR_BASE_URL
-        + "/v2/issuers/"
-        + config.BADGR_ISSUER_ID
-        + "/assertions"
-    )
+    if url is None:
+        url = (
+            config.BADGR_BASE_URL
+            + "/v2/issuers/"
+            + config.BADGR_ISSUER_ID
+            + "/assertions"
+            + "?num="
+            + str(num)
+        )
     headers = {
         "Content-Type": "application/json",
         "Authorization": "Bearer " + bearer_token,
@@ -82,7 +99,57 @@ def get_all_assertions(bearer_token: str, config: Settings):
     return response
 
 
-def wrangle_assertion(assertion: dict, db_session: Session):
+def assertion_created_at(assertion: dict):
+    """
+    Get the createdAt timestamp of an assertion (None if it has none)
+    """
+    if "createdAt" not in assertion:
+        return None
+    return datetime.strptime(assertion["createdAt"], "%Y-%m-%dT%H:%M:%SZ")
+
+
+def iter_assertions(bearer_token: str, config: Settings, since=None):
+    """
+    Iterate over the issuer's assertions created since a given time
+
+    Badgr returns the assertions newest first, so the pages are followed
+    (by their cursor) until a page has no assertion created since `since`.
+    Assertions without a createdAt are yielded, but do not count as new
+    (so they cannot keep the paging going).
+
+    :param bearer_token: The bearer token (from the Badgr API)
+    :param config: The configuration dictionary for the Badgr API
+    :param since: Only yield the assertions created at or after this time
+        (None for all of them)
+
+    :yields: The assertions (dicts)
+    """
+    url = None
+    while True:
+        page = get_assertions_page(bearer_token, config, url=url).json()
+        new = 0
+        for assertion in page["result"]:
+            created_at = assertion_created_at(assertion)
+            if since is None or created_at is None:
+                yield assertion
+            elif created_at >= since:
+                new += 1
+                yield assertion
+        url = (page.get("pagination") or {}).get("nextResults")
+        if not url or (since is not None and new == 0):
+            return
+
+
+def wrangle_assertion(assertion: dict, badges: dict):
+    """
+    Convert an assertion from the Badgr API to the fields of the
+    assertions table (no database access, see get_badge_map)
+
+    :param assertion: The assertion
+    :param badges: The badges by entityId
+
+    :return: The fields
+    """
     # Convert all the fields to strings using dict comprehension -- skipping the boolean fields
     fields = {
         k: str(v)
@@ -117,13 +184,12 @@ def wrangle_assertion(assertion: dict, db_session: Session):
         ca = datetime.strptime(fields["createdAt"], "%Y-%m-%dT%H:%M:%SZ")
     
 
-    # Get the badge name that the assertion is for by querying the badges table
-    badge_name = (
-        db_session.query(Badges)
-        .filter_by(entityId=assertion["badgeclass"])
-        .first()
-        .name
-    )
+    # Get the badge name that the assertion is for
+    if assertion["badgeclass"] not in badges:
+        raise ValueError(
+            "Badge does not exist in database: " + assertion["badgeclass"]
+        )
+    badge_name = badges[assertion["badgeclass"]].name
     orgname = "Bioinformatics Research Network"
 
     # Build linkedin url
@@ -230,91 +296,138 @@ def wrangle_assertion(assertion: dict, db_session: Session):
     return fields
 
 
-# Write a function that syncs the badges table with the badgr API
-def sync_badges(settings: Settings, db_session: Session):
-    # Get all badges from the badgr API
-    bt = badgr_bearer_token(settings)
+def get_badge_rows(bearer_token: str, config: Settings):
+    """
+    Get all badges from the Badgr API as rows of the badges table
+    """
     try:
-        badges = get_all_badges(bt, settings)
+        badges = get_all_badges(bearer_token, config)
         badgelst = badges.json()["result"]
     except Exception as e:
         print(str(e))
         raise e
 
-    # Loop through all badges and add them to the badges table
+    # Convert all the fields to strings using dict comprehension
+    return [{k: str(v) for k, v in badge.items()} for badge in badgelst]
+
+
+# Write a function that syncs the badges table with the badgr API
+def sync_badges(
+    settings: Settings, db_session: Session, dry_run: bool = False
+):
+    # Get all badges from the badgr API
+    bt = badgr_bearer_token(settings, db_session, dry_run=dry_run)
+    rows = get_badge_rows(bt, settings)
+
+    # Add the new badges and update the changed ones
     try:
-        for badge in badgelst:
-            print(badge["name"])
-
-            # Check if the badge already exists in the database
-            current_badge = db_session.query(Badges).filter_by(
-                name=badge["name"]
-            )
-
-            # Convert all the fields to strings using dict comprehension
-            fields = {k: str(v) for k, v in badge.items()}
-
-            if current_badge.first() is None:
-                print("Badge does not exist in database")
-                badge = Badges(**fields)
-                db_session.add(badge)
-                db_session.commit()
-            else:
-                print("Badge already exists -- updating")
-                # Update the badge in the database
-                current_badge.update(values=fields)
-                db_session.commit()
+        counts = bulk_upsert(
+            db_session, Badges, rows, key="entityId", dry_run=dry_run
+        )
+        if dry_run:
+            db_session.rollback()
+        else:
+            db_session.commit()
     except Exception as e:
         print(str(e))
         # Rollback the changes to the database
         db_session.rollback()
         raise e
 
+    print(format_counts("Badges", counts))
+    return counts
 
-def sync_assertions(settings: Settings, db_session: Session):
-    # Get all assertions from the badgr API
-    bt = badgr_bearer_token(settings)
-    try:
-        assertions = get_all_assertions(bt, settings)
-        assertionlst = assertions.json()["result"]
-    except Exception as e:
-        print(str(e))
-        raise e
 
-    # Loop through all assertions and add them to the assertions table
+# Assertions created this long before the high-water mark are synced
+# again, in case Badgr stored them out of order
+assertions_sync_overlap = timedelta(days=1)
+
+
+def get_badge_map(db_session: Session, rows: list = None):
+    """
+    Get all the badges by entityId (loaded once per sync run)
+
+    :param db_session: The database session
+    :param rows: Badge rows not stored yet (dry run), which take
+        precedence over the stored badges
+
+    :return: The badges by entityId
+    """
+    badges = {badge.entityId: badge for badge in db_session.query(Badges)}
+    for row in rows or []:
+        badges[row["entityId"]] = Badges(**row)
+    return badges
+
+
+def get_sync_state(name: str, db_session: Session):
+    """
+    Get the state of an incremental sync (created if missing)
+    """
+    state = db_session.query(SyncState).filter_by(name=name).first()
+    if state is None:
+        state = SyncState(name=name)
+        db_session.add(state)
+    return state
+
+
+def sync_assertions(
+    settings: Settings,
+    db_session: Session,
+    full_sync: bool = False,
+    dry_run: bool = False,
+):
+    """
+    Sync the assertions table with the badgr API
+
+    Only the assertions created since the last sync (the high-water mark
+    in the sync_state table, less `assertions_sync_overlap`) are fetched,
+    unless `full_sync` is set. Changes to older assertions (revocations)
+    are only picked up by a full sync.
+
+    With `dry_run`, the assertions to insert or update are printed and
+    nothing is written. The badges are then fetched again from the badgr
+    API, since the new ones were not stored by `sync_badges`.
+    """
+    bt = badgr_bearer_token(settings, db_session, dry_run=dry_run)
+
+    state = get_sync_state("assertions", db_session)
+    if full_sync or state.high_water_mark is None:
+        since = None
+    else:
+        since = state.high_water_mark - assertions_sync_overlap
+    high_water_mark = state.high_water_mark
+    print("Syncing assertions created since: " + str(since))
+
     try:
-        for assertion in assertionlst:
-
-            # Check if the assertion already exists in the database
-            current_assertion = db_session.query(Assertions).filter_by(
-                entityId=assertion["entityId"]
-            )
-
-            # Wrangle the fields to be compatible with the schema
-            fields = wrangle_assertion(assertion, db_session=db_session)
-
-            if current_assertion.first() is None:
-                assertion = Assertions(**fields)
-                print(
-                    "Not in database - "
-                    + assertion.recipient_plaintextIdentity
-                    + " - "
-                    + assertion.badgeclass
-                )
-                db_session.add(assertion)
-                db_session.commit()
-            else:
-                print(
-                    "Already in database (updating) - "
-                    + fields["recipient_plaintextIdentity"]
-                    + " - "
-                    + fields["badgeclass"]
-                )
-                # Update the assertion in the database
-                current_assertion.update(values=fields)
-                db_session.commit()
+        # Wrangle the new assertions to be compatible with the schema
+        badges = get_badge_map(
+            db_session, rows=get_badge_rows(bt, settings) if dry_run else None
+        )
+        rows = []
+        for assertion in iter_assertions(bt, settings, since=since):
+            created_at = assertion_created_at(assertion)
+            if created_at is not None and (
+                high_water_mark is None or created_at > high_water_mark
+            ):
+                high_water_mark = created_at
+            rows.append(wrangle_assertion(assertion, badges=badges))
+
+        # Add them to the assertions table and move the mark in one
+        # transaction
+        counts = bulk_upsert(
+            db_session, Assertions, rows, key="entityId", dry_run=dry_run
+        )
+        state.high_water_mark = high_water_mark
+        state.updated_at = datetime.utcnow()
+        if dry_run:
+            db_session.rollback()
+        else:
+            db_session.commit()
     except Exception as e:
         print(str(e))
         # Rollback the changes to the database
         db_session.rollback()
         raise e
+
+    print(format_counts("Assertions", counts))
+    return counts
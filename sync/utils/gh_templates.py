@@ -3,6 +3,9 @@ import os
 import urllib
 import boto3
 import mimetypes
+import base64
+import hashlib
+import json
 
 from config import Settings
 from models import Assessments
@@ -84,3 +87,63 @@ def upload_releases_to_aws(settings: Settings):
             # Make sure the file is publically accessible
 
     # s3.put_object_acl(ACL='public-read', Bucket=settings.AWS_BUCKET, Key=key)
+
+
+def git_blob_sha(content: bytes) -> str:
+    # The SHA git (and GitHub) assign to a blob with this content
+    header = f"blob {len(content)}\0".encode("utf-8")
+    return hashlib.sha1(header + content).hexdigest()
+
+
+def build_release_bundle(release_dir: str) -> dict:
+    # Collect every file of the release with its git blob SHA and its
+    # base64 payload, ready to be sent to the GitHub blob API
+    files = []
+    for subdir, dirs, filenames in os.walk(release_dir):
+        for file in filenames:
+            full_path = os.path.join(subdir, file)
+            with open(full_path, "rb") as data:
+                content = data.read()
+            files.append(
+                {
+                    "path": os.path.relpath(full_path, release_dir),
+                    "sha": git_blob_sha(content),
+                    "size": len(content),
+                    "content": base64.b64encode(content).decode("utf-8"),
+                }
+            )
+    files.sort(key=lambda f: f["path"])
+    return {"files": files}
+
+
+def upload_release_bundles_to_aws(settings: Settings):
+    # Configure s3 client
+    s3 = boto3.client(
+        "s3",
+        aws_access_key_id=settings.AWS_ACCESS_KEY,
+        aws_secret_access_key=settings.AWS_SECRET_KEY,
+        region_name=settings.AWS_REGION,
+    )
+
+    # Releases are stored as {appdatadir}/{template_repo}/{latest_release}
+    # Each one is published as a single pre-encoded bundle for the bot
+    path = settings.APPDATA_DIR
+    for template_repo in os.listdir(path):
+        repo_dir = os.path.join(path, template_repo)
+        if not os.path.isdir(repo_dir):
+            continue
+        for latest_release in os.listdir(repo_dir):
+            release_dir = os.path.join(repo_dir, latest_release)
+            if not os.path.isdir(release_dir):
+                continue
+            bundle = build_release_bundle(release_dir)
+            bundle["template_repo"] = template_repo
+            bundle["latest_release"] = latest_release
+            key = f"bundles/{template_repo}/{latest_release}.json"
+            print(key)
+            s3.put_object(
+                Key=key,
+                Body=json.dumps(bundle).encode("utf-8"),
+                ContentType="application/json",
+                Bucket=settings.AWS_BUCKET,
+            )
@@ -0,0 +1,170 @@
+# Bulk upsert of the records synced from the APIs
+import hashlib
+import json
+from datetime import timezone
+from dateutil.parser import isoparse
+from sqlalchemy import Boolean, DateTime, Integer, String
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.orm import Session
+
+
+def chunked(items: list, size: int):
+    """
+    Split a list into lists of at most `size` items
+    """
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def coerce_value(column, value):
+    """
+    Convert a value from an API to the type of its column, as it is read
+    back from the database (so unchanged rows can be detected)
+
+    :param column: The table column
+    :param value: The value
+
+    :return: The converted value
+    """
+    if value is None:
+        return None
+    if isinstance(column.type, String):
+        return value if isinstance(value, str) else str(value)
+    if value == "None":
+        return None
+    if isinstance(column.type, DateTime) and isinstance(value, str):
+        value = isoparse(value)
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        # DATETIME columns are stored to the second
+        return value.replace(microsecond=0)
+    if isinstance(column.type, Boolean) and isinstance(value, str):
+        return value == "True"
+    if isinstance(column.type, Integer) and isinstance(value, str):
+        return int(value)
+    return value
+
+
+def row_hash(row: dict) -> str:
+    """
+    Stable hash of the values of a row (independent of the key order)
+    """
+    payload = json.dumps(row, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def bulk_upsert(
+    db_session: Session,
+    model,
+    rows: list,
+    key: str,
+    chunk_size: int = 500,
+    dry_run: bool = False,
+):
+    """
+    Insert the new rows of a table and update the changed ones
+
+    The existing rows are fetched by key (in chunks of `chunk_size` keys)
+    and compared with the new values, then the new and changed rows are
+    written with batched INSERT ... ON DUPLICATE KEY UPDATE statements.
+    Columns missing from a row are left unchanged. Nothing is committed,
+    so the caller can apply a whole table in one transaction.
+
+    If the table has a `source_hash` column, it stores the hash of the
+    synced values, and only the hashes are fetched and compared (in a dry
+    run, the values are also fetched to print the changed columns).
+
+    :param db_session: The database session
+    :param model: The SQLAlchemy model of the table
+    :param rows: The rows (dicts of column name to value)
+    :param key: The name of the key column
+    :param chunk_size: The number of rows per statement
+    :param dry_run: Print the rows to insert and the changed columns of
+        the rows to update instead of writing them
+
+    :return: The number of rows inserted, updated and unchanged
+    """
+    table = model.__table__
+    hashed = "source_hash" in table.c
+
+    # The last row wins if a key is repeated
+    new_rows = {}
+    for row in rows:
+        row = {
+            name: coerce_value(table.c[name], value)
+            for name, value in row.items()
+        }
+        if hashed:
+            row["source_hash"] = row_hash(row)
+        new_rows[row[key]] = row
+
+    # Fetch the current hashes (or values of the synced columns)
+    if hashed and not dry_run:
+        names = [key, "source_hash"]
+    else:
+        names = sorted({name for row in new_rows.values() for name in row})
+    compared = ["source_hash"] if hashed else names
+    existing = {}
+    for keys in chunked(list(new_rows), chunk_size):
+        query = db_session.query(*[table.c[name] for name in names]).filter(
+            table.c[key].in_(keys)
+        )
+        for record in query:
+            existing[getattr(record, key)] = record._asdict()
+
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    changed = {}
+    for row_key, row in new_rows.items():
+        current = existing.get(row_key)
+        if current is None:
+            action = "inserted"
+        elif any(
+            current[name] != row[name] for name in compared if name in row
+        ):
+            action = "updated"
+        else:
+            counts["unchanged"] += 1
+            continue
+        counts[action] += 1
+        if dry_run:
+            if action == "updated":
+                columns = [
+                    name
+                    for name in names
+                    if name in row and current[name] != row[name]
+                ]
+                print(
+                    f"Dry run: {table.name} {row_key} would be updated: "
+                    + ", ".join(columns)
+                )
+            else:
+                print(f"Dry run: {table.name} {row_key} would be inserted")
+            continue
+        # Rows with the same columns can share a statement
+        changed.setdefault(tuple(sorted(row)), []).append(row)
+
+    for columns, group in changed.items():
+        for chunk in chunked(group, chunk_size):
+            stmt = insert(table).values(chunk)
+            stmt = stmt.on_duplicate_key_update(
+                {
+                    name: stmt.inserted[name]
+                    for name in columns
+                    if name != key
+                }
+                or {key: stmt.inserted[key]}
+            )
+            db_session.execute(stmt)
+
+    return counts
+
+
+def format_counts(name: str, counts: dict) -> str:
+    """
+    Format the result of a bulk upsert for the logs
+    """
+    return (
+        f"{name}: {counts['inserted']} inserted, "
+        + f"{counts['updated']} updated, "
+        + f"{counts['unchanged']} unchanged"
+    )
@@ -7,6 +7,7 @@ from sqlalchemy import (
     Boolean,
     Column,
     ForeignKey,
+    Index,
     Table,
     Text,
 )
@@ -91,6 +92,14 @@ class Reviewers(Base):
     """
 
     __tablename__ = "reviewers"
+    __table_args__ = (
+        Index(
+            "ix_reviewers_pool",
+            "assessment_reviewing_id",
+            "open_reviews",
+            "id",
+        ),
+    )
 
     id = Column(Integer, primary_key=True, unique=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", name="fk_reviewers_users"))
@@ -100,6 +109,8 @@ class Reviewers(Base):
             "assessments.id", use_alter=True, name="fk_reviewers_assessments"
         ),
     )
+    # Entries currently under review by the reviewer
+    open_reviews = Column(Integer, nullable=False, default=0)
 
 
 # Create a mapping between the Assessment and Reviewer tables
@@ -133,6 +144,8 @@ class Assessments(Base):
     github_org = Column(String(250))
     repo_prefix = Column(String(250))
     install_id = Column(String(250))
+    # Hash of the values written by the sync lambda
+    source_hash = Column(String(64))
 
 
 class AssessmentTracker(Base):
@@ -141,6 +154,10 @@ class AssessmentTracker(Base):
     """
 
     __tablename__ = "assessment_tracker"
+    __table_args__ = (
+        Index("ix_assessment_tracker_repo", "repo_owner", "repo_name"),
+        Index("ix_assessment_tracker_status", "status"),
+    )
 
     id = Column(Integer, primary_key=True, unique=True, index=True)
     user_id = Column(
@@ -171,7 +188,47 @@ class AssessmentTracker(Base):
     repo_owner = Column(String(250))
     repo_name = Column(String(250))
     pr_number = Column(Integer)
-    log = Column(JSON, nullable=False)
+    # Result of the last automated checks
+    last_check_commit = Column(String(250))
+    last_check_passed = Column(Boolean)
+    last_check_at = Column(DateTime)
+    # Incremented by every update, which only applies if the row still has
+    # the version it was read with (optimistic concurrency control)
+    version_id = Column(Integer, nullable=False, default=1)
+    __mapper_args__ = {"version_id_col": version_id}
+    # Legacy log (superseded by the assessment_events table)
+    log = Column(JSON, nullable=False, default=list)
+
+
+class AssessmentEvents(Base):
+    """
+    SQLAlchemy model for the "assessment_events" table
+    """
+
+    __tablename__ = "assessment_events"
+    __table_args__ = (
+        Index(
+            "ix_assessment_events_tracker_commit",
+            "tracker_id",
+            "commit",
+            "created_at",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, unique=True, index=True)
+    tracker_id = Column(
+        Integer,
+        ForeignKey(
+            "assessment_tracker.id",
+            ondelete="CASCADE",
+            name="fk_assessment_events_assessment_tracker",
+        ),
+        nullable=False,
+    )
+    commit = Column(String(250))
+    status = Column(String(250))
+    created_at = Column(DateTime, nullable=False)
+    data = Column(JSON, nullable=False)
 
 
 class Badges(Base):
@@ -201,6 +258,8 @@ class Badges(Base):
     tags = Column(String(250))
     expires = Column(Text)
     extensions = Column(Text)
+    # Hash of the values written by the sync lambda
+    source_hash = Column(String(64))
 
 
 class Assertions(Base):
@@ -244,6 +303,9 @@ class Assertions(Base):
     embed_card_html = Column(Text(10000))
     embed_badge_html = Column(Text(10000))
 
+    # Hash of the values written by the sync lambda
+    source_hash = Column(String(64))
+
     # Assessment tracker info
     assessment_tracker_id = Column(
         Integer,
@@ -255,6 +317,40 @@ class Assertions(Base):
     )
 
 
+class BadgeIssuanceJobs(Base):
+    """
+    SQLAlchemy model for the "badge_issuance_jobs" table
+
+    Outbox of the badges to issue for approved assessments, processed in
+    the background by the CRUD app
+    """
+
+    __tablename__ = "badge_issuance_jobs"
+    __table_args__ = (
+        Index("ix_badge_issuance_jobs_due", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, unique=True, index=True)
+    tracker_id = Column(
+        Integer,
+        ForeignKey(
+            "assessment_tracker.id",
+            ondelete="CASCADE",
+            name="fk_badge_issuance_jobs_assessment_tracker",
+        ),
+        nullable=False,
+    )
+    # "pending", "running", "done" or "failed"
+    status = Column(String(250), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    last_error = Column(Text)
+    # The issued assertion, once done
+    assertion_id = Column(String(250))
+
+
 class BadgrAuth(Base):
     """
     SQLAlchemy model for the "badgr_auth" table
@@ -264,3 +360,16 @@ class BadgrAuth(Base):
     id = Column(Integer, primary_key=True, unique=True, index=True)
     bearer_token = Column(String(250))
     expires_at = Column(DateTime)
+    refresh_token = Column(String(250))
+
+
+class SyncState(Base):
+    """
+    SQLAlchemy model for the "sync_state" table
+    High-water marks of the incremental syncs, by name
+    """
+
+    __tablename__ = "sync_state"
+    name = Column(String(250), primary_key=True)
+    high_water_mark = Column(DateTime)
+    updated_at = Column(DateTime)